@@ -15,7 +15,6 @@ import plotly.express as px
 import plotly.graph_objects as go
 import folium
 from streamlit_folium import st_folium
-import requests
 import tempfile
 import os
 from io import BytesIO
@@ -24,6 +23,9 @@ import time
 import re
 import matplotlib.pyplot as plt
 
+import senasa_client
+from senasa_client import validate_cuit, normalizar_cuit
+
 # Intentar importar Earth Engine
 try:
     import ee
@@ -127,171 +129,19 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# =====================================================================
-# FUNCIONES PARA VALIDACIÓN Y PROCESAMIENTO
-# =====================================================================
-
-def validate_cuit(cuit):
-    """Validar formato de CUIT argentino - ACEPTA MÚLTIPLES FORMATOS"""
-    if not cuit:
-        return False
-    
-    # Limpiar el CUIT: quitar espacios, guiones y caracteres especiales
-    cuit_limpio = cuit.replace('-', '').replace(' ', '').replace('.', '').strip()
-    
-    # Verificar que tenga exactamente 11 dígitos
-    if len(cuit_limpio) != 11:
-        return False
-    
-    # Verificar que sean solo números
-    if not cuit_limpio.isdigit():
-        return False
-    
-    return True
-
-def normalizar_cuit(cuit):
-    """Normaliza un CUIT a formato XX-XXXXXXXX-X desde cualquier formato"""
-    # Limpiar el CUIT: quitar espacios, guiones y caracteres especiales
-    cuit_limpio = cuit.replace("-", "").replace(" ", "").replace(".", "").strip()
-    
-    if len(cuit_limpio) != 11:
-        raise ValueError(f"CUIT inválido: {cuit}. Debe tener 11 dígitos.")
-    
-    return f"{cuit_limpio[:2]}-{cuit_limpio[2:10]}-{cuit_limpio[10]}"
-
 # =====================================================================
 # FUNCIONES PARA CONSULTA POR CUIT - API REAL
 # =====================================================================
 
-# Configuraciones para API
-API_BASE_URL = "https://aps.senasa.gob.ar/restapiprod/servicios/renspa"
-TIEMPO_ESPERA = 0.5
-
-def obtener_datos_por_cuit(cuit):
-    """Obtiene todos los campos asociados a un CUIT usando API REAL"""
-    try:
-        url_base = f"{API_BASE_URL}/consultaPorCuit"
-        
-        todos_campos = []
-        offset = 0
-        limit = 10
-        has_more = True
-        
-        while has_more:
-            url = f"{url_base}?cuit={cuit}&offset={offset}"
-            
-            try:
-                response = requests.get(url, timeout=15)
-                response.raise_for_status()
-                resultado = response.json()
-                
-                if 'items' in resultado and resultado['items']:
-                    todos_campos.extend(resultado['items'])
-                    has_more = resultado.get('hasMore', False)
-                    offset += limit
-                else:
-                    has_more = False
-            
-            except Exception as e:
-                has_more = False
-                
-            time.sleep(TIEMPO_ESPERA)
-        
-        return todos_campos
-    
-    except Exception as e:
-        return []
-
-def consultar_campo_detalle(renspa):
-    """Consulta los detalles de un campo específico para obtener el polígono"""
-    try:
-        url = f"{API_BASE_URL}/consultaPorNumero?numero={renspa}"
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return data
-    except Exception as e:
-        return None
-
-def extraer_coordenadas_senasa(poligono_str):
-    """Extrae coordenadas de un string de polígono"""
-    if not poligono_str or not isinstance(poligono_str, str):
-        return None
-    
-    coord_pattern = r'\(([-\d\.]+),([-\d\.]+)\)'
-    coord_pairs = re.findall(coord_pattern, poligono_str)
-    
-    if not coord_pairs:
-        return None
-    
-    coords_geojson = []
-    for lat_str, lon_str in coord_pairs:
-        try:
-            lat = float(lat_str)
-            lon = float(lon_str)
-            coords_geojson.append([lon, lat])
-        except ValueError:
-            continue
-    
-    if len(coords_geojson) >= 3:
-        if coords_geojson[0] != coords_geojson[-1]:
-            coords_geojson.append(coords_geojson[0])
-        
-        return coords_geojson
-    
-    return None
-
 def procesar_campos_cuit(cuit, solo_activos=True):
-    """Procesa campos de un CUIT y extrae polígonos REALES para análisis"""
+    """Procesa campos de un CUIT y extrae polígonos REALES para análisis (consultas en senasa_client)"""
     try:
-        cuit_normalizado = normalizar_cuit(cuit)
-        campos = obtener_datos_por_cuit(cuit_normalizado)
-        
-        if not campos:
-            return []
-        
-        # Filtrar según la opción seleccionada
-        if solo_activos:
-            campos_a_procesar = [c for c in campos if c.get('fecha_baja') is None]
-        else:
-            campos_a_procesar = campos
-        
-        # Procesar polígonos
-        poligonos_data = []
-        
-        for i, campo in enumerate(campos_a_procesar):
-            renspa = campo['renspa']
-            
-            # Primero intentar con los datos que ya tenemos
-            coords = None
-            if 'poligono' in campo and campo['poligono']:
-                coords = extraer_coordenadas_senasa(campo['poligono'])
-            
-            # Si no tenemos polígono, consultar detalle
-            if not coords:
-                resultado_detalle = consultar_campo_detalle(renspa)
-                if resultado_detalle and 'items' in resultado_detalle and resultado_detalle['items']:
-                    item_detalle = resultado_detalle['items'][0]
-                    if 'poligono' in item_detalle and item_detalle['poligono']:
-                        coords = extraer_coordenadas_senasa(item_detalle['poligono'])
-                
-                time.sleep(TIEMPO_ESPERA)
-            
-            if coords:
-                poligono_data = {
-                    'nombre': f"Campo_{i+1}_{campo.get('titular', 'Sin_titular')}",
-                    'coords': coords,
-                    'numero': i + 1,
-                    'archivo_origen': f'CUIT_{cuit_normalizado}',
-                    'kml_origen': f'Campo_{renspa}',
-                    'titular': campo.get('titular', ''),
-                    'localidad': campo.get('localidad', ''),
-                    'superficie': campo.get('superficie', 0),
-                    'renspa': renspa
-                }
-                poligonos_data.append(poligono_data)
-        
+        poligonos_data, completo = senasa_client.procesar_campos_cuit(normalizar_cuit(cuit), solo_activos)
+        if not completo:
+            st.warning(
+                "⚠️ **Resultado parcial**: SENASA no respondió a todas las consultas y pueden faltar "
+                "campos o polígonos. Volvé a consultar el CUIT en unos minutos para completarlo."
+            )
         return poligonos_data
     
     except Exception as e:
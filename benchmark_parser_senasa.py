@@ -0,0 +1,136 @@
+# ===================================================================
+# BENCHMARK - PARSER DE POLÍGONOS DE SENASA
+# Compara el parser vectorizado con la versión original vértice por vértice
+# ===================================================================
+#
+# Uso:
+#   python benchmark_parser_senasa.py [--poligonos 2000] [--vertices 5 50 500]
+#
+# No consulta a SENASA: genera polígonos sintéticos con el formato "(lat,lon)(lat,lon)…"
+# y verifica que todos los parsers devuelvan exactamente las mismas coordenadas.
+#
+# 'array' y 'lote' miden el parseo a arrays de NumPy; 'lote + listas' suma la conversión a
+# listas que hace campos_cuit al guardar cada registro (el camino de producción).
+# Con polígonos de pocos vértices (~5) el parser original sigue siendo más rápido: la ventaja
+# de NumPy aparece desde unas decenas de vértices, el tamaño habitual de un campo digitalizado.
+
+import argparse
+import random
+import re
+import time
+
+from senasa_client import coordenadas_senasa_array, coordenadas_senasa_lote, extraer_coordenadas_senasa
+
+def extraer_coordenadas_senasa_original(poligono_str):
+    """Versión original: re.findall y un float() por coordenada"""
+    if not poligono_str or not isinstance(poligono_str, str):
+        return None
+
+    coord_pattern = r'\(([-\d\.]+),([-\d\.]+)\)'
+    coord_pairs = re.findall(coord_pattern, poligono_str)
+
+    if not coord_pairs:
+        return None
+
+    coords_geojson = []
+    for lat_str, lon_str in coord_pairs:
+        try:
+            lat = float(lat_str)
+            lon = float(lon_str)
+            coords_geojson.append([lon, lat])
+        except ValueError:
+            continue
+
+    if len(coords_geojson) >= 3:
+        if coords_geojson[0] != coords_geojson[-1]:
+            coords_geojson.append(coords_geojson[0])
+
+        return coords_geojson
+
+    return None
+
+# Strings fuera del formato estándar: los parsers deben coincidir también acá
+CASOS_BORDE = [
+    None, '', 'sin polígono', '(-34.1,-60.1)(-34.2,-60.2)',
+    '(-34.1,-60.1)(-34.2,-60.2)(-34.3,-60.1)(-34.1,-60.1)',
+    'POLYGON((-34.1,-60.1)(-34.2,-60.2)(-34.3,-60.1))',
+    '(-34.1,-60.1) (-34.2,-60.2) (-34.3,-60.1)',
+    '(-34.1,-60.1)(1.2.3,-60.2)(-34.3,-60.1)(-34.4,-60.3)',
+    '(-34.1,-60.1)(-,-60.2)(-34.3,-60.1)(-34.4,-60.3)',
+    '(-34.1,-60.1)(-34.2,-60.2,5)(-34.3,-60.1)(-34.4,-60.3)',
+    '(-34,-60)(-35,-60)(-35,-61)',
+]
+
+def generar_poligono(n_vertices):
+    """Polígono sintético con el formato de SENASA (8 decimales, sin cerrar)"""
+    lat, lon = random.uniform(-38, -27), random.uniform(-65, -57)
+    return ''.join(
+        f"({lat + random.uniform(-0.05, 0.05):.8f},{lon + random.uniform(-0.05, 0.05):.8f})"
+        for _ in range(n_vertices)
+    )
+
+def extraer_lote(poligonos):
+    """Parser por lote con la misma salida que extraer_coordenadas_senasa (listas)"""
+    return [coords.tolist() if coords is not None else None for coords in coordenadas_senasa_lote(poligonos)]
+
+def a_listas(resultados):
+    """Arrays de NumPy (o None) a listas [[lon, lat], ...], para comparar con el original"""
+    return [coords.tolist() if coords is not None else None for coords in resultados]
+
+def medir(parser_lote, poligonos, repeticiones):
+    """Mejor tiempo total (s) de `repeticiones` pasadas de un parser de lista de polígonos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        parser_lote(poligonos)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+def por_poligono(parser):
+    """Adapta un parser de un string a una lista de polígonos"""
+    return lambda poligonos: [parser(poligono) for poligono in poligonos]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el parser vectorizado de polígonos SENASA con el original")
+    parser.add_argument('--poligonos', type=int, default=2000, help="Polígonos por tamaño (default: 2000)")
+    parser.add_argument('--vertices', type=int, nargs='+', default=[5, 50, 500], help="Vértices por polígono")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Pasadas por parser (se toma la mejor)")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+
+    esperado = [extraer_coordenadas_senasa_original(caso) for caso in CASOS_BORDE]
+    assert [extraer_coordenadas_senasa(caso) for caso in CASOS_BORDE] == esperado
+    assert extraer_lote(CASOS_BORDE) == esperado
+    print(f"✅ {len(CASOS_BORDE)} casos borde idénticos")
+
+    parsers = {
+        'original': por_poligono(extraer_coordenadas_senasa_original),
+        'array': por_poligono(coordenadas_senasa_array),
+        'lote': coordenadas_senasa_lote,
+        'lote + listas': extraer_lote
+    }
+    # Los que devuelven arrays se comparan pasados a listas (fuera de la medición)
+    devuelven_arrays = {'array', 'lote'}
+
+    print(f"\n⏱️ µs por polígono ({args.poligonos} polígonos por tamaño, mejor de {args.repeticiones} pasadas)")
+    print(f"  {'vértices':>8}" + "".join(f"  {nombre:>13}" for nombre in parsers) + "  aceleración vs original")
+    for n_vertices in args.vertices:
+        poligonos = [generar_poligono(n_vertices) for _ in range(args.poligonos)]
+        esperado = parsers['original'](poligonos)
+        for nombre, parser in parsers.items():
+            resultado = parser(poligonos)
+            assert (a_listas(resultado) if nombre in devuelven_arrays else resultado) == esperado, nombre
+
+        tiempos = {
+            nombre: medir(parser, poligonos, args.repeticiones) / args.poligonos * 1e6
+            for nombre, parser in parsers.items()
+        }
+        aceleraciones = " / ".join(
+            f"{tiempos['original'] / tiempo:.2f}x" for nombre, tiempo in tiempos.items() if nombre != 'original'
+        )
+        print(f"  {n_vertices:>8}" + "".join(f"  {t:>13.1f}" for t in tiempos.values()) + f"  {aceleraciones}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# ===================================================================
+# BENCHMARK - PROYECCIÓN FORZADA vs PROYECCIÓN EN LA REDUCCIÓN
+# Compara áreas por cultivo y latencia de ambos caminos de cálculo
+# ===================================================================
+#
+# Uso:
+#   python benchmark_proyeccion.py campos.kmz [otro.kmz ...] [--repeticiones 3]
+#
+# Requiere credenciales de Earth Engine (GOOGLE_APPLICATION_CREDENTIALS o
+# .streamlit/secrets.toml), igual que la aplicación.
+
+import argparse
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+from codigo_original import (
+    CAMPANAS_CULTIVOS,
+    CULTIVOS_POR_CAMPANA,
+    calcular_areas_todas_campanas,
+    crear_area_pixeles,
+    crear_capa_combinada,
+    crear_ee_feature_collection_web,
+    crs_reduccion,
+    init_earth_engine,
+    procesar_kmz_uploaded,
+)
+
+PROYECCIONES = ['forzada', 'reduccion']
+
+def medir_proyeccion(aoi, proyeccion, campanas):
+    """Corre la reducción multibanda con una proyección. Devuelve (segundos, {campaña: {clase: m²}})"""
+    geometry = aoi.geometry()
+    inicio = time.perf_counter()
+
+    capas = {campana: crear_capa_combinada(campana, geometry, proyeccion) for campana in campanas}
+    areas = calcular_areas_todas_campanas(
+        capas, geometry, crear_area_pixeles(proyeccion), crs=crs_reduccion(proyeccion)
+    )
+
+    return time.perf_counter() - inicio, areas
+
+def comparar_areas(areas_por_proyeccion, campanas):
+    """Tabla por campaña y cultivo con el área (ha) de cada camino y su diferencia relativa"""
+    filas = []
+
+    for campana in campanas:
+        for cultivo_id, nombre_cultivo in CULTIVOS_POR_CAMPANA[campana].items():
+            forzada = areas_por_proyeccion['forzada'].get(campana, {}).get(cultivo_id, 0) / 10000
+            reduccion = areas_por_proyeccion['reduccion'].get(campana, {}).get(cultivo_id, 0) / 10000
+            if not forzada and not reduccion:
+                continue
+
+            filas.append({
+                'Campaña': campana,
+                'Cultivo': nombre_cultivo,
+                'Forzada (ha)': round(forzada, 2),
+                'Reducción (ha)': round(reduccion, 2),
+                'Diferencia (%)': round((reduccion - forzada) / forzada * 100, 3) if forzada else None
+            })
+
+    return pd.DataFrame(filas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara la proyección forzada con la proyección en la reducción")
+    parser.add_argument('kmz', nargs='+', help="Archivos KMZ con los campos a analizar")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Corridas por proyección (default: 3)")
+    parser.add_argument('--campanas', nargs='*', default=CAMPANAS_CULTIVOS, help="Campañas a comparar")
+    args = parser.parse_args()
+
+    if not init_earth_engine():
+        sys.exit("No se pudo conectar con Google Earth Engine")
+
+    poligonos = []
+    for ruta in args.kmz:
+        with open(ruta, 'rb') as archivo:
+            poligonos.extend(procesar_kmz_uploaded(archivo))
+
+    if not poligonos:
+        sys.exit("Los KMZ no contienen polígonos válidos")
+
+    aoi = crear_ee_feature_collection_web(poligonos)
+    print(f"📐 {len(poligonos)} polígonos - campañas {', '.join(args.campanas)}")
+
+    tiempos = {proyeccion: [] for proyeccion in PROYECCIONES}
+    areas_por_proyeccion = {}
+
+    # Se alternan los caminos para que ninguno se beneficie del caché caliente de EE
+    for _ in range(args.repeticiones):
+        for proyeccion in PROYECCIONES:
+            segundos, areas = medir_proyeccion(aoi, proyeccion, args.campanas)
+            tiempos[proyeccion].append(segundos)
+            areas_por_proyeccion[proyeccion] = areas
+
+    print("\n⏱️ Latencia (s)")
+    for proyeccion in PROYECCIONES:
+        muestras = tiempos[proyeccion]
+        print(f"  {proyeccion:<10} mediana {statistics.median(muestras):7.2f}   "
+              f"mín {min(muestras):7.2f}   máx {max(muestras):7.2f}")
+
+    df_comparacion = comparar_areas(areas_por_proyeccion, args.campanas)
+    print("\n🌾 Áreas por cultivo")
+    print(df_comparacion.to_string(index=False))
+
+    for proyeccion in PROYECCIONES:
+        total = sum(sum(areas.values()) for areas in areas_por_proyeccion[proyeccion].values()) / 10000
+        print(f"\n📊 Área total clasificada ({proyeccion}): {total:,.2f} ha")
+
+    if not df_comparacion.empty:
+        diferencia_max = df_comparacion['Diferencia (%)'].abs().max()
+        print(f"📏 Diferencia máxima por cultivo: {diferencia_max:.3f} %")
+
+if __name__ == "__main__":
+    main()
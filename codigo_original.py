@@ -21,10 +21,22 @@ from datetime import datetime
 import folium
 from streamlit_folium import st_folium
 import re
-import requests
 import zipfile
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import closing
 from io import BytesIO
 
+import senasa_client
+from senasa_client import normalizar_cuit
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
 # Configuración de la página
 st.set_page_config(
     page_title="Análisis de Rotación de Cultivos",
@@ -427,7 +439,8 @@ def crear_ee_feature_collection_web(poligonos_data):
         properties = {
             'nombre': pol.get('nombre', f'Poligono_{i+1}'),
             'numero': pol.get('numero', i+1),
-            'archivo': pol.get('archivo_origen', 'desconocido')
+            'archivo': pol.get('archivo_origen', 'desconocido'),
+            'renspa': pol.get('renspa', '')
         }
         
         try:
@@ -442,230 +455,1008 @@ def crear_ee_feature_collection_web(poligonos_data):
     if features:
         collection = ee.FeatureCollection(features)
         return collection
+
+    return None
+
+# =====================================================================
+# ÁREA GEODÉSICA LOCAL (sin round trips a Earth Engine)
+# =====================================================================
+
+# Elipsoide WGS84 y su esfera autálica (misma superficie total): las latitudes se llevan
+# a latitud autálica y el área se calcula sobre esa esfera, sin pasar por Earth Engine
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+WGS84_E = np.sqrt(WGS84_E2)
+
+def _q_autalica(sen_lat):
+    """Función q(φ) de la latitud autálica para el elipsoide WGS84"""
+    e_sen = WGS84_E * sen_lat
+    return (1 - WGS84_E2) * (
+        sen_lat / (1 - e_sen ** 2) - np.log((1 - e_sen) / (1 + e_sen)) / (2 * WGS84_E)
+    )
+
+WGS84_QP = float(_q_autalica(1.0))
+RADIO_AUTALICO = WGS84_A * np.sqrt(WGS84_QP / 2)
+
+def area_geodesica_anillo(anillo):
+    """
+    Área en m² de un anillo [[lon, lat], ...] (cerrado o no) sobre el elipsoide WGS84.
+    Vectorizada con NumPy; devuelve el valor absoluto, sin importar la orientación.
+    """
+    puntos = np.asarray(anillo, dtype=float)
+    if puntos.ndim != 2 or len(puntos) < 3:
+        return 0.0
+    if np.array_equal(puntos[0, :2], puntos[-1, :2]):
+        puntos = puntos[:-1]
+    if len(puntos) < 3:
+        return 0.0
+
+    lon = np.radians(puntos[:, 0])
+    sen_beta = _q_autalica(np.sin(np.radians(puntos[:, 1]))) / WGS84_QP
+
+    # Fórmula de exceso esférico por trapecios (Chamberlain & Duquette)
+    suma = np.sum((np.roll(lon, -1) - np.roll(lon, 1)) * sen_beta)
+    return float(abs(suma) * RADIO_AUTALICO ** 2 / 2)
+
+def area_geodesica_m2(coords):
+    """
+    Área en m² de un anillo, un polígono [exterior, agujeros...] o un multipolígono
+    [[exterior, agujeros...], ...], según el anidamiento de las coordenadas.
+    """
+    if not coords:
+        return 0.0
+
+    profundidad = 0
+    nodo = coords
+    while isinstance(nodo, (list, tuple)) and nodo:
+        profundidad += 1
+        nodo = nodo[0]
+
+    if profundidad == 2:
+        return area_geodesica_anillo(coords)
+    if profundidad == 3:
+        exterior, agujeros = coords[0], coords[1:]
+        return max(area_geodesica_anillo(exterior) - sum(area_geodesica_anillo(a) for a in agujeros), 0.0)
+    if profundidad == 4:
+        return sum(area_geodesica_m2(poligono) for poligono in coords)
+
+    return 0.0
+
+def anillos_exteriores(coords):
+    """Anillos exteriores de un anillo, polígono o multipolígono (mismo anidamiento que area_geodesica_m2)"""
+    profundidad = 0
+    nodo = coords
+    while isinstance(nodo, (list, tuple)) and nodo:
+        profundidad += 1
+        nodo = nodo[0]
+
+    if profundidad == 2:
+        anillos = [coords]
+    elif profundidad == 3:
+        anillos = [coords[0]]
+    elif profundidad == 4:
+        anillos = [poligono[0] for poligono in coords if poligono]
+    else:
+        anillos = []
+
+    resultado = []
+    for anillo in anillos:
+        puntos = np.asarray(anillo, dtype=float)
+        if puntos.ndim == 2 and len(puntos) >= 3:
+            puntos = puntos[:, :2]
+            if not np.array_equal(puntos[0], puntos[-1]):
+                puntos = np.vstack([puntos, puntos[:1]])
+            resultado.append(puntos)
+    return resultado
+
+# Tolerancia en grados (~0,1 mm): bordes compartidos entre campos vecinos no cuentan como superposición
+TOLERANCIA_SUPERPOSICION = 1e-9
+
+def _puntos_dentro_estricto(puntos, anillo):
+    """Máscara de los puntos que caen dentro del anillo y a más de la tolerancia de su borde"""
+    x, y = puntos[:, :1], puntos[:, 1:]
+    x1, y1 = anillo[:-1, 0], anillo[:-1, 1]
+    x2, y2 = anillo[1:, 0], anillo[1:, 1]
+
+    # Ray casting vectorizado: puntos × lados
+    cruza = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_corte = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    dentro = np.count_nonzero(cruza & (x < x_corte), axis=1) % 2 == 1
+
+    # Distancia de cada punto a cada lado
+    dx, dy = x2 - x1, y2 - y1
+    largo2 = np.where(dx ** 2 + dy ** 2 > 0, dx ** 2 + dy ** 2, 1)
+    t = np.clip(((x - x1) * dx + (y - y1) * dy) / largo2, 0, 1)
+    distancia = np.hypot(x - (x1 + t * dx), y - (y1 + t * dy)).min(axis=1)
+
+    return dentro & (distancia > TOLERANCIA_SUPERPOSICION)
+
+def _lados_se_cruzan(a, b):
+    """True si algún lado de `a` cruza propiamente (no solo toca) algún lado de `b`"""
+    p1, p2 = a[:-1, None, :], a[1:, None, :]
+    q1, q2 = b[None, :-1, :], b[None, 1:, :]
+
+    def orientacion(o, u, v):
+        return (u[..., 0] - o[..., 0]) * (v[..., 1] - o[..., 1]) - (u[..., 1] - o[..., 1]) * (v[..., 0] - o[..., 0])
+
+    eps = TOLERANCIA_SUPERPOSICION ** 2
+    d1, d2 = orientacion(q1, q2, p1), orientacion(q1, q2, p2)
+    d3, d4 = orientacion(p1, p2, q1), orientacion(p1, p2, q2)
+    opuestos = lambda u, v: ((u > eps) & (v < -eps)) | ((u < -eps) & (v > eps))
+    return bool(np.any(opuestos(d1, d2) & opuestos(d3, d4)))
+
+def _puntos_de_prueba(anillo):
+    """Vértices, puntos medios de los lados y centroide (si cae dentro) de un anillo cerrado"""
+    puntos = [anillo[:-1], (anillo[:-1] + anillo[1:]) / 2]
+    x, y = anillo[:, 0], anillo[:, 1]
+    cruz = x[:-1] * y[1:] - x[1:] * y[:-1]
+    if abs(cruz.sum()) > 0:
+        centroide = np.array([[
+            ((x[:-1] + x[1:]) * cruz).sum() / (3 * cruz.sum()),
+            ((y[:-1] + y[1:]) * cruz).sum() / (3 * cruz.sum())
+        ]])
+        if _puntos_dentro_estricto(centroide, anillo).all():
+            puntos.append(centroide)
+    return np.vstack(puntos)
+
+def _anillos_se_superponen(a, b):
+    """
+    True si los interiores de dos anillos cerrados se superponen: algún par de lados se cruza,
+    o algún punto de prueba de uno cae estrictamente dentro del otro (cubre bordes colineales
+    y campos duplicados, donde no hay cruces).
+    """
+    return (
+        _lados_se_cruzan(a, b)
+        or bool(_puntos_dentro_estricto(_puntos_de_prueba(a), b).any())
+        or bool(_puntos_dentro_estricto(_puntos_de_prueba(b), a).any())
+    )
+
+def poligonos_se_superponen(poligonos_data):
+    """
+    True si algún par de polígonos comparte área (no alcanza con tocarse en un borde).
+    Compara solo los anillos exteriores: un polígono dentro del agujero de otro cuenta
+    como superpuesto, lo que solo hace que el área se pida a Earth Engine.
+    """
+    anillos = [anillo for pol in poligonos_data or [] for anillo in anillos_exteriores(pol.get('coords'))]
+    if len(anillos) < 2:
+        return False
+
+    extensiones = np.array([[*anillo.min(axis=0), *anillo.max(axis=0)] for anillo in anillos])
+    for i in range(len(anillos)):
+        oeste, sur, este, norte = extensiones[i]
+        candidatos = np.nonzero(
+            (extensiones[i + 1:, 0] < este) & (extensiones[i + 1:, 2] > oeste)
+            & (extensiones[i + 1:, 1] < norte) & (extensiones[i + 1:, 3] > sur)
+        )[0] + i + 1
+        if any(_anillos_se_superponen(anillos[i], anillos[j]) for j in candidatos):
+            return True
+    return False
+
+def suma_areas_ha(poligonos_data):
+    """Suma en hectáreas de las áreas geodésicas de los polígonos ('coords' de KMZ o SENASA)"""
+    return sum(area_geodesica_m2(pol.get('coords')) for pol in poligonos_data or []) / 10000
+
+def area_poligonos_ha(poligonos_data):
+    """
+    Área en hectáreas de la unión de los polígonos, calculada localmente. Si se superponen
+    la suma contaría dos veces el área común: devuelve None y el área de la unión (disuelta)
+    se pide a Earth Engine (ver area_aoi_ha).
+    """
+    if poligonos_se_superponen(poligonos_data):
+        return None
+    return suma_areas_ha(poligonos_data)
+
+def describir_area_campos(poligonos_data):
+    """Texto del área de un conjunto de campos, aclarando si hay superposiciones"""
+    area = area_poligonos_ha(poligonos_data)
+    if area is None:
+        return f"{suma_areas_ha(poligonos_data):,.1f} ha sumando campos (hay superposiciones)"
+    return f"{area:,.1f} ha"
+
+def area_aoi_ha(geometry, poligonos_data=None):
+    """Área del AOI en hectáreas: local si los polígonos no se superponen, si no la de Earth Engine"""
+    area = area_poligonos_ha(poligonos_data) if poligonos_data else None
+    if area is None:
+        area = geometry.area().divide(10000).getInfo()
+    return area
+
+# =====================================================================
+# EJECUCIÓN CONCURRENTE DE PEDIDOS A EARTH ENGINE
+# =====================================================================
+
+# Pedidos simultáneos a Earth Engine (por debajo de la cuota de agregaciones concurrentes)
+EE_MAX_CONCURRENTES = int(os.environ.get('VISU_EE_MAX_CONCURRENTES', 6))
+EE_TIMEOUT_SEGUNDOS = float(os.environ.get('VISU_EE_TIMEOUT', 300))
+
+# Cupos compartidos por todo el proceso (todas las llamadas y sesiones): el límite es global
+_cupos_ee = threading.BoundedSemaphore(EE_MAX_CONCURRENTES)
+_estado_hilo_ee = threading.local()
+
+def envolver_tarea_ee(tarea, contexto=None, abandonado=None, al_iniciar=None):
+    """
+    Envuelve una tarea para correr en otro hilo: hereda el contexto de Streamlit, espera uno
+    de los cupos globales y no sale a Earth Engine si `abandonado` se activó mientras esperaba.
+    al_iniciar() se llama al obtener el cupo (el reloj del timeout arranca ahí).
+    """
+    def ejecutar():
+        if contexto is not None:
+            add_script_run_ctx(threading.current_thread(), contexto)
+        with _cupos_ee:
+            if abandonado is not None and abandonado.is_set():
+                return None
+            _estado_hilo_ee.en_cupo = True
+            if al_iniciar is not None:
+                al_iniciar()
+            try:
+                return tarea()
+            finally:
+                _estado_hilo_ee.en_cupo = False
+    return ejecutar
+
+def ejecutar_a_medida(tareas, max_concurrentes=None, timeout=None):
+    """
+    Ejecuta funciones independientes (típicamente getInfo/getMapId) en un pool de hilos acotado
+    y va entregando (índice, resultado) a medida que cada una termina, en orden de llegada.
+    El resultado es la excepción que produjo la tarea (TimeoutError si superó `timeout`
+    segundos en ejecución). Si el consumidor abandona la iteración se cancelan las pendientes.
+
+    Cada tarea ocupa uno de los EE_MAX_CONCURRENTES cupos globales mientras corre. Si se
+    llama desde dentro de una tarea, las subtareas corren en serie con el cupo de esa tarea,
+    así el anidamiento no multiplica los pedidos simultáneos.
+    """
+    if not tareas:
+        return
+    
+    if getattr(_estado_hilo_ee, 'en_cupo', False):
+        for indice, tarea in enumerate(tareas):
+            try:
+                resultado = tarea()
+            except Exception as e:
+                resultado = e
+            yield indice, resultado
+        return
+    
+    max_concurrentes = max_concurrentes or EE_MAX_CONCURRENTES
+    timeout = EE_TIMEOUT_SEGUNDOS if timeout is None else timeout
+    
+    # Los hilos heredan el contexto de Streamlit para que st.* dentro de las tareas no falle
+    contexto = get_script_run_ctx() if get_script_run_ctx else None
+    inicios = {}
+    abandonado = threading.Event()
+    
+    def preparar(indice, tarea):
+        return envolver_tarea_ee(
+            tarea, contexto, abandonado, al_iniciar=lambda: inicios.__setitem__(indice, time.monotonic())
+        )
+    
+    executor = ThreadPoolExecutor(max_workers=min(max_concurrentes, len(tareas)), thread_name_prefix='visu-ee')
+    try:
+        futuros = {executor.submit(preparar(i, tarea)): i for i, tarea in enumerate(tareas)}
+        pendientes = set(futuros)
+        
+        while pendientes:
+            listos, pendientes = wait(pendientes, timeout=0.5, return_when=FIRST_COMPLETED)
+            
+            for futuro in listos:
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    resultado = e
+                yield futuros[futuro], resultado
+            
+            # El reloj de cada tarea corre desde que obtiene su cupo, no desde que se encola
+            ahora = time.monotonic()
+            for futuro in list(pendientes):
+                indice = futuros[futuro]
+                if indice in inicios and ahora - inicios[indice] > timeout:
+                    futuro.cancel()
+                    pendientes.discard(futuro)
+                    yield indice, TimeoutError(f"Pedido a Earth Engine sin respuesta tras {timeout:g} s")
+    finally:
+        # Las tareas que ya esperan un cupo lo liberan sin llegar a Earth Engine
+        abandonado.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Pool para tareas sueltas en segundo plano (ver iniciar_en_segundo_plano); los cupos siguen siendo los globales
+_executor_fondo_ee = ThreadPoolExecutor(max_workers=EE_MAX_CONCURRENTES, thread_name_prefix='visu-ee-fondo')
+
+def iniciar_en_segundo_plano(tarea):
+    """
+    Lanza una tarea con las mismas reglas que ejecutar_a_medida (cupo global, contexto de
+    Streamlit) y devuelve su Future sin esperarla: el que la lanza puede seguir con otros
+    pedidos y consultar .done()/.result() cuando le convenga. Se llama desde el hilo de la
+    sesión, no desde dentro de otra tarea (esperaría un segundo cupo).
+    """
+    contexto = get_script_run_ctx() if get_script_run_ctx else None
+    return _executor_fondo_ee.submit(envolver_tarea_ee(tarea, contexto))
+
+def ejecutar_en_paralelo(tareas, max_concurrentes=None, timeout=None):
+    """
+    Como ejecutar_a_medida, pero espera a todas las tareas y devuelve una lista en el
+    mismo orden que `tareas`: cada elemento es el resultado o la excepción que produjo.
+    """
+    resultados = [None] * len(tareas)
+    for indice, resultado in ejecutar_a_medida(tareas, max_concurrentes, timeout):
+        resultados[indice] = resultado
+    return resultados
+
+# =====================================================================
+# CACHÉ PERSISTENTE DE RESULTADOS
+# =====================================================================
+
+# Directorio, vencimiento y tamaño máximo del caché (configurables por entorno)
+CACHE_DIR = os.path.expanduser(os.environ.get('VISU_CACHE_DIR', os.path.join('~', '.cache', 'visu')))
+CACHE_TTL_DIAS = float(os.environ.get('VISU_CACHE_TTL_DIAS', 180))
+CACHE_MAX_MB = float(os.environ.get('VISU_CACHE_MAX_MB', 200))
+
+def hash_geometria(poligonos_data, decimales=6):
+    """
+    Hash canónico de un conjunto de polígonos: no depende del orden de los campos,
+    del vértice inicial, del sentido de giro ni de los atributos (nombre, archivo, etc.)
+    """
+    anillos = []
+    
+    for pol in poligonos_data:
+        coords = pol.get('coords') or []
+        puntos = [(round(float(c[0]), decimales), round(float(c[1]), decimales)) for c in coords]
+        
+        if len(puntos) > 1 and puntos[0] == puntos[-1]:
+            puntos = puntos[:-1]
+        if len(puntos) < 3:
+            continue
+        
+        # Sentido antihorario y arranque en el vértice mínimo
+        doble_area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(puntos, puntos[1:] + puntos[:1]))
+        if doble_area < 0:
+            puntos.reverse()
+        inicio = puntos.index(min(puntos))
+        anillos.append(puntos[inicio:] + puntos[:inicio])
+    
+    anillos.sort()
+    return hashlib.sha256(json.dumps(anillos).encode('utf-8')).hexdigest()
+
+def conectar_cache():
+    """Abre (y crea si hace falta) la base SQLite del caché"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(CACHE_DIR, 'resultados.sqlite'), timeout=30)
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS resultados (
+            clave TEXT PRIMARY KEY,
+            valor TEXT NOT NULL,
+            creado REAL NOT NULL,
+            accedido REAL NOT NULL,
+            vence REAL,
+            bytes INTEGER NOT NULL
+        )
+    """)
+    return conexion
+
+def purgar_cache(conexion):
+    """Elimina entradas vencidas y, si se supera CACHE_MAX_MB, las usadas hace más tiempo"""
+    conexion.execute("DELETE FROM resultados WHERE vence IS NOT NULL AND vence < ?", (time.time(),))
+    
+    total = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM resultados").fetchone()[0]
+    exceso = total - CACHE_MAX_MB * 1024 * 1024
+    if exceso <= 0:
+        return
+    
+    for clave, tamano in conexion.execute("SELECT clave, bytes FROM resultados ORDER BY accedido").fetchall():
+        if exceso <= 0:
+            break
+        conexion.execute("DELETE FROM resultados WHERE clave = ?", (clave,))
+        exceso -= tamano
+
+def cache_obtener(clave):
+    """Devuelve el valor guardado para la clave, o None si no existe o venció"""
+    try:
+        with closing(conectar_cache()) as conexion, conexion:
+            fila = conexion.execute(
+                "SELECT valor, vence FROM resultados WHERE clave = ?", (clave,)
+            ).fetchone()
+            
+            if fila is None:
+                return None
+            if fila[1] is not None and fila[1] < time.time():
+                conexion.execute("DELETE FROM resultados WHERE clave = ?", (clave,))
+                return None
+            
+            conexion.execute("UPDATE resultados SET accedido = ? WHERE clave = ?", (time.time(), clave))
+            return json.loads(fila[0])
+    except (sqlite3.Error, OSError, ValueError):
+        # El caché nunca debe impedir el análisis
+        return None
+
+def cache_guardar(clave, valor, ttl_dias=None):
+    """Guarda un valor serializable en JSON. ttl_dias=0 lo conserva sin vencimiento"""
+    ttl = CACHE_TTL_DIAS if ttl_dias is None else ttl_dias
+    ahora = time.time()
+    vence = ahora + ttl * 86400 if ttl else None
+    
+    try:
+        datos = json.dumps(valor)
+        with closing(conectar_cache()) as conexion, conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO resultados (clave, valor, creado, accedido, vence, bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                (clave, datos, ahora, ahora, vence, len(datos))
+            )
+            purgar_cache(conexion)
+    except (sqlite3.Error, OSError, TypeError, ValueError):
+        pass
+
+# Campañas analizadas y assets de invierno/verano que componen cada una
+CAMPANAS_CULTIVOS = ['19-20', '20-21', '21-22', '22-23', '23-24']
+ASSETS_CULTIVOS = 'projects/carbide-kayak-459911-n3/assets'
+ASSETS_POR_CAMPANA = {
+    '19-20': {'inv': 'inv19', 'ver': 'ver20'},
+    '20-21': {'inv': 'inv20', 'ver': 'ver21'},
+    '21-22': {'inv': 'inv21', 'ver': 'ver22'},
+    '22-23': {'inv': 'inv22', 'ver': 'ver23'},
+    '23-24': {'inv': 'inv23', 'ver': 'ver24'}
+}
+
+# Proyección de las reducciones de cultivos:
+# - 'forzada': reproyecta los assets y pixelArea a EPSG:5345 / 30 m antes de recortar (método original)
+# - 'reduccion': conserva la proyección nativa de los assets y fija crs/scale recién al reducir,
+#   evitando el reproject completo (costoso y causa de errores de memoria en AOIs grandes)
+CRS_CULTIVOS = 'EPSG:5345'
+ESCALA_CULTIVOS = 30
+PROYECCION_CULTIVOS = os.environ.get('VISU_PROYECCION_CULTIVOS', 'forzada')
+
+# 🎨 Catálogo único de clases de cultivo (id → nombre, color): define la paleta de los tiles,
+# del gráfico de rotación y de las leyendas
+CLASES_CULTIVO = {
+    6: ('Trigo', 'ffffff'),
+    10: ('Maíz', '0042ff'),
+    11: ('Soja 1ra', '339820'),
+    12: ('Girasol', 'ffff00'),
+    13: ('Poroto', 'f022db'),
+    14: ('Caña de azúcar', 'a32102'),
+    15: ('Algodón', 'b7b9bd'),
+    16: ('Maní', 'ffa500'),
+    17: ('Arroz', '1d1e33'),
+    18: ('Sorgo GR', 'ff0000'),
+    19: ('Girasol-CV', 'a32102'),
+    20: ('Barbecho', '646b63'),
+    21: ('No agrícola', 'e6f0c2'),
+    22: ('No agrícola', 'e6f0c2'),
+    26: ('Papa', '8a2be2'),
+    28: ('Verdeo de Sorgo', '800080'),
+    30: ('Tabaco', 'd2b48c'),
+    31: ('CI-Maíz 2da', '87ceeb'),
+    32: ('CI-Soja 2da', '90ee90')
+}
+ID_CLASE_MAX = 32
+COLOR_SIN_DATOS = '646b63'   # ids 0-5
+COLOR_RESERVADO = 'ff6347'   # ids sin cultivo asignado
+COLOR_DEFAULT = '#999999'
+
+# Variantes de nombres que pueden aparecer en resultados viejos o exportados
+ALIAS_CULTIVOS = {
+    'No Agrícola': 'No agrícola',
+    'Caña de Azúcar': 'Caña de azúcar',
+    'Soja 2da': 'CI-Soja 2da',
+    'CI-Maíz': 'CI-Maíz 2da',
+    'C inv - Maíz 2da': 'CI-Maíz 2da',
+    'CI-Soja': 'CI-Soja 2da',
+    'C inv - Soja 2da': 'CI-Soja 2da'
+}
+
+# Clases que informa cada campaña
+CLASES_BASE = [10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 21, 22, 31, 32]
+CLASES_POR_CAMPANA = {
+    '19-20': CLASES_BASE,
+    '20-21': sorted(CLASES_BASE + [26, 28]),
+    '21-22': sorted(CLASES_BASE + [26, 28]),
+    '22-23': sorted(CLASES_BASE + [26, 28, 30]),
+    '23-24': sorted(CLASES_BASE + [26, 28, 30])
+}
+
+# Reglas de combinación invierno/verano por campaña:
+# - antecesores: clases de invierno que convierten maíz/soja de verano en CI-Maíz/CI-Soja 2da
+# - invierno_a_clase: clase de invierno que define el píxel cuando el verano no es maíz ni soja
+REGLAS_CAMPANA = {
+    '19-20': {'antecesores': [0, 6], 'invierno_a_clase': {}},
+    '20-21': {'antecesores': [0, 16, 24], 'invierno_a_clase': {}},
+    '21-22': {'antecesores': [6, 16, 24], 'invierno_a_clase': {19: 14}},
+    '22-23': {'antecesores': [6, 16, 24], 'invierno_a_clase': {19: 14}},
+    '23-24': {'antecesores': [6, 16, 24], 'invierno_a_clase': {19: 14}}
+}
+CLASES_SEGUNDA = {10: 31, 11: 32}
+
+# Compilado una sola vez al importar: paleta, nombres y tablas de remap
+PALETA_CULTIVOS = [
+    '#' + CLASES_CULTIVO.get(i, (None, COLOR_SIN_DATOS if i <= 5 else COLOR_RESERVADO))[1]
+    for i in range(ID_CLASE_MAX + 1)
+]
+COLORES_CULTIVOS = {nombre: f'#{color}' for nombre, color in CLASES_CULTIVO.values()}
+COLORES_CULTIVOS.update({alias: COLORES_CULTIVOS[nombre] for alias, nombre in ALIAS_CULTIVOS.items()})
+CULTIVOS_POR_CAMPANA = {
+    campana: {id_clase: CLASES_CULTIVO[id_clase][0] for id_clase in clases}
+    for campana, clases in CLASES_POR_CAMPANA.items()
+}
+SEGUNDA_DESDE = list(CLASES_SEGUNDA)
+SEGUNDA_SALTO = [CLASES_SEGUNDA[c] - c for c in SEGUNDA_DESDE]
+
+def crear_capa_combinada(campana, geometry, proyeccion=None):
+    """Combina los assets de invierno y verano de una campaña en la capa de clases de cultivo"""
+    inv_name = ASSETS_POR_CAMPANA[campana]['inv']
+    ver_name = ASSETS_POR_CAMPANA[campana]['ver']
+    regla = REGLAS_CAMPANA[campana]
+    
+    inv_asset = ee.Image(f'{ASSETS_CULTIVOS}/{inv_name}')
+    ver_asset = ee.Image(f'{ASSETS_CULTIVOS}/{ver_name}')
+    
+    if (proyeccion or PROYECCION_CULTIVOS) == 'forzada':
+        inv_asset = inv_asset.reproject(CRS_CULTIVOS, None, ESCALA_CULTIVOS)
+        ver_asset = ver_asset.reproject(CRS_CULTIVOS, None, ESCALA_CULTIVOS)
+    
+    invierno = inv_asset.clip(geometry)
+    verano = ver_asset.clip(geometry)
+    
+    # remap en lugar de expresiones ternarias: grafo más chico y evaluación más barata
+    antecesor = invierno.remap(regla['antecesores'], [1] * len(regla['antecesores']), 0)
+    salto_segunda = verano.remap(SEGUNDA_DESDE, SEGUNDA_SALTO, 0)
+    capa_combinada = verano.add(salto_segunda.multiply(antecesor))
+    
+    for clase_invierno, clase in regla['invierno_a_clase'].items():
+        capa_combinada = capa_combinada.where(invierno.eq(clase_invierno).And(salto_segunda.eq(0)), clase)
+    
+    return capa_combinada.rename('clase')
+
+def generar_url_tiles_cultivos(capa_combinada):
+    """Genera la URL de tiles RGB (paleta oficial) de una capa de cultivos, o None si EE no la devuelve"""
+    imagen_rgb = capa_combinada.visualize(min=0, max=ID_CLASE_MAX, palette=PALETA_CULTIVOS)
+    return url_tiles_imagen(imagen_rgb)
+
+def url_tiles_imagen(imagen_rgb):
+    """URL de tiles de una imagen ya visualizada (RGB), o None si EE no la devuelve"""
+    simple_map_id = imagen_rgb.getMapId({})
+    
+    if 'tile_fetcher' in simple_map_id:
+        return simple_map_id['tile_fetcher'].url_format
+    elif 'urlTemplate' in simple_map_id:
+        return simple_map_id['urlTemplate']
     
     return None
 
-def analizar_cultivos_web(aoi):
+# Los map IDs de Earth Engine vencen a las pocas horas: se reutilizan por debajo de ese margen
+TILES_TTL_SEGUNDOS = 2 * 3600
+
+@st.cache_data(ttl=TILES_TTL_SEGUNDOS, max_entries=500, show_spinner=False)
+def obtener_url_tiles_cultivos(clave_aoi, campana, _aoi):
+    """
+    Genera bajo demanda la URL de tiles de una campaña y la memoriza por AOI + campaña.
+    _aoi no forma parte de la clave (Streamlit no hashea argumentos con guion bajo).
+    """
+    url_tiles = generar_url_tiles_cultivos(crear_capa_combinada(campana, _aoi.geometry()))
+    if not url_tiles:
+        # Sin excepción Streamlit memorizaría el fallo durante todo el TTL
+        raise ValueError(f"Earth Engine no devolvió tiles para la campaña {campana}")
+    return url_tiles
+
+# Frecuencia de inundación: de 1 año con agua (claro) a todos los años del rango (oscuro)
+PALETA_FRECUENCIA_INUNDACION = ['ffffcc', 'a1dab4', '41b6c4', '2c7fb8', '253494']
+
+@st.cache_data(ttl=TILES_TTL_SEGUNDOS, max_entries=200, show_spinner=False)
+def obtener_url_tiles_frecuencia(clave_aoi, ano_inicio, ano_fin, _aoi):
+    """
+    URL de tiles de la frecuencia de inundación: cantidad de años con agua por píxel,
+    calculada en el servidor con las mismas fuentes y rango que el análisis y con el
+    contorno del AOI superpuesto. Se memoriza por AOI + rango de años.
+    """
+    geometry = _aoi.geometry()
+    anos = list(range(ano_inicio, ano_fin + 1))
+    
+    # Años S2 sin imágenes quedan enmascarados: cuentan como años sin agua
+    frecuencia = crear_bandas_agua_anuales(geometry, anos, ee.ImageCollection(DATASET_GSW_ANUAL)) \
+        .unmask(0).reduce(ee.Reducer.sum()).clip(geometry).selfMask()
+    contorno = ee.Image().byte().paint(featureCollection=_aoi, color=1, width=2)
+    
+    imagen_rgb = frecuencia.visualize(min=1, max=max(len(anos), 2), palette=PALETA_FRECUENCIA_INUNDACION) \
+        .blend(contorno.visualize(palette=['0000ff']))
+    
+    url_tiles = url_tiles_imagen(imagen_rgb)
+    if not url_tiles:
+        raise ValueError(f"Earth Engine no devolvió tiles de frecuencia para {ano_inicio}-{ano_fin}")
+    return url_tiles
+
+def clave_aoi_mapa(aoi, clave_geometria=None):
+    """Clave estable del AOI para memorizar tiles: el hash canónico o, si falta, el grafo serializado"""
+    if clave_geometria:
+        return clave_geometria
+    return hashlib.sha256(aoi.serialize().encode('utf-8')).hexdigest()
+
+def crear_area_pixeles(proyeccion=None):
+    """Imagen de área por píxel (m²), reproyectada solo en el modo de proyección 'forzada'"""
+    area_pixeles = ee.Image.pixelArea()
+    if (proyeccion or PROYECCION_CULTIVOS) == 'forzada':
+        area_pixeles = area_pixeles.reproject(CRS_CULTIVOS, None, ESCALA_CULTIVOS)
+    return area_pixeles
+
+def crs_reduccion(proyeccion=None):
+    """CRS a pasar a las reducciones: explícito con proyección nativa, el de la imagen si ya fue forzada"""
+    return CRS_CULTIVOS if (proyeccion or PROYECCION_CULTIVOS) == 'reduccion' else None
+
+def calcular_areas_por_clase(capa, geometry, area_pixeles, scale=30, crs=None):
+    """
+    Arma una única reducción agrupada (pixelArea sumada por clase de cultivo).
+    Devuelve el diccionario de EE sin evaluar; la lista queda en la clave 'groups'.
+    """
+    imagen_agrupada = area_pixeles.rename('area').addBands(capa.rename('clase'))
+
+    return imagen_agrupada.reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='clase'),
+        geometry=geometry,
+        crs=crs,
+        scale=scale,
+        maxPixels=1e13,
+        bestEffort=False,
+        tileScale=4
+    )
+
+def parsear_grupos_area(grupos):
+    """Convierte la lista 'groups' de Earth Engine en un diccionario {clase: área en m²}"""
+    areas_m2 = {}
+
+    for grupo in grupos or []:
+        clase = grupo.get('clase')
+        area = grupo.get('sum')
+        if clase is None or area is None:
+            continue
+
+        clase_id = int(round(clase))
+        areas_m2[clase_id] = areas_m2.get(clase_id, 0) + area
+
+    return areas_m2
+
+def construir_filas_campana(campana, cultivos, areas_m2, area_total):
+    """Genera las filas Campaña/Cultivo/Área/Porcentaje con el mismo redondeo que el análisis por cultivo"""
+    filas = []
+
+    for cultivo_id, nombre_cultivo in cultivos.items():
+        area_cultivo = areas_m2.get(int(cultivo_id), 0)
+        area_cultivo_ha = round(area_cultivo / 10000) if area_cultivo else 0
+        porcentaje_cultivo = round((area_cultivo_ha / area_total) * 100) if area_total > 0 else 0
+
+        filas.append({
+            'Campaña': campana,
+            'Cultivo': nombre_cultivo,
+            'Área (ha)': area_cultivo_ha,
+            'Porcentaje (%)': porcentaje_cultivo
+        })
+
+    return filas
+
+def apilar_capas_campanas(capas, area_pixeles):
+    """
+    Apila (área, clase) de cada campaña en una imagen multibanda y arma el reductor
+    agrupado combinado que la reduce en una sola pasada.
+    Devuelve (imagen, reductor, {campaña: clave de salida})
+    """
+    bandas = []
+    claves_salida = {}
+    reductor = None
+
+    for campana in capas:
+        sufijo = campana.replace('-', '_')
+        bandas.append(area_pixeles.rename(f'area_{sufijo}'))
+        bandas.append(capas[campana].rename(f'clase_{sufijo}'))
+
+        # Cada reductor agrupado consume su propio par (área, clase)
+        reductor_campana = ee.Reducer.sum().group(groupField=1, groupName='clase')
+        if reductor is None:
+            reductor = reductor_campana
+            claves_salida[campana] = 'groups'
+        else:
+            reductor = reductor.combine(reductor_campana, outputPrefix=f'c{sufijo}_', sharedInputs=False)
+            claves_salida[campana] = f'c{sufijo}_groups'
+
+    return ee.Image.cat(bandas), reductor, claves_salida
+
+def calcular_areas_todas_campanas(capas, geometry, area_pixeles, scale=30, crs=None, tile_scale=4):
+    """
+    Obtiene el área por clase de todas las campañas con un único reduceRegion/getInfo.
+    Devuelve {campaña: {clase: área en m²}}; una campaña sin salida en la respuesta queda
+    fuera (no es lo mismo que un histograma vacío) y se calcula por otra vía.
+    """
+    if not capas:
+        return {}
+
+    imagen, reductor, claves_salida = apilar_capas_campanas(capas, area_pixeles)
+
+    stats = imagen.reduceRegion(
+        reducer=reductor,
+        geometry=geometry,
+        crs=crs,
+        scale=scale,
+        maxPixels=1e13,
+        bestEffort=False,
+        tileScale=tile_scale
+    ).getInfo()
+
+    return {
+        campana: parsear_grupos_area(stats.get(clave))
+        for campana, clave in claves_salida.items()
+        if stats.get(clave) is not None
+    }
+
+# Teselado de AOIs grandes: por encima de TESELADO_MAX_HA la reducción se parte en celdas
+# de una grilla lon/lat que se reducen en paralelo y se suman
+TESELADO_MAX_HA = float(os.environ.get('VISU_TESELADO_MAX_HA', 200000))
+TILESCALES_REINTENTO = [4, 8, 16]
+
+def es_error_memoria(error):
+    """True si Earth Engine rechazó el cálculo por falta de memoria"""
+    mensaje = str(error).lower()
+    return 'memory' in mensaje and ('limit' in mensaje or 'exceeded' in mensaje or 'out of' in mensaje)
+
+def con_reintento_tilescale(calculo):
+    """Ejecuta calculo(tile_scale) y lo reintenta con un tileScale mayor ante errores de memoria"""
+    for i, tile_scale in enumerate(TILESCALES_REINTENTO):
+        try:
+            return calculo(tile_scale)
+        except ee.EEException as e:
+            if not es_error_memoria(e) or i == len(TILESCALES_REINTENTO) - 1:
+                raise
+
+def extension_coords(coords):
+    """Rectángulo envolvente (oeste, sur, este, norte) de un anillo, polígono o multipolígono"""
+    puntos = []
+    pendientes = [coords]
+    while pendientes:
+        nodo = pendientes.pop()
+        if nodo and isinstance(nodo[0], (int, float)):
+            puntos.append(nodo[:2])
+        else:
+            pendientes.extend(nodo or [])
+
+    puntos = np.asarray(puntos, dtype=float)
+    return (*puntos.min(axis=0), *puntos.max(axis=0))
+
+def extension_poligonos(poligonos_data):
+    """Rectángulo envolvente (oeste, sur, este, norte) de todos los polígonos, o None si no hay coordenadas"""
+    extensiones = np.array([extension_coords(pol['coords']) for pol in poligonos_data or [] if pol.get('coords')])
+    if not len(extensiones):
+        return None
+    return (float(extensiones[:, 0].min()), float(extensiones[:, 1].min()),
+            float(extensiones[:, 2].max()), float(extensiones[:, 3].max()))
+
+def dividir_en_celdas(poligonos_data, max_ha=None):
+    """
+    Grilla lon/lat de celdas de ~max_ha que tocan algún polígono, o [] si el AOI no
+    necesita teselado. Las celdas particionan el plano: cada píxel cae en una sola,
+    así que la suma de sus histogramas es exactamente el histograma del AOI.
+    Devuelve [[oeste, sur, este, norte], ...]
+    """
+    max_ha = max_ha or TESELADO_MAX_HA
+    # Con campos superpuestos la suma es una cota superior: a lo sumo se tesela antes de tiempo
+    if not poligonos_data or suma_areas_ha(poligonos_data) <= max_ha:
+        return []
+
+    extensiones = np.array([extension_coords(pol['coords']) for pol in poligonos_data if pol.get('coords')])
+    oeste, sur, este, norte = extension_poligonos(poligonos_data)
+
+    # Lado de la celda en grados a la latitud media del AOI
+    lado_m = np.sqrt(max_ha * 10000)
+    paso_lat = lado_m / 110950
+    paso_lon = lado_m / (111320 * np.cos(np.radians((sur + norte) / 2)))
+
+    # Grilla anclada a múltiplos del paso para que el mismo AOI dé siempre las mismas celdas
+    lons = np.arange(np.floor(oeste / paso_lon), np.ceil(este / paso_lon) + 1) * paso_lon
+    lats = np.arange(np.floor(sur / paso_lat), np.ceil(norte / paso_lat) + 1) * paso_lat
+
+    celdas = []
+    for celda_oeste, celda_este in zip(lons[:-1], lons[1:]):
+        for celda_sur, celda_norte in zip(lats[:-1], lats[1:]):
+            toca_campo = np.any(
+                (extensiones[:, 0] <= celda_este) & (extensiones[:, 2] >= celda_oeste) &
+                (extensiones[:, 1] <= celda_norte) & (extensiones[:, 3] >= celda_sur)
+            )
+            if toca_campo:
+                celdas.append([float(celda_oeste), float(celda_sur), float(celda_este), float(celda_norte)])
+
+    return celdas
+
+def calcular_areas_teselado(capas, celdas, area_pixeles, scale=30, crs=None):
+    """
+    Reduce todas las campañas celda por celda (en paralelo, con reintento de tileScale)
+    y suma los histogramas parciales. Devuelve {campaña: {clase: área en m²}}
+    """
+    def tarea_celda(celda):
+        rectangulo = ee.Geometry.Rectangle(celda, 'EPSG:4326', False)
+        return con_reintento_tilescale(
+            lambda tile_scale: calcular_areas_todas_campanas(
+                capas, rectangulo, area_pixeles, scale=scale, crs=crs, tile_scale=tile_scale
+            )
+        )
+
+    resultados = ejecutar_en_paralelo([lambda celda=celda: tarea_celda(celda) for celda in celdas])
+
+    areas_por_campana = {campana: {} for campana in capas}
+    for resultado in resultados:
+        # Un histograma parcial incompleto falsearía el total: falla la reducción entera
+        if isinstance(resultado, Exception):
+            raise resultado
+        # Una campaña que falta en alguna celda tampoco tiene un total válido
+        for campana in set(areas_por_campana) - set(resultado):
+            del areas_por_campana[campana]
+        for campana, areas_m2 in resultado.items():
+            if campana not in areas_por_campana:
+                continue
+            for clase, area in areas_m2.items():
+                areas_por_campana[campana][clase] = areas_por_campana[campana].get(clase, 0) + area
+
+    return areas_por_campana
+
+def calcular_areas_por_cultivo(capa, cultivos, geometry, area_pixeles, scale=30, crs=None):
+    """
+    Método original: una reducción y un getInfo por cultivo (en paralelo).
+    Devuelve ({clase: área en m²}, completo): completo es False si algún cultivo falló.
+    """
+    def tarea_cultivo(cultivo_id):
+        mascara_cultivo = capa.eq(int(cultivo_id))
+        area_img = area_pixeles.multiply(mascara_cultivo)
+        
+        area_dict = area_img.reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=geometry,
+            crs=crs,
+            scale=scale,
+            maxPixels=1e13,
+            bestEffort=False,
+            tileScale=4
+        )
+        
+        return ee.Number(area_dict.get('area')).getInfo() or 0
+    
+    ids = [int(cultivo_id) for cultivo_id in cultivos]
+    resultados = ejecutar_en_paralelo([lambda c=cultivo_id: tarea_cultivo(c) for cultivo_id in ids])
+    
+    # Los cultivos que fallaron quedan fuera, igual que en la versión secuencial
+    areas_m2 = {
+        cultivo_id: area
+        for cultivo_id, area in zip(ids, resultados)
+        if not isinstance(area, Exception)
+    }
+    return areas_m2, len(areas_m2) == len(ids)
+
+def clave_cache_cultivos(clave_geometria, campana, scale=30, proyeccion=None):
+    """Clave de caché: geometría canónica + campaña + assets que la componen + escala (+ proyección nativa)"""
+    assets = ASSETS_POR_CAMPANA[campana]
+    clave = f"cultivos|{clave_geometria}|{campana}|{ASSETS_CULTIVOS}/{assets['inv']}+{assets['ver']}|{scale}"
+    if (proyeccion or PROYECCION_CULTIVOS) != 'forzada':
+        clave += f"|{proyeccion or PROYECCION_CULTIVOS}"
+    return clave
+
+def leer_areas_cache(clave_geometria, campana, proyeccion=None):
+    """Lee del caché el diccionario {clase: área m²} de una campaña (None si no está)"""
+    valor = cache_obtener(clave_cache_cultivos(clave_geometria, campana, proyeccion=proyeccion))
+    if valor is None:
+        return None
+    # JSON guarda las claves como texto
+    return {int(clase): area for clase, area in valor.items()}
+
+def analizar_cultivos_web(aoi, motor='multibanda', clave_geometria=None, forzar_actualizacion=False,
+                          proyeccion=None, poligonos_data=None):
     """
     Función principal que analiza cultivos con Google Earth Engine
     Versión limpia sin mensajes técnicos para el usuario final
+
+    motor:
+    - 'multibanda': todas las campañas apiladas en una sola reducción (1 getInfo en total, o una
+      por celda si el AOI supera TESELADO_MAX_HA)
+    - 'histograma': una reducción agrupada por campaña (1 getInfo por campaña)
+    - 'por_cultivo': una reducción por cultivo y campaña (método original, ~85 getInfo)
+
+    clave_geometria: hash canónico del AOI (ver hash_geometria). Si se indica, las áreas
+    se leen/guardan en el caché persistente; forzar_actualizacion ignora lo guardado.
+
+    proyeccion: 'forzada' o 'reduccion' (ver PROYECCION_CULTIVOS); por defecto la configurada.
+
+    poligonos_data: polígonos que originaron el AOI; con ellos el área total se calcula
+    localmente (area_poligonos_ha) sin pedirla a Earth Engine, salvo que se superpongan.
+
+    tiles_urls se devuelve vacío: el mapa genera los tiles de la campaña seleccionada
+    bajo demanda con obtener_url_tiles_cultivos.
     """
     try:
-        # Calcular área total del AOI en hectáreas
-        area_total_aoi = aoi.geometry().transform('EPSG:5345', 1).area(1).divide(10000)
-        area_total = area_total_aoi.getInfo()
+        usar_cache = bool(clave_geometria)
+        proyeccion = proyeccion or PROYECCION_CULTIVOS
+        crs = crs_reduccion(proyeccion)
+        
+        # Calcular área total del AOI en hectáreas (local si se conocen los polígonos)
+        area_total = area_poligonos_ha(poligonos_data) if poligonos_data else None
+        if area_total is None and usar_cache and not forzar_actualizacion:
+            area_total = cache_obtener(f"area_total|{clave_geometria}")
+        if area_total is None:
+            area_total_aoi = aoi.geometry().transform('EPSG:5345', 1).area(1).divide(10000)
+            area_total = area_total_aoi.getInfo()
+            if usar_cache:
+                cache_guardar(f"area_total|{clave_geometria}", area_total)
         
         # Configurar contenedores persistentes para mostrar información esencial
         container_progreso = st.container()
-        container_resultados = st.container()
         
         with container_progreso:
             progress_bar = st.progress(0.0)
             status_text = st.empty()
         
-        # 🎨 PALETA OFICIAL SINCRONIZADA - Earth Engine + Gráfico
-        paleta_oficial = [
-            '646b63',  # 0: Sin datos / barbecho
-            '646b63',  # 1-5: Reservados
-            'ffffff',  # 6: Trigo
-            'ff6347',  # 7-9: Reservados  
-            '0042ff',  # 10: Maíz - AZUL
-            '339820',  # 11: Soja 1ra - VERDE
-            'ffff00',  # 12: Girasol - AMARILLO
-            'f022db',  # 13: Poroto - ROSA/FUCSIA
-            'a32102',  # 14: Caña de azúcar - ROJO OSCURO
-            'b7b9bd',  # 15: Algodón - GRIS CLARO
-            'ffa500',  # 16: Maní - NARANJA
-            '1d1e33',  # 17: Arroz - AZUL OSCURO
-            'ff0000',  # 18: Sorgo GR - ROJO
-            'a32102',  # 19: ⚠️ CORREGIDO: Girasol-CV/Caña → ROJO OSCURO (era amarillo)
-            '646b63',  # 20: Barbecho - GRIS OSCURO
-            'e6f0c2',  # 21: No agrícola - BEIGE CLARO
-            'e6f0c2',  # 22: No agrícola - BEIGE CLARO
-            'ff6347',  # 23-25: Reservados
-            '8a2be2',  # 26: Papa - VIOLETA
-            'ff6347',  # 27: Reservado
-            '800080',  # 28: Verdeo de Sorgo - MORADO
-            'ff6347',  # 29: Reservado
-            'd2b48c',  # 30: Tabaco - MARRÓN CLARO
-            '87ceeb',  # 31: CI-Maíz 2da - AZUL CLARO/CELESTE
-            '90ee90'   # 32: CI-Soja 2da - VERDE CLARO/FLUOR
-        ]
-        
         status_text.text("⚡ Cargando capas de cultivos...")
         progress_bar.progress(0.1)
         
-        # Cargar capas de todas las campañas
+        # Cargar capas de todas las campañas (solo arma el grafo, sin round trips)
         capas = {}
         tiles_urls = {}
-        campanas = ['19-20', '20-21', '21-22', '22-23', '23-24']
-        
-        # Mapear campañas a assets
-        asset_map = {
-            '19-20': {'inv': 'inv19', 'ver': 'ver20'},
-            '20-21': {'inv': 'inv20', 'ver': 'ver21'},
-            '21-22': {'inv': 'inv21', 'ver': 'ver22'},
-            '22-23': {'inv': 'inv22', 'ver': 'ver23'},
-            '23-24': {'inv': 'inv23', 'ver': 'ver24'}
-        }
+        campanas = CAMPANAS_CULTIVOS
         
-        for i, campana in enumerate(campanas):
+        for campana in campanas:
             try:
-                inv_name = asset_map[campana]['inv']
-                ver_name = asset_map[campana]['ver']
-                
-                inv_asset = ee.Image(f'projects/carbide-kayak-459911-n3/assets/{inv_name}')
-                ver_asset = ee.Image(f'projects/carbide-kayak-459911-n3/assets/{ver_name}')
-                
-                inv_asset_projected = inv_asset.reproject('EPSG:5345', None, 30)
-                ver_asset_projected = ver_asset.reproject('EPSG:5345', None, 30)
-                
-                inv_aoi = inv_asset_projected.clip(aoi.geometry())
-                ver_aoi = ver_asset_projected.clip(aoi.geometry())
-                
-                # Crear expresión combinada según campaña
-                if campana == '19-20':
-                    capa_combinada = ee.Image().expression(
-                        '(verano == 10 && (invierno == 0 || invierno == 6)) ? 31 : ' +
-                        '(verano == 11 && (invierno == 0 || invierno == 6)) ? 32 : ' +
-                        '(verano == 10) ? 10 : ' + '(verano == 11) ? 11 : ' +
-                        '(verano == 14) ? 14 : ' + '(verano == 19) ? 19 : ' + 'verano',
-                        {'verano': ver_aoi, 'invierno': inv_aoi}
-                    )
-                elif campana == '20-21':
-                    capa_combinada = ee.Image().expression(
-                        '(verano == 10 && (invierno == 0 || invierno == 16 || invierno == 24)) ? 31 : ' +
-                        '(verano == 11 && (invierno == 0 || invierno == 16 || invierno == 24)) ? 32 : ' +
-                        '(verano == 10) ? 10 : ' + '(verano == 11) ? 11 : ' +
-                        '(verano == 14) ? 14 : ' + '(verano == 19) ? 19 : ' + '(verano == 26) ? 26 : ' + 'verano',
-                        {'verano': ver_aoi, 'invierno': inv_aoi}
-                    )
-                else:
-                    capa_combinada = ee.Image().expression(
-                        '(verano == 10 && (invierno == 6 || invierno == 16 || invierno == 24)) ? 31 : ' +
-                        '(verano == 11 && (invierno == 6 || invierno == 16 || invierno == 24)) ? 32 : ' +
-                        '(verano == 10) ? 10 : ' + '(verano == 11) ? 11 : ' +
-                        '(invierno == 19 || verano == 14) ? 14 : ' + '(verano == 19) ? 19 : ' +
-                        '(verano == 26) ? 26 : ' + 'verano',
-                        {'verano': ver_aoi, 'invierno': inv_aoi}
-                    )
-                
-                capas[campana] = capa_combinada
-                
-                # 🎨 FORZAR MÉTODO RGB QUE SÍ FUNCIONA
-                try:
-                    # 🔧 MÉTODO PRINCIPAL NO APLICA COLORES CORRECTAMENTE
-                    # Aunque "funciona", los colores son incorrectos
-                    raise Exception("🎯 FORZANDO método RGB que genera colores EXACTOS")
-            except Exception as e:
-                    # 🎨 MÉTODO RGB PARA COLORES EXACTOS
-                    try:
-                        
-                        # 🎯 CREAR IMAGEN RGB CON COLORES GARANTIZADOS
-                        # Convertir paleta hex a RGB
-                        def hex_to_rgb(hex_color):
-                            hex_color = hex_color.lstrip('#')
-                            return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-                        
-                        # 🎯 CREAR IMAGEN TRANSPARENTE (sin píxeles negros)
-                        # Crear máscara de cultivos válidos
-                        mascara_cultivos = capa_combinada.gt(0)  # Solo píxeles con cultivos
-                        
-                        # Mapeo ID → Color RGB exacto
-                        colores_rgb_exactos = {
-                            10: hex_to_rgb('#0042ff'),  # Maíz - Azul
-                            11: hex_to_rgb('#339820'),  # Soja 1ra - Verde
-                            12: hex_to_rgb('#FFFF00'),  # Girasol - Amarillo
-                            13: hex_to_rgb('#f022db'),  # Poroto - Rosa
-                            14: hex_to_rgb('#a32102'),  # Caña de azúcar - Rojo oscuro
-                            15: hex_to_rgb('#b7b9bd'),  # Algodón - Gris claro
-                            16: hex_to_rgb('#FFA500'),  # Maní - Naranja
-                            17: hex_to_rgb('#1d1e33'),  # Arroz - Azul oscuro
-                            18: hex_to_rgb('#FF0000'),  # Sorgo GR - Rojo
-                            19: hex_to_rgb('#a32102'),  # Girasol-CV/Caña - Rojo oscuro
-                            21: hex_to_rgb('#e6f0c2'),  # No agrícola - Beige
-                            22: hex_to_rgb('#e6f0c2'),  # No agrícola - Beige
-                            26: hex_to_rgb('#8A2BE2'),  # Papa - Violeta
-                            28: hex_to_rgb('#800080'),  # Verdeo Sorgo - Morado
-                            30: hex_to_rgb('#D2B48C'),  # Tabaco - Marrón claro
-                            31: hex_to_rgb('#87CEEB'),  # CI-Maíz 2da - Azul claro
-                            32: hex_to_rgb('#90ee90')   # CI-Soja 2da - Verde claro
-                        }
-                        
-                        # Mapeo de colores optimizado
-                        
-                        # 🔧 CREAR IMAGEN RGB SIMPLIFICADA Y EFICIENTE
-                        # Usar el método visualization con parámetros RGB específicos
-                        imagen_rgb = capa_combinada.visualize(
-                            min=0, 
-                            max=32, 
-                            palette=[f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}" for rgb in [
-                                hex_to_rgb('646b63'),  # 0
-                                hex_to_rgb('646b63'),  # 1
-                                hex_to_rgb('646b63'),  # 2
-                                hex_to_rgb('646b63'),  # 3
-                                hex_to_rgb('646b63'),  # 4
-                                hex_to_rgb('646b63'),  # 5
-                                hex_to_rgb('ffffff'),  # 6
-                                hex_to_rgb('ff6347'),  # 7
-                                hex_to_rgb('ff6347'),  # 8
-                                hex_to_rgb('ff6347'),  # 9
-                                hex_to_rgb('0042ff'),  # 10 - Maíz
-                                hex_to_rgb('339820'),  # 11 - Soja 1ra
-                                hex_to_rgb('FFFF00'),  # 12 - Girasol
-                                hex_to_rgb('f022db'),  # 13 - Poroto
-                                hex_to_rgb('a32102'),  # 14 - Caña
-                                hex_to_rgb('b7b9bd'),  # 15 - Algodón
-                                hex_to_rgb('FFA500'),  # 16 - Maní
-                                hex_to_rgb('1d1e33'),  # 17 - Arroz
-                                hex_to_rgb('FF0000'),  # 18 - Sorgo
-                                hex_to_rgb('a32102'),  # 19 - Girasol-CV/Caña
-                                hex_to_rgb('646b63'),  # 20
-                                hex_to_rgb('e6f0c2'),  # 21 - No agrícola
-                                hex_to_rgb('e6f0c2'),  # 22 - No agrícola
-                                hex_to_rgb('ff6347'),  # 23
-                                hex_to_rgb('ff6347'),  # 24
-                                hex_to_rgb('ff6347'),  # 25
-                                hex_to_rgb('8A2BE2'),  # 26 - Papa
-                                hex_to_rgb('ff6347'),  # 27
-                                hex_to_rgb('800080'),  # 28 - Verdeo Sorgo
-                                hex_to_rgb('ff6347'),  # 29
-                                hex_to_rgb('D2B48C'),  # 30 - Tabaco
-                                hex_to_rgb('87CEEB'),  # 31 - CI-Maíz
-                                hex_to_rgb('90ee90')   # 32 - CI-Soja
-                            ]]
-                        )
-                        
-                        # Generar tiles de la imagen RGB personalizada
-                        simple_map_id = imagen_rgb.getMapId({})
-                        
-                        if 'tile_fetcher' in simple_map_id:
-                            tiles_urls[campana] = simple_map_id['tile_fetcher'].url_format
-                        elif 'urlTemplate' in simple_map_id:
-                            tiles_urls[campana] = simple_map_id['urlTemplate']
-                            
-                    except Exception as e2:
-                        pass
-                
+                capas[campana] = crear_capa_combinada(campana, aoi.geometry(), proyeccion)
             except:
                 continue
-            
-            progress_bar.progress(0.1 + (i + 1) / len(campanas) * 0.3)
+        
+        # 🎨 Los tiles no se generan acá: el mapa los pide bajo demanda (obtener_url_tiles_cultivos)
+        progress_bar.progress(0.4)
         
         status_text.text("📊 Calculando áreas por cultivo...")
         progress_bar.progress(0.4)
         
-        # Configuración de cultivos por campaña
-        cultivos_por_campana = {
-            '19-20': {10: 'Maíz', 11: 'Soja 1ra', 12: 'Girasol', 13: 'Poroto', 14: 'Caña de azúcar', 15: 'Algodón', 16: 'Maní', 17: 'Arroz', 18: 'Sorgo GR', 19: 'Girasol-CV', 21: 'No agrícola', 22: 'No agrícola', 31: 'CI-Maíz 2da', 32: 'CI-Soja 2da'},
-            '20-21': {10: 'Maíz', 11: 'Soja 1ra', 12: 'Girasol', 13: 'Poroto', 14: 'Caña de azúcar', 15: 'Algodón', 16: 'Maní', 17: 'Arroz', 18: 'Sorgo GR', 19: 'Girasol-CV', 21: 'No agrícola', 22: 'No agrícola', 26: 'Papa', 28: 'Verdeo de Sorgo', 31: 'CI-Maíz 2da', 32: 'CI-Soja 2da'},
-            '21-22': {10: 'Maíz', 11: 'Soja 1ra', 12: 'Girasol', 13: 'Poroto', 14: 'Caña de azúcar', 15: 'Algodón', 16: 'Maní', 17: 'Arroz', 18: 'Sorgo GR', 19: 'Girasol-CV', 21: 'No agrícola', 22: 'No agrícola', 26: 'Papa', 28: 'Verdeo de Sorgo', 31: 'CI-Maíz 2da', 32: 'CI-Soja 2da'},
-            '22-23': {10: 'Maíz', 11: 'Soja 1ra', 12: 'Girasol', 13: 'Poroto', 14: 'Caña de azúcar', 15: 'Algodón', 16: 'Maní', 17: 'Arroz', 18: 'Sorgo GR', 19: 'Girasol-CV', 21: 'No agrícola', 22: 'No agrícola', 26: 'Papa', 28: 'Verdeo de Sorgo', 30: 'Tabaco', 31: 'CI-Maíz 2da', 32: 'CI-Soja 2da'},
-            '23-24': {10: 'Maíz', 11: 'Soja 1ra', 12: 'Girasol', 13: 'Poroto', 14: 'Caña de azúcar', 15: 'Algodón', 16: 'Maní', 17: 'Arroz', 18: 'Sorgo GR', 19: 'Girasol-CV', 21: 'No agrícola', 22: 'No agrícola', 26: 'Papa', 28: 'Verdeo de Sorgo', 30: 'Tabaco', 31: 'CI-Maíz 2da', 32: 'CI-Soja 2da'}
-        }
+        cultivos_por_campana = CULTIVOS_POR_CAMPANA
         
         resultados_todas_campanas = []
-        area_pixeles = ee.Image.pixelArea().reproject('EPSG:5345', None, 30)
+        area_pixeles = crear_area_pixeles(proyeccion)
+        
+        # 💾 Campañas ya calculadas para esta geometría no vuelven a Earth Engine
+        areas_por_campana = {}
+        if usar_cache and not forzar_actualizacion:
+            for campana in capas:
+                areas_cache = leer_areas_cache(clave_geometria, campana, proyeccion)
+                if areas_cache is not None:
+                    areas_por_campana[campana] = areas_cache
+        
+        capas_faltantes = {c: capa for c, capa in capas.items() if c not in areas_por_campana}
+        
+        if capas_faltantes and motor == 'multibanda':
+            try:
+                celdas = dividir_en_celdas(poligonos_data)
+                if len(celdas) > 1:
+                    # 🧩 AOI grande: una reducción por celda de la grilla, en paralelo
+                    areas_nuevas = calcular_areas_teselado(capas_faltantes, celdas, area_pixeles, crs=crs)
+                else:
+                    # ⚡ Todas las campañas faltantes en un único round trip
+                    areas_nuevas = con_reintento_tilescale(
+                        lambda tile_scale: calcular_areas_todas_campanas(
+                            capas_faltantes, aoi.geometry(), area_pixeles, crs=crs, tile_scale=tile_scale
+                        )
+                    )
+                areas_por_campana.update(areas_nuevas)
+                if usar_cache:
+                    for campana, areas_m2 in areas_nuevas.items():
+                        cache_guardar(clave_cache_cultivos(clave_geometria, campana, proyeccion=proyeccion), areas_m2)
+                # Campañas sin salida en la reducción conjunta: se completan una por una
+                if len(areas_nuevas) < len(capas_faltantes):
+                    motor = 'histograma'
+            except Exception:
+                # Si la reducción conjunta falla (memoria/timeout) se cae a una por campaña
+                motor = 'histograma'
+        
+        capas_faltantes = {c: capa for c, capa in capas.items() if c not in areas_por_campana}
+        
+        if capas_faltantes and motor == 'histograma':
+            # ⚡ Una reducción agrupada por campaña, todas en paralelo
+            resultados_histogramas = ejecutar_en_paralelo([
+                lambda capa=capa: calcular_areas_por_clase(capa, aoi.geometry(), area_pixeles, crs=crs).get('groups').getInfo()
+                for capa in capas_faltantes.values()
+            ])
+            for campana, grupos in zip(capas_faltantes, resultados_histogramas):
+                # Ni un error ni una respuesta sin 'groups' se guardan como campaña sin cultivos
+                if grupos is None or isinstance(grupos, Exception):
+                    continue
+                areas_m2 = parsear_grupos_area(grupos)
+                areas_por_campana[campana] = areas_m2
+                if usar_cache:
+                    cache_guardar(clave_cache_cultivos(clave_geometria, campana, proyeccion=proyeccion), areas_m2)
         
         for j, campana in enumerate(campanas):
             if campana in capas:
@@ -673,35 +1464,18 @@ def analizar_cultivos_web(aoi):
                     cultivos = cultivos_por_campana[campana]
                     capa = capas[campana]
                     
-                    for cultivo_id, nombre_cultivo in cultivos.items():
-                        try:
-                            cultivo_id_int = int(cultivo_id)
-                            mascara_cultivo = capa.eq(cultivo_id_int)
-                            area_img = area_pixeles.multiply(mascara_cultivo)
-                            
-                            area_dict = area_img.reduceRegion(
-                                reducer=ee.Reducer.sum(),
-                                geometry=aoi.geometry(),
-                                scale=30,
-                                maxPixels=1e13,
-                                bestEffort=False,
-                                tileScale=4
-                            )
-                            
-                            area_value = area_dict.get('area')
-                            area_cultivo = ee.Number(area_value).getInfo()
-                            area_cultivo_ha = round(area_cultivo / 10000) if area_cultivo else 0
-                            porcentaje_cultivo = round((area_cultivo_ha / area_total) * 100) if area_total > 0 else 0
-                            
-                            resultados_todas_campanas.append({
-                                'Campaña': campana,
-                                'Cultivo': nombre_cultivo,
-                                'Área (ha)': area_cultivo_ha,
-                                'Porcentaje (%)': porcentaje_cultivo
-                            })
-                            
-                        except:
-                            continue
+                    if campana not in areas_por_campana and motor == 'por_cultivo':
+                        areas_m2, completo = calcular_areas_por_cultivo(capa, cultivos, aoi.geometry(), area_pixeles, crs=crs)
+                        areas_por_campana[campana] = areas_m2
+                        # Una campaña con cultivos faltantes no se guarda: se recalcula la próxima vez
+                        if not completo:
+                            st.warning(f"⚠️ Campaña {campana}: algunos cultivos no se pudieron calcular")
+                        elif usar_cache:
+                            cache_guardar(clave_cache_cultivos(clave_geometria, campana, proyeccion=proyeccion), areas_m2)
+                    
+                    resultados_todas_campanas.extend(
+                        construir_filas_campana(campana, cultivos, areas_por_campana[campana], area_total)
+                    )
                     
                     progress_bar.progress(0.4 + (j + 1) / len(campanas) * 0.5)
                     
@@ -717,6 +1491,113 @@ def analizar_cultivos_web(aoi):
         st.error(f"Error en análisis de cultivos: {e}")
         return None, 0, {}, {}
 
+def analizar_cultivos_por_campo(aoi, poligonos_data=None, forzar_actualizacion=False, proyeccion=None):
+    """
+    Analiza los cultivos campo por campo con un único reduceRegions sobre toda la colección.
+    Devuelve (df_campos, areas_por_campo, cultivos_por_campana): df_campos es el DataFrame
+    largo habitual más las columnas 'campo_numero' y 'renspa'; areas_por_campo mapea
+    numero → área total del campo en ha. Los tiles se piden bajo demanda desde el mapa.
+
+    Si se pasan los poligonos_data que originaron el AOI, cada campo usa el caché persistente,
+    el reduceRegions se limita a los campos que no estaban guardados y las áreas de los
+    campos se calculan localmente.
+    """
+    try:
+        geometry = aoi.geometry()
+        proyeccion = proyeccion or PROYECCION_CULTIVOS
+        area_pixeles = crear_area_pixeles(proyeccion)
+        
+        capas = {}
+        for campana in CAMPANAS_CULTIVOS:
+            try:
+                capas[campana] = crear_capa_combinada(campana, geometry, proyeccion)
+            except Exception:
+                continue
+        
+        if not capas:
+            return None, {}, {}
+        
+        # 💾 Resultados por campo ya guardados: {numero: (renspa, área ha, {campaña: {clase: m²}})}
+        claves_campos = {}
+        areas_locales = {}
+        resultados_campos = {}
+        for i, pol in enumerate(poligonos_data or []):
+            numero = pol.get('numero', i + 1)
+            claves_campos[numero] = hash_geometria([pol])
+            areas_locales[numero] = area_geodesica_m2(pol.get('coords')) / 10000
+            if forzar_actualizacion:
+                continue
+            
+            areas_cache = {c: leer_areas_cache(claves_campos[numero], c, proyeccion) for c in capas}
+            if all(a is not None for a in areas_cache.values()):
+                resultados_campos[numero] = (pol.get('renspa', ''), areas_locales[numero], areas_cache)
+        
+        if not poligonos_data or len(resultados_campos) < len(poligonos_data):
+            imagen, reductor, claves_salida = apilar_capas_campanas(capas, area_pixeles)
+            
+            campos = aoi
+            if resultados_campos:
+                campos = aoi.filter(ee.Filter.inList('numero', list(resultados_campos.keys())).Not())
+            
+            # Sin los polígonos de origen, el área de cada campo viaja en la misma respuesta
+            if not poligonos_data:
+                campos = campos.map(lambda f: f.set('area_total_m2', f.geometry().transform('EPSG:5345', 1).area(1)))
+            
+
+            stats_campos = imagen.reduceRegions(
+                collection=campos,
+                reducer=reductor,
+                crs=crs_reduccion(proyeccion),
+                scale=ESCALA_CULTIVOS,
+                tileScale=4
+            )
+            
+            propiedades = ['numero', 'renspa', 'area_total_m2'] + list(claves_salida.values())
+            features = stats_campos.select(propiedades, None, False).getInfo().get('features', [])
+            
+            for feature in features:
+                props = feature.get('properties', {})
+                numero = props.get('numero')
+                if numero in areas_locales:
+                    area_total = areas_locales[numero]
+                else:
+                    area_total = (props.get('area_total_m2') or 0) / 10000
+                areas_campo = {
+                    campana: parsear_grupos_area(props.get(clave))
+                    for campana, clave in claves_salida.items()
+                }
+                resultados_campos[numero] = (props.get('renspa', ''), area_total, areas_campo)
+                
+                # Un campo vacío trae 'groups' = []; sin la propiedad la reducción no llegó a ese campo
+                if numero in claves_campos:
+                    for campana, clave in claves_salida.items():
+                        if props.get(clave) is not None:
+                            cache_guardar(
+                                clave_cache_cultivos(claves_campos[numero], campana, proyeccion=proyeccion),
+                                areas_campo[campana]
+                            )
+        
+        filas = []
+        areas_por_campo = {}
+        
+        for numero, (renspa, area_total, areas_campo) in resultados_campos.items():
+            areas_por_campo[numero] = area_total
+            
+            for campana, areas_m2 in areas_campo.items():
+                filas_campana = construir_filas_campana(
+                    campana, CULTIVOS_POR_CAMPANA[campana], areas_m2, area_total
+                )
+                for fila in filas_campana:
+                    fila['campo_numero'] = numero
+                    fila['renspa'] = renspa
+                filas.extend(filas_campana)
+        
+        return pd.DataFrame(filas), areas_por_campo, CULTIVOS_POR_CAMPANA
+        
+    except Exception as e:
+        st.error(f"Error en análisis de cultivos por campo: {e}")
+        return None, {}, {}
+
 def generar_grafico_rotacion_web(df_resultados):
     """Genera el gráfico de rotación para la web"""
     try:
@@ -787,50 +1668,11 @@ def generar_grafico_rotacion_web(df_resultados):
         for col in columnas_campanas + ['Promedio']:
             df_rotacion_final = ajustar_a_100(df_rotacion_final, col)
         
-        colores_cultivos = {
-            # Cultivos con ID fijo en todas las campañas
-            "Maíz": "#0042ff",           # ID 10 - Azul
-            "Soja 1ra": "#339820",       # ID 11 - Verde  
-            "Girasol": "#FFFF00",        # ID 12 - Amarillo
-            "Poroto": "#f022db",         # ID 13 - Rosa/Fucsia
-            "Algodón": "#b7b9bd",        # ID 15 - Gris claro
-            "Maní": "#FFA500",           # ID 16 - Naranja
-            "Arroz": "#1d1e33",          # ID 17 - Azul oscuro
-            "Sorgo GR": "#FF0000",       # ID 18 - Rojo
-            "Barbecho": "#646b63",       # ID 21 - Gris oscuro
-            "No agrícola": "#e6f0c2",    # ID 22 - Beige claro
-            "No Agrícola": "#e6f0c2",    # ID 22 - Beige claro
-            "Papa": "#8A2BE2",           # ID 26 - Violeta
-            "Verdeo de Sorgo": "#800080", # ID 28 - Morado
-            "Tabaco": "#D2B48C",         # ID 30 - Marrón claro
-            "CI-Maíz 2da": "#87CEEB",    # ID 31 - Azul claro/celeste
-            "CI-Soja 2da": "#90ee90",    # ID 32 - Verde claro/fluor
-            "Soja 2da": "#90ee90",       # ID 32 - Verde claro/fluor
-            
-            # Cultivos que CAMBIAN de ID según campaña - TODOS usan ID 19 → color #a32102
-            "Girasol-CV": "#a32102",     # ID 19 en campañas 19-20, 20-21 - Rojo oscuro
-            "Caña de azúcar": "#a32102", # ID 19 en campañas 21-22, 22-23, 23-24 - Rojo oscuro
-            "Caña de Azúcar": "#a32102", # ID 19 en campañas 21-22, 22-23, 23-24 - Rojo oscuro
-            
-            # Variantes de nombres que pueden aparecer
-            "CI-Maíz": "#87CEEB",        # Variante de CI-Maíz 2da
-            "C inv - Maíz 2da": "#87CEEB", # Variante de CI-Maíz 2da
-            "CI-Soja": "#90ee90",        # Variante de CI-Soja 2da
-            "C inv - Soja 2da": "#90ee90"  # Variante de CI-Soja 2da
-        }
-        
-        color_default = '#999999'
-        
         df_plot = df_rotacion_final.set_index('Cultivo_Estandarizado')
         columnas_grafico = columnas_campanas + ['Promedio']
         df_temp = df_plot[columnas_grafico]
         
-        colores_ordenados = []
-        for cultivo in df_temp.index:
-            if cultivo in colores_cultivos:
-                colores_ordenados.append(colores_cultivos[cultivo])
-            else:
-                colores_ordenados.append(color_default)
+        colores_ordenados = [COLORES_CULTIVOS.get(cultivo, COLOR_DEFAULT) for cultivo in df_temp.index]
         
         fig, ax = plt.subplots(figsize=(14, 8))
         df_temp.T.plot(kind='bar', stacked=True, ax=ax, color=colores_ordenados, width=0.8)
@@ -1160,39 +2002,6 @@ def crear_mapa_con_tiles_engine(aoi, tiles_urls, df_resultados, cultivos_por_cam
         df_campana = df_resultados[df_resultados['Campaña'] == campana_seleccionada]
         
         if not df_campana.empty:
-            # Colores para la leyenda - EXACTOS de la paleta oficial JavaScript
-            colores_cultivos = {
-                # Cultivos con ID fijo en todas las campañas
-                "Maíz": "#0042ff",           # ID 10 - Azul
-                "Soja 1ra": "#339820",       # ID 11 - Verde  
-                "Girasol": "#FFFF00",        # ID 12 - Amarillo
-                "Poroto": "#f022db",         # ID 13 - Rosa/Fucsia
-                "Algodón": "#b7b9bd",        # ID 15 - Gris claro
-                "Maní": "#FFA500",           # ID 16 - Naranja
-                "Arroz": "#1d1e33",          # ID 17 - Azul oscuro
-                "Sorgo GR": "#FF0000",       # ID 18 - Rojo
-                "Barbecho": "#646b63",       # ID 21 - Gris oscuro
-                "No agrícola": "#e6f0c2",    # ID 22 - Beige claro
-                "No Agrícola": "#e6f0c2",    # ID 22 - Beige claro
-                "Papa": "#8A2BE2",           # ID 26 - Violeta
-                "Verdeo de Sorgo": "#800080", # ID 28 - Morado
-                "Tabaco": "#D2B48C",         # ID 30 - Marrón claro
-                "CI-Maíz 2da": "#87CEEB",    # ID 31 - Azul claro/celeste
-                "CI-Soja 2da": "#90ee90",    # ID 32 - Verde claro/fluor
-                "Soja 2da": "#90ee90",       # ID 32 - Verde claro/fluor
-                
-                # Cultivos que CAMBIAN de ID según campaña - TODOS usan ID 19 → color #a32102
-                "Girasol-CV": "#a32102",     # ID 19 en campañas 19-20, 20-21 - Rojo oscuro
-                "Caña de azúcar": "#a32102", # ID 19 en campañas 21-22, 22-23, 23-24 - Rojo oscuro
-                "Caña de Azúcar": "#a32102", # ID 19 en campañas 21-22, 22-23, 23-24 - Rojo oscuro
-                
-                # Variantes de nombres que pueden aparecer
-                "CI-Maíz": "#87CEEB",        # Variante de CI-Maíz 2da
-                "C inv - Maíz 2da": "#87CEEB", # Variante de CI-Maíz 2da
-                "CI-Soja": "#90ee90",        # Variante de CI-Soja 2da
-                "C inv - Soja 2da": "#90ee90"  # Variante de CI-Soja 2da
-            }
-            
             # Calcular área total
             try:
                 area_total_campana = float(df_campana['Área (ha)'].sum())
@@ -1243,7 +2052,7 @@ def crear_mapa_con_tiles_engine(aoi, tiles_urls, df_resultados, cultivos_por_cam
                         cultivo = str(row['Cultivo'])
                         area = float(row['Área (ha)'])
                         porcentaje = float(row['Porcentaje (%)'])
-                        color = colores_cultivos.get(cultivo, '#999999')
+                        color = COLORES_CULTIVOS.get(cultivo, COLOR_DEFAULT)
                         
                         bg_color = '#f9f9f9' if idx % 2 == 0 else '#ffffff'
                         
@@ -1509,6 +2318,69 @@ def crear_mapa_con_tiles_engine(aoi, tiles_urls, df_resultados, cultivos_por_cam
     
     return m
 
+def crear_mapa_riesgo_hidrico(aoi, url_tiles, ano_inicio, ano_fin, extension=None):
+    """
+    Mapa de riesgo hídrico: capa de frecuencia de inundación (años con agua por píxel)
+    sobre imagen satelital. Con la extensión local (oeste, sur, este, norte) se encuadra
+    sin consultar a Earth Engine; si falta, se usan los límites del AOI.
+    """
+    if extension is None:
+        try:
+            coords = aoi.geometry().bounds(maxError=1).getInfo()['coordinates'][0]
+            extension = extension_coords(coords)
+        except Exception:
+            extension = (-60.5, -34.5, -59.5, -33.5)  # Argentina por defecto
+    
+    oeste, sur, este, norte = extension
+    m = folium.Map(location=[(sur + norte) / 2, (oeste + este) / 2], zoom_start=13, tiles=None)
+    
+    folium.TileLayer(
+        "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}",
+        attr="Google Satellite",
+        name="Satelital",
+        control=True
+    ).add_to(m)
+    
+    folium.TileLayer(
+        "OpenStreetMap", 
+        name="Mapa",
+        control=True
+    ).add_to(m)
+    
+    folium.raster_layers.TileLayer(
+        tiles=url_tiles,
+        attr='Google Earth Engine',
+        name=f'🌊 Frecuencia de inundación {ano_inicio}-{ano_fin}',
+        overlay=True,
+        control=True,
+        opacity=0.8
+    ).add_to(m)
+    
+    m.fit_bounds([[sur, oeste], [norte, este]])
+    
+    # Leyenda: rampa de la paleta de 1 año al total de años del rango
+    n_anos = ano_fin - ano_inicio + 1
+    gradiente = ', '.join(f'#{color}' for color in PALETA_FRECUENCIA_INUNDACION)
+    legend_html = f"""
+    <div style="position: fixed; bottom: 30px; left: 10px; z-index: 9999;
+                background-color: rgba(255, 255, 255, 0.95); padding: 10px;
+                border: 2px solid #2c7fb8; border-radius: 8px;
+                font-family: Arial, sans-serif; font-size: 12px; width: 220px;">
+        <b>🌊 Años con agua por píxel</b><br>
+        <div style="height: 12px; margin: 6px 0; border: 1px solid #999;
+                    background: linear-gradient(to right, {gradiente});"></div>
+        <div style="display: flex; justify-content: space-between;">
+            <span>1 año</span><span>{n_anos} años</span>
+        </div>
+        <span style="color: #555;">{ano_inicio}-{ano_fin} · contorno azul: AOI</span>
+    </div>
+    """
+    m.get_root().html.add_child(folium.Element(legend_html))
+    
+    folium.LayerControl(collapsed=False).add_to(m)
+    
+    return m
+
 def crear_visor_cultivos_interactivo(aoi, df_resultados):
     """Crea un mapa interactivo de cultivos como fallback"""
     
@@ -1553,39 +2425,6 @@ def crear_visor_cultivos_interactivo(aoi, df_resultados):
         control=True
     ).add_to(m)
     
-    # Colores EXACTOS por nombre de cultivo (basado en tu JavaScript)
-    colores_cultivos = {
-        # Cultivos con ID fijo en todas las campañas
-        "Maíz": "#0042ff",           # ID 10 - Azul
-        "Soja 1ra": "#339820",       # ID 11 - Verde  
-        "Girasol": "#FFFF00",        # ID 12 - Amarillo
-        "Poroto": "#f022db",         # ID 13 - Rosa/Fucsia
-        "Algodón": "#b7b9bd",        # ID 15 - Gris claro
-        "Maní": "#FFA500",           # ID 16 - Naranja
-        "Arroz": "#1d1e33",          # ID 17 - Azul oscuro
-        "Sorgo GR": "#FF0000",       # ID 18 - Rojo
-        "Barbecho": "#646b63",       # ID 21 - Gris oscuro
-        "No agrícola": "#e6f0c2",    # ID 22 - Beige claro
-        "No Agrícola": "#e6f0c2",    # ID 22 - Beige claro
-        "Papa": "#8A2BE2",           # ID 26 - Violeta
-        "Verdeo de Sorgo": "#800080", # ID 28 - Morado
-        "Tabaco": "#D2B48C",         # ID 30 - Marrón claro
-        "CI-Maíz 2da": "#87CEEB",    # ID 31 - Azul claro/celeste
-        "CI-Soja 2da": "#90ee90",    # ID 32 - Verde claro/fluor
-        "Soja 2da": "#90ee90",       # ID 32 - Verde claro/fluor
-        
-        # Cultivos que CAMBIAN de ID según campaña - TODOS usan ID 19 → color #a32102
-        "Girasol-CV": "#a32102",     # ID 19 en campañas 19-20, 20-21 - Rojo oscuro
-        "Caña de azúcar": "#a32102", # ID 19 en campañas 21-22, 22-23, 23-24 - Rojo oscuro
-        "Caña de Azúcar": "#a32102", # ID 19 en campañas 21-22, 22-23, 23-24 - Rojo oscuro
-        
-        # Variantes de nombres que pueden aparecer
-        "CI-Maíz": "#87CEEB",        # Variante de CI-Maíz 2da
-        "C inv - Maíz 2da": "#87CEEB", # Variante de CI-Maíz 2da
-        "CI-Soja": "#90ee90",        # Variante de CI-Soja 2da
-        "C inv - Soja 2da": "#90ee90"  # Variante de CI-Soja 2da
-    }
-    
     # Crear grupos de capas por campaña
     campanas = sorted(df_resultados["Campaña"].unique())
     
@@ -1602,7 +2441,7 @@ def crear_visor_cultivos_interactivo(aoi, df_resultados):
             
             if df_cultivo["Área (ha)"].sum() > 0:  # Solo mostrar cultivos con área > 0
                 # Obtener color del cultivo
-                color = colores_cultivos.get(cultivo, "#999999")
+                color = COLORES_CULTIVOS.get(cultivo, COLOR_DEFAULT)
                 
                 # Crear polígono representativo (usaremos el AOI como base)
                 try:
@@ -1656,8 +2495,8 @@ def crear_visor_cultivos_interactivo(aoi, df_resultados):
     # Agregar colores de cultivos más comunes a la leyenda
     cultivos_principales = ["Maíz", "Soja 1ra", "Girasol", "No agrícola"]
     for cultivo in cultivos_principales:
-        if cultivo in colores_cultivos:
-            color = colores_cultivos[cultivo]
+        if cultivo in COLORES_CULTIVOS:
+            color = COLORES_CULTIVOS[cultivo]
             legend_html += f"""
             <div style="margin: 5px 0;">
                 <span style="background-color: {color}; width: 15px; height: 15px; 
@@ -1681,158 +2520,307 @@ def crear_visor_cultivos_interactivo(aoi, df_resultados):
 # FUNCIONES PARA CONSULTA POR CUIT
 # =====================================================================
 
-# Configuraciones para API SENASA
-API_BASE_URL = "https://aps.senasa.gob.ar/restapiprod/servicios/renspa"
-TIEMPO_ESPERA = 0.5
-
-def normalizar_cuit(cuit):
-    """Normaliza un CUIT a formato XX-XXXXXXXX-X"""
-    cuit_limpio = cuit.replace("-", "")
-    
-    if len(cuit_limpio) != 11:
-        raise ValueError(f"CUIT inválido: {cuit}. Debe tener 11 dígitos.")
-    
-    return f"{cuit_limpio[:2]}-{cuit_limpio[2:10]}-{cuit_limpio[10]}"
-
-def obtener_datos_por_cuit(cuit):
-    """Obtiene todos los campos asociados a un CUIT"""
+def procesar_campos_cuit(cuit, solo_activos=True):
+    """
+    Procesa campos de un CUIT y extrae polígonos para análisis. Las consultas a SENASA
+    (sesión keep-alive, limitador de tasa y detalles concurrentes) están en senasa_client.
+    """
     try:
-        url_base = f"{API_BASE_URL}/consultaPorCuit"
-        
-        todos_campos = []
-        offset = 0
-        limit = 10
-        has_more = True
-        
-        while has_more:
-            url = f"{url_base}?cuit={cuit}&offset={offset}"
-            
-            try:
-                response = requests.get(url, timeout=15)
-                response.raise_for_status()
-                resultado = response.json()
-                
-                if 'items' in resultado and resultado['items']:
-                    todos_campos.extend(resultado['items'])
-                    has_more = resultado.get('hasMore', False)
-                    offset += limit
-                else:
-                    has_more = False
-            
-            except Exception as e:
-                has_more = False
-                
-            time.sleep(TIEMPO_ESPERA)
-        
-        return todos_campos
+        poligonos_data, completo = senasa_client.procesar_campos_cuit(normalizar_cuit(cuit), solo_activos)
+        if not completo:
+            st.warning(
+                "⚠️ **Resultado parcial**: SENASA no respondió a todas las consultas y pueden faltar "
+                "campos o polígonos. Volvé a consultar el CUIT en unos minutos para completarlo."
+            )
+        return poligonos_data
     
     except Exception as e:
+        st.error(f"Error procesando CUIT {cuit}: {e}")
         return []
 
-def consultar_campo_detalle(renspa):
-    """Consulta los detalles de un campo específico para obtener el polígono"""
+# Datasets de la serie hídrica: su identificador forma parte de la clave de caché, así un
+# cambio de versión o de metodología nunca reutiliza resultados viejos
+DATASET_GSW_ANUAL = "JRC/GSW1_3/YearlyHistory"
+# Selección de escenas Sentinel-2 (todo se resuelve en el servidor):
+# - máscara 'scl' (clasificación de escena: nubes, sombras y cirros) o 's2cloudless' (SCL +
+#   probabilidad de nubes de COPERNICUS/S2_CLOUD_PROBABILITY, con un join por escena)
+# - se descartan escenas con más de S2_MAX_NUBES_AOI % de nubes dentro del AOI
+# - S2_MAX_ESCENAS_MES > 0 deja solo las escenas más despejadas de cada mes
+S2_MASCARA_NUBES = os.environ.get('VISU_S2_MASCARA_NUBES', 'scl')
+S2_MAX_NUBES_AOI = float(os.environ.get('VISU_S2_MAX_NUBES_AOI', 60))
+S2_MAX_ESCENAS_MES = int(os.environ.get('VISU_S2_MAX_ESCENAS_MES', 0))
+S2_PROBABILIDAD_NUBES_MAX = 40
+S2_ESCALA_NUBES_AOI = 100
+# SCL: 1 saturado/defectuoso, 3 sombra de nube, 8-9 nube media/alta probabilidad, 10 cirros
+CLASES_SCL_NUBES = [1, 3, 8, 9, 10]
+DESCRIPCION_MASCARA_NUBES = (
+    f"SCL (nubes, sombras y cirros) + s2cloudless (probabilidad < {S2_PROBABILIDAD_NUBES_MAX}%)"
+    if S2_MASCARA_NUBES == 's2cloudless' else "SCL (nubes, sombras y cirros)"
+)
+
+DATASET_S2_NDWI = (
+    f"COPERNICUS/S2_SR_HARMONIZED|NDWI>0.1|nubes<70|{S2_MASCARA_NUBES}"
+    f"|nubes_aoi<{S2_MAX_NUBES_AOI:g}|escenas_mes<={S2_MAX_ESCENAS_MES or 'todas'}"
+)
+CACHE_TTL_ANO_ABIERTO_DIAS = float(os.environ.get('VISU_CACHE_TTL_ANO_ABIERTO_DIAS', 7))
+
+def clave_cache_inundacion(clave_geometria, ano, escala_s2=10):
+    """Clave de caché del resultado hídrico de un año: geometría canónica + dataset (+ escala S2) + año"""
+    dataset = DATASET_GSW_ANUAL if ano <= 2019 else f"{DATASET_S2_NDWI}|{escala_s2}m"
+    return f"inundacion|{clave_geometria}|{dataset}|{ano}"
+
+def guardar_resultado_inundacion(clave_geometria, ano, resultado, escala_s2=10):
+    """Los años cerrados no cambian nunca (sin vencimiento); el año abierto se refresca por TTL"""
+    ttl_dias = CACHE_TTL_ANO_ABIERTO_DIAS if ano >= ANO_ABIERTO else 0
+    cache_guardar(clave_cache_inundacion(clave_geometria, ano, escala_s2), resultado, ttl_dias=ttl_dias)
+
+def clasificar_riesgo(riesgo_promedio):
+    """Categoría de riesgo hídrico según el porcentaje promedio de área inundada"""
+    if riesgo_promedio < 5:
+        return "Bajo"
+    elif riesgo_promedio < 15:
+        return "Medio"
+    elif riesgo_promedio < 30:
+        return "Alto"
+    return "Muy Alto"
+
+# Capas agregadas de GSW (1984-2020) para el screening rápido
+DATASET_GSW_AGREGADO = "JRC/GSW1_3/GlobalSurfaceWater"
+ANOS_GSW_AGREGADO = 2020 - 1984 + 1
+
+def analizar_riesgo_hidrico_rapido(aoi, umbral_inundacion, poligonos_data=None):
+    """
+    Screening rápido de riesgo hídrico con las capas agregadas de GSW en una sola reducción:
+    - recurrence: % de años con agua → riesgo promedio (área inundada esperada por año, la
+      misma magnitud que promedia la serie anual; occurrence mide la presencia dentro del
+      año y subestimaría campos que se inundan unos meses todos los años) y probabilidad
+      de superar el umbral en un año
+    - max_extent: agua alguna vez detectada → 'extension_maxima_historica' (unión de todos
+      los años, no el peor año: por eso no se informa como 'riesgo_maximo')
+    - seasonality: excluye el agua permanente (12 meses), igual que la serie anual (valor 2)
+    Las capas agregadas cubren siempre 1984-2020: no dependen de los años elegidos.
+    Devuelve el mismo diccionario que analizar_riesgo_hidrico_web, con 'metodo_rapido': True,
+    df_inundacion vacío, sin 'riesgo_maximo' y con 'area_por_recurrencia' ({% de años con
+    agua: ha}) en lugar de la serie. La probabilidad supone que las zonas de mayor
+    recurrencia se inundan juntas.
+    """
     try:
-        url = f"{API_BASE_URL}/consultaPorNumero?numero={renspa}"
+        geometry = aoi.geometry() if hasattr(aoi, 'geometry') else aoi
+        
+        area_aoi = area_aoi_ha(geometry, poligonos_data)
+        
+        gsw = ee.Image(DATASET_GSW_AGREGADO)
+        no_permanente = gsw.select('seasonality').unmask(0).lt(12)
+        area_ha = ee.Image.pixelArea().divide(10000)
+        
+        # Dos reductores encadenados, cada uno con sus propias bandas (mismo patrón que apilar_capas_campanas)
+        imagen = ee.Image.cat([
+            area_ha.rename('area_recurrencia'), gsw.select('recurrence').updateMask(no_permanente),
+            area_ha.multiply(gsw.select('max_extent').unmask(0)).multiply(no_permanente).rename('area_maxima')
+        ])
+        reductor = ee.Reducer.sum().group(groupField=1, groupName='clase') \
+            .combine(ee.Reducer.sum(), outputPrefix='max_', sharedInputs=False)
+        
+        stats = imagen.reduceRegion(
+            reducer=reductor,
+            geometry=geometry,
+            scale=30,
+            maxPixels=1e13,
+            tileScale=4
+        ).getInfo()
+        
+        recurrencia = parsear_grupos_area(stats.get('groups'))
+        area_maxima = stats.get('max_sum') or 0
+        
+        riesgo_promedio = sum(area * valor for valor, area in recurrencia.items()) / area_aoi if area_aoi > 0 else 0
+        extension_maxima = area_maxima / area_aoi * 100 if area_aoi > 0 else 0
+        
+        # Área acumulada con recurrencia ≥ r: la mayor r cuya área supera el umbral es la probabilidad
+        probabilidad_evento = 0
+        if recurrencia and area_aoi > 0:
+            valores = np.array(sorted(recurrencia, reverse=True), dtype=float)
+            porcentaje_acumulado = np.cumsum([recurrencia[int(v)] for v in valores]) / area_aoi * 100
+            superan = valores[porcentaje_acumulado >= umbral_inundacion]
+            probabilidad_evento = float(superan.max()) if superan.size else 0
+        
+        eventos_significativos = int(round(probabilidad_evento / 100 * ANOS_GSW_AGREGADO))
+        
+        return {
+            'df_inundacion': pd.DataFrame(columns=[
+                'Año', 'Área Total (ha)', 'Área Inundada (ha)', 'Porcentaje Inundación', 'Sensor', 'Imágenes',
+                'Imágenes Descartadas'
+            ]),
+            'area_total_ha': area_aoi,
+            'riesgo_promedio': riesgo_promedio,
+            'extension_maxima_historica': extension_maxima,
+            'categoria_riesgo': clasificar_riesgo(riesgo_promedio) if extension_maxima > 0 else "Sin riesgo",
+            'probabilidad_evento': probabilidad_evento,
+            'años_analizados': ANOS_GSW_AGREGADO,
+            'años_con_datos': ANOS_GSW_AGREGADO,
+            'resultados_por_año': {},
+            'eventos_significativos': eventos_significativos,
+            'area_por_recurrencia': recurrencia,
+            'metodo_rapido': True
+        }
         
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return data
     except Exception as e:
+        st.error(f"❌ Error en screening rápido: {str(e)}")
         return None
 
-def extraer_coordenadas_senasa(poligono_str):
-    """Extrae coordenadas de un string de polígono de SENASA"""
-    if not poligono_str or not isinstance(poligono_str, str):
-        return None
+# Años por pedido de la serie hídrica: lotes más chicos entregan resultados antes y acotan
+# lo que se pierde si un pedido falla; más grandes hacen menos viajes a Earth Engine
+ANOS_POR_LOTE_RIESGO = int(os.environ.get('VISU_ANOS_POR_LOTE_RIESGO', 10))
+
+def analizar_lote_hidrico(geometry, anos, gsw, area_aoi, escala_s2=10):
+    """
+    Analiza un lote de años de una misma fuente (GSW o Sentinel-2) en un solo pedido; si
+    falla, vuelve a un pedido por año. Devuelve {año: resultado, None o excepción}.
+    """
+    if anos[0] <= 2019:
+        serie = lambda: analizar_gsw_serie(geometry, anos, gsw, area_aoi)
+        por_ano = lambda ano: analizar_gsw_ano(geometry, ano, gsw, area_aoi)
+    else:
+        serie = lambda: analizar_sentinel2_serie(geometry, anos, area_aoi, escala_s2)
+        por_ano = lambda ano: analizar_sentinel2_ndwi_ano(geometry, ano, area_aoi, escala_s2)
+    
+    try:
+        return serie()
+    except Exception:
+        return dict(zip(anos, ejecutar_en_paralelo([lambda ano=ano: por_ano(ano) for ano in anos])))
+
+def iterar_riesgo_hidrico(geometry, anos, area_aoi, escala_s2=10, clave_geometria=None, forzar_actualizacion=False):
+    """
+    Generador de resultados hídricos año por año, a medida que están disponibles. Entrega
+    {'ano', 'resultado' (None si no hubo datos), 'origen': 'cache' | 'calculado' | 'error',
+    'error' (solo si falló)}. Los años en caché salen primero; los pendientes se piden en
+    lotes de ANOS_POR_LOTE_RIESGO años en paralelo y cada lote se entrega apenas termina,
+    así un lote que falla o vence no afecta a los años ya entregados.
+    """
+    pendientes = []
+    for ano in anos:
+        guardado = None
+        if clave_geometria and not forzar_actualizacion:
+            guardado = cache_obtener(clave_cache_inundacion(clave_geometria, ano, escala_s2))
+        if guardado is not None:
+            yield {'ano': ano, 'resultado': guardado, 'origen': 'cache'}
+        else:
+            pendientes.append(ano)
     
-    coord_pattern = r'\(([-\d\.]+),([-\d\.]+)\)'
-    coord_pairs = re.findall(coord_pattern, poligono_str)
+    # Los lotes no mezclan fuentes: cada uno viaja como una sola serie GSW o Sentinel-2
+    gsw = ee.ImageCollection(DATASET_GSW_ANUAL)
+    lotes = [
+        fuente[i:i + ANOS_POR_LOTE_RIESGO]
+        for fuente in ([ano for ano in pendientes if ano <= 2019], [ano for ano in pendientes if ano >= 2020])
+        for i in range(0, len(fuente), ANOS_POR_LOTE_RIESGO)
+    ]
+    tareas = [lambda lote=lote: analizar_lote_hidrico(geometry, lote, gsw, area_aoi, escala_s2) for lote in lotes]
     
-    if not coord_pairs:
+    for indice, resultado_lote in ejecutar_a_medida(tareas):
+        for ano in lotes[indice]:
+            resultado = resultado_lote if isinstance(resultado_lote, Exception) else resultado_lote.get(ano)
+            if isinstance(resultado, Exception):
+                yield {'ano': ano, 'resultado': None, 'origen': 'error', 'error': str(resultado) or type(resultado).__name__}
+                continue
+            # Solo se guardan años con datos: los fallidos se reintentan en el próximo análisis
+            if resultado and clave_geometria:
+                guardar_resultado_inundacion(clave_geometria, ano, resultado, escala_s2)
+            yield {'ano': ano, 'resultado': resultado, 'origen': 'calculado'}
+
+def resultado_sin_datos(ano):
+    """Resultado de un año sin imágenes ni datos de la fuente correspondiente"""
+    return {
+        'area_inundada': 0,
+        'porcentaje': 0,
+        'sensor': 'GSW (sin datos)' if ano <= 2019 else 'Sentinel-2 (sin datos)',
+        'imagenes': 0
+    }
+
+def resumir_riesgo_hidrico(resultados_por_ano, area_aoi, umbral_inundacion, escala_s2=10, anos_fallidos=None):
+    """
+    Estadísticas de riesgo a partir de los años completados. Los años fallidos no cuentan
+    como años secos: quedan fuera de las estadísticas y se informan en 'años_fallidos'
+    ('parcial' es True si hubo alguno). Devuelve None si no se completó ningún año.
+    """
+    if not resultados_por_ano:
         return None
     
-    coords_geojson = []
-    for lat_str, lon_str in coord_pairs:
-        try:
-            lat = float(lat_str)
-            lon = float(lon_str)
-            coords_geojson.append([lon, lat])
-        except ValueError:
-            continue
+    anos_fallidos = sorted(anos_fallidos or [])
+    resultados_por_ano = dict(sorted(resultados_por_ano.items()))
     
-    if len(coords_geojson) >= 3:
-        if coords_geojson[0] != coords_geojson[-1]:
-            coords_geojson.append(coords_geojson[0])
-        
-        return coords_geojson
+    df_inundacion = pd.DataFrame([
+        {
+            'Año': ano,
+            'Área Total (ha)': area_aoi,
+            'Área Inundada (ha)': datos['area_inundada'],
+            'Porcentaje Inundación': datos['porcentaje'],
+            'Sensor': datos['sensor'],
+            'Imágenes': datos['imagenes'],
+            'Imágenes Descartadas': datos.get('imagenes_disponibles', datos['imagenes']) - datos['imagenes']
+        }
+        for ano, datos in resultados_por_ano.items()
+    ])
     
-    return None
-
-def procesar_campos_cuit(cuit, solo_activos=True):
-    """Procesa campos de un CUIT y extrae polígonos para análisis"""
-    try:
-        cuit_normalizado = normalizar_cuit(cuit)
-        campos = obtener_datos_por_cuit(cuit_normalizado)
-        
-        if not campos:
-            return []
-        
-        # Filtrar según la opción seleccionada
-        if solo_activos:
-            campos_a_procesar = [c for c in campos if c.get('fecha_baja') is None]
-        else:
-            campos_a_procesar = campos
-        
-        # Procesar polígonos
-        poligonos_data = []
-        
-        for i, campo in enumerate(campos_a_procesar):
-            renspa = campo['renspa']
-            
-            # Primero intentar con los datos que ya tenemos
-            coords = None
-            if 'poligono' in campo and campo['poligono']:
-                coords = extraer_coordenadas_senasa(campo['poligono'])
-            
-            # Si no tenemos polígono, consultar detalle
-            if not coords:
-                resultado_detalle = consultar_campo_detalle(renspa)
-                if resultado_detalle and 'items' in resultado_detalle and resultado_detalle['items']:
-                    item_detalle = resultado_detalle['items'][0]
-                    if 'poligono' in item_detalle and item_detalle['poligono']:
-                        coords = extraer_coordenadas_senasa(item_detalle['poligono'])
-                
-                time.sleep(TIEMPO_ESPERA)
-            
-            if coords:
-                poligono_data = {
-                    'nombre': f"Campo_{i+1}_{campo.get('titular', 'Sin_titular')}",
-                    'coords': coords,
-                    'numero': i + 1,
-                    'archivo_origen': f'CUIT_{cuit_normalizado}',
-                    'kml_origen': f'Campo_{renspa}',
-                    'titular': campo.get('titular', ''),
-                    'localidad': campo.get('localidad', ''),
-                    'superficie': campo.get('superficie', 0),
-                    'renspa': renspa
-                }
-                poligonos_data.append(poligono_data)
-        
-        return poligonos_data
+    porcentajes = [r['porcentaje'] for r in resultados_por_ano.values() if r['porcentaje'] > 0]
     
-    except Exception as e:
-        st.error(f"Error procesando CUIT {cuit}: {e}")
-        return []
+    resumen = {
+        'df_inundacion': df_inundacion,
+        'area_total_ha': area_aoi,
+        'riesgo_promedio': 0,
+        'riesgo_maximo': 0,
+        'categoria_riesgo': "Sin riesgo",
+        'probabilidad_evento': 0,
+        'años_analizados': len(resultados_por_ano) + len(anos_fallidos),
+        'años_con_datos': len(resultados_por_ano),
+        'resultados_por_año': resultados_por_ano,
+        'eventos_significativos': 0,
+        'metodo_rapido': False,
+        'escala_sentinel2': escala_s2,
+        'años_fallidos': anos_fallidos,
+        'parcial': bool(anos_fallidos)
+    }
+    
+    if porcentajes:
+        riesgo_promedio = np.mean(porcentajes)
+        eventos_significativos = len([p for p in porcentajes if p >= umbral_inundacion])
+        resumen.update({
+            'riesgo_promedio': riesgo_promedio,
+            'riesgo_maximo': np.max(porcentajes),
+            'categoria_riesgo': clasificar_riesgo(riesgo_promedio),
+            'probabilidad_evento': eventos_significativos / len(resultados_por_ano) * 100,
+            'eventos_significativos': eventos_significativos
+        })
+    
+    return resumen
 
-def analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion):
+def analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion, poligonos_data=None,
+                                forzar_actualizacion=False, rapido=False, refinamiento_progresivo=False):
     """
     Analiza riesgo de inundación usando METODOLOGÍA CIENTÍFICA COMPLETA:
     - JRC Global Surface Water (GSW) 1984-2019: Estándar mundial
     - Sentinel-2 NDWI > 0.1 (2020-2025): Umbral científico validado
     - Análisis temporal completo: 1984-2025 (41 años)
     - Basado en código de Google Earth Engine y repositorios de NOAA
+
+    Con poligonos_data el área del AOI se calcula localmente (salvo campos superpuestos)
+    y los resultados por año se guardan en el caché persistente: los años históricos no
+    se vuelven a calcular (forzar_actualizacion ignora lo guardado).
+
+    rapido=True usa el screening de capas agregadas (analizar_riesgo_hidrico_rapido), que
+    cubre siempre 1984-2020 e ignora anos_analisis.
+
+    Sentinel-2 se reduce a la escala que elige elegir_escala_sentinel2 según el área. Con
+    refinamiento_progresivo se lanza a la vez una pasada a la escala más gruesa, que se
+    muestra como preliminar apenas llega y desaparece cuando termina la de la escala final
+    (la misma, acotada por el presupuesto de píxeles). La escala final se informa en
+    'escala_sentinel2'.
+
+    Los años se consumen de iterar_riesgo_hidrico a medida que terminan, con un gráfico
+    que crece durante el cálculo. Si un año falla o vence, los completados se conservan
+    y el resultado se marca como 'parcial' con la lista de 'años_fallidos'.
     """
+    if rapido:
+        return analizar_riesgo_hidrico_rapido(aoi, umbral_inundacion, poligonos_data)
+    
     try:
         # Obtener geometría del AOI
         if hasattr(aoi, 'geometry'):
@@ -1843,8 +2831,8 @@ def analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion):
         st.markdown("### 🔬 **Metodología Científica Completa (GSW + Sentinel-2)**")
         st.markdown("**📊 JRC Global Surface Water (1984-2019) + Sentinel-2 NDWI (2020-2025)**")
         
-        # Calcular área del AOI
-        area_aoi = geometry.area().divide(10000).getInfo()  # en hectáreas
+        # Calcular área del AOI en hectáreas (una sola vez, compartida por todos los años)
+        area_aoi = area_aoi_ha(geometry, poligonos_data)
         
         st.markdown(f"📏 Área total del polígono: {area_aoi:.1f} ha")
         
@@ -1855,16 +2843,7 @@ def analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion):
         anos_completos = list(range(ano_inicio, ano_fin + 1))
         st.markdown(f"📅 Analizando {len(anos_completos)} años: {ano_inicio}-{ano_fin}")
         
-        # Diccionario para almacenar resultados
-        resultados_por_ano = {}
-        
-        # FASE 1: ANÁLISIS CON JRC GLOBAL SURFACE WATER (1984-2019)
-        st.markdown("### 🌍 **Fase 1: JRC Global Surface Water (1984-2019)**")
-        
-        # Cargar dataset GSW
-        gsw = ee.ImageCollection("JRC/GSW1_3/YearlyHistory")
-        
-        # DEBUG: Mostrar años que van a GSW vs Sentinel-2
+        # Años que van a GSW vs Sentinel-2
         anos_gsw = [ano for ano in anos_completos if ano <= 2019]
         anos_s2 = [ano for ano in anos_completos if ano >= 2020]
         
@@ -1873,271 +2852,691 @@ def analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion):
         if anos_s2:
             st.info(f"🛰️ **Años con Sentinel-2**: {len(anos_s2)} años ({min(anos_s2)}-{max(anos_s2)})")
         
-        # Analizar cada año con GSW
-        for ano in anos_completos:
-            if ano <= 2019:  # Solo GSW hasta 2019
-                st.markdown(f"🔍 Analizando año {ano} con **JRC GSW**...")
-                resultado = analizar_gsw_ano(geometry, ano, gsw)
-                if resultado:
-                    resultados_por_ano[ano] = resultado
-                    # DEBUG: Mostrar valores obtenidos
-                    st.markdown(f"   📊 **GSW {ano}**: {resultado['area_inundada']:.1f} ha ({resultado['porcentaje']:.1f}%)")
-        else:
-                    resultados_por_ano[ano] = {
-                        'area_inundada': 0,
-                        'porcentaje': 0,
-                        'sensor': 'GSW (sin datos)',
-                        'imagenes': 0
-                    }
-                    st.markdown(f"   ⚪ **GSW {ano}**: Sin datos")
-        
-        # FASE 2: ANÁLISIS CON SENTINEL-2 NDWI (2020-2025)
-        st.markdown("### 🛰️ **Fase 2: Sentinel-2 NDWI (2020-2025)**")
-        
-        # Analizar cada año con Sentinel-2
-        for ano in anos_completos:
-            if ano >= 2020:  # Solo Sentinel-2 desde 2020
-                st.markdown(f"🔍 Analizando año {ano} con **Sentinel-2 NDWI**...")
-                resultado = analizar_sentinel2_ndwi_ano(geometry, ano)
-                if resultado:
-                    resultados_por_ano[ano] = resultado
-                    # DEBUG: Mostrar valores obtenidos
-                    st.markdown(f"   📊 **S2 {ano}**: {resultado['area_inundada']:.1f} ha ({resultado['porcentaje']:.1f}%) - {resultado['imagenes']} imágenes")
-                else:
-                    resultados_por_ano[ano] = {
-                        'area_inundada': 0,
-                        'porcentaje': 0,
-                        'sensor': 'Sentinel-2 (sin datos)',
-                        'imagenes': 0
-                    }
-                    st.markdown(f"   ⚪ **S2 {ano}**: Sin datos")
-        
-        # Procesar resultados y calcular estadísticas
-        if resultados_por_ano:
-            # Crear DataFrame para análisis
-            df_inundacion = pd.DataFrame([
-                {
-                    'Año': ano,
-                    'Área Total (ha)': area_aoi,
-                    'Área Inundada (ha)': datos['area_inundada'],
-                    'Porcentaje Inundación': datos['porcentaje'],
-                    'Sensor': datos['sensor'],
-                    'Imágenes': datos['imagenes']
-                }
-                for ano, datos in resultados_por_ano.items()
-            ])
-            
-            # Calcular estadísticas
-            areas_inundadas = [r['area_inundada'] for r in resultados_por_ano.values() if r['area_inundada'] > 0]
-            porcentajes = [r['porcentaje'] for r in resultados_por_ano.values() if r['porcentaje'] > 0]
-            
-            if areas_inundadas:
-                riesgo_promedio = np.mean(porcentajes)
-                riesgo_maximo = np.max(porcentajes)
-                eventos_significativos = len([p for p in porcentajes if p >= umbral_inundacion])
-                probabilidad_evento = eventos_significativos / len(anos_completos) * 100
-                
-                # Clasificar riesgo
-                if riesgo_promedio < 5:
-                    categoria_riesgo = "Bajo"
-                elif riesgo_promedio < 15:
-                    categoria_riesgo = "Medio"
-                elif riesgo_promedio < 30:
-                    categoria_riesgo = "Alto"
+        # Escala de Sentinel-2: la más fina que entra en el presupuesto de píxeles (también al refinar)
+        escala_s2 = elegir_escala_sentinel2(area_aoi)
+        if anos_s2:
+            st.markdown(f"📐 Escala Sentinel-2: {escala_s2} m")
+        
+        # 💾 Años ya calculados para esta geometría no vuelven a Earth Engine
+        clave_geometria = hash_geometria(poligonos_data) if poligonos_data else None
+        
+        # ⏳ Pasada a escala gruesa en paralelo con la final: se muestra apenas llega
+        preliminar = st.empty()
+        anos_s2_pendientes = [
+            ano for ano in anos_s2
+            if forzar_actualizacion or not clave_geometria
+            or cache_obtener(clave_cache_inundacion(clave_geometria, ano, escala_s2)) is None
+        ]
+        escala_gruesa = ESCALAS_SENTINEL2[-1]
+        pasada_gruesa = None
+        if refinamiento_progresivo and anos_s2_pendientes and escala_gruesa > escala_s2:
+            pasada_gruesa = iniciar_en_segundo_plano(
+                lambda: analizar_sentinel2_serie(geometry, anos_s2_pendientes, area_aoi, escala_gruesa)
+            )
+        
+        def mostrar_preliminar():
+            """Muestra la pasada gruesa una sola vez, cuando terminó (sin esperarla)"""
+            nonlocal pasada_gruesa
+            if pasada_gruesa is None or not pasada_gruesa.done():
+                return
+            try:
+                serie_gruesa = pasada_gruesa.result() or {}
+            except Exception:
+                serie_gruesa = {}
+            pasada_gruesa = None
+            lineas = [
+                f"- S2 {ano}: {r['area_inundada']:.1f} ha ({r['porcentaje']:.1f}%)"
+                for ano, r in serie_gruesa.items() if r
+            ]
+            if lineas:
+                preliminar.markdown(
+                    f"⏳ **Resultado preliminar a {escala_gruesa} m** (refinando a {escala_s2} m...)\n\n" + "\n".join(lineas)
+                )
+        
+        # 📈 Los años llegan a medida que terminan: el gráfico crece mientras sigue el cálculo
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+        grafico = st.empty()
+        
+        resultados_por_ano = {}
+        anos_fallidos = []
+        anos_cache = 0
+        
+        eventos = iterar_riesgo_hidrico(
+            geometry, anos_completos, area_aoi, escala_s2, clave_geometria, forzar_actualizacion
+        )
+        
+        try:
+            for procesados, evento in enumerate(eventos, start=1):
+                mostrar_preliminar()
+                ano = evento['ano']
+                if evento['origen'] == 'error':
+                    anos_fallidos.append(ano)
+                    st.warning(f"⚠️ **{ano}**: no se pudo calcular ({evento['error']})")
                 else:
-                    categoria_riesgo = "Muy Alto"
+                    resultados_por_ano[ano] = evento['resultado'] or resultado_sin_datos(ano)
+                    anos_cache += evento['origen'] == 'cache'
                 
-                st.success(f"🎉 **Análisis completado**: {len(resultados_por_ano)} años analizados")
-                st.info(f"📊 **Riesgo promedio**: {riesgo_promedio:.1f}% - Categoría: {categoria_riesgo}")
+                progress_bar.progress(procesados / len(anos_completos))
+                status_text.text(f"🔍 {procesados}/{len(anos_completos)} años procesados - último: {ano}")
                 
-                return {
-                    'df_inundacion': df_inundacion,
-                    'area_total_ha': area_aoi,
-                    'riesgo_promedio': riesgo_promedio,
-                    'riesgo_maximo': riesgo_maximo,
-                    'categoria_riesgo': categoria_riesgo,
-                    'probabilidad_evento': probabilidad_evento,
-                    'años_analizados': len(anos_completos),
-                    'años_con_datos': len(resultados_por_ano),
-                    'resultados_por_año': resultados_por_ano,
-                    'eventos_significativos': eventos_significativos
-                }
-            else:
-                st.info("ℹ️ **No se detectaron inundaciones significativas** en el período analizado")
-                return {
-                    'df_inundacion': df_inundacion,
-                    'area_total_ha': area_aoi,
-                    'riesgo_promedio': 0,
-                    'riesgo_maximo': 0,
-                    'categoria_riesgo': "Sin riesgo",
-                    'probabilidad_evento': 0,
-                    'años_analizados': len(anos_completos),
-                    'años_con_datos': len(resultados_por_ano),
-                    'resultados_por_año': resultados_por_ano,
-                    'eventos_significativos': 0
-                }
-        else:
+                if resultados_por_ano:
+                    serie = pd.Series(
+                        {ano: r['porcentaje'] for ano, r in sorted(resultados_por_ano.items())},
+                        name='Porcentaje Inundación'
+                    )
+                    grafico.bar_chart(serie)
+        except Exception as e:
+            # Un fallo a mitad de camino no descarta los años ya completados
+            anos_fallidos += [ano for ano in anos_completos if ano not in resultados_por_ano and ano not in anos_fallidos]
+            st.warning(f"⚠️ El análisis se interrumpió: {str(e)}")
+        finally:
+            eventos.close()
+            # La preliminar ya no hace falta: si todavía no salió, no llega a Earth Engine
+            if pasada_gruesa is not None:
+                pasada_gruesa.cancel()
+        
+        preliminar.empty()
+        progress_bar.empty()
+        status_text.empty()
+        
+        if anos_cache:
+            st.markdown(f"💾 {anos_cache} años recuperados de análisis anteriores")
+        
+        escenas = {ano: r for ano, r in resultados_por_ano.items() if 'imagenes_disponibles' in r}
+        if escenas:
+            st.markdown("🛰️ Escenas Sentinel-2 usadas/disponibles: " + " · ".join(
+                f"{ano}: {r['imagenes']}/{r['imagenes_disponibles']}" for ano, r in sorted(escenas.items())
+            ))
+        
+        resultado = resumir_riesgo_hidrico(resultados_por_ano, area_aoi, umbral_inundacion, escala_s2, anos_fallidos)
+        if resultado is None:
             st.warning("⚠️ **No se pudieron procesar los datos** para ningún año")
             return None
         
+        if anos_fallidos:
+            st.warning(
+                f"⚠️ **Resultado parcial**: {len(resultados_por_ano)} de {len(anos_completos)} años completados "
+                f"(sin datos: {', '.join(map(str, sorted(anos_fallidos)))})"
+            )
+        
+        if resultado['riesgo_maximo'] > 0:
+            st.success(f"🎉 **Análisis completado**: {len(resultados_por_ano)} años analizados")
+            st.info(f"📊 **Riesgo promedio**: {resultado['riesgo_promedio']:.1f}% - Categoría: {resultado['categoria_riesgo']}")
+        else:
+            st.info("ℹ️ **No se detectaron inundaciones significativas** en el período analizado")
+        
+        return resultado
+        
     except Exception as e:
         st.error(f"❌ Error en análisis: {str(e)}")
         return None
 
-def analizar_gsw_ano(geometry, ano, gsw):
+def crear_bandas_agua_anuales(geometry, anos, gsw):
     """
-    Analiza un año específico con JRC Global Surface Water
-    Metodología: GSW valor 2 = agua permanente/estacional
+    Imagen multibanda con una banda de agua (0/1) por año: GSW valor 2 hasta 2019 y
+    NDWI máximo > 0.1 de Sentinel-2 desde 2020. Los años S2 sin imágenes quedan enmascarados.
+    """
+    bandas = []
+    for ano in anos:
+        if ano <= 2019:
+            agua = gsw.filter(ee.Filter.eq('year', ano)).first().eq(2)
+        else:
+            fecha_fin = FECHA_CORTE_ANO_ABIERTO if ano == ANO_ABIERTO else f"{ano}-12-31"
+            coleccion = coleccion_sentinel2(geometry, f"{ano}-01-01", fecha_fin)
+            agua = ee.Image(ee.Algorithms.If(
+                coleccion.size().gt(0),
+                coleccion.map(agregar_ndwi_enmascarado).select('NDWI').max().gt(0.1),
+                ee.Image.constant(0).selfMask()
+            ))
+        bandas.append(agua.rename(f'agua_{ano}'))
+    
+    return ee.Image.cat(bandas)
+
+def analizar_riesgo_hidrico_por_campo(aoi, anos_analisis, umbral_inundacion, poligonos_data):
+    """
+    Riesgo hídrico campo por campo: un único reduceRegions de las bandas de agua anuales
+    sobre la colección de campos devuelve la matriz campo × año, y el riesgo promedio,
+    máximo, la probabilidad de evento y la categoría de cada campo se calculan con NumPy.
+    Devuelve {'df_campos': resumen por campo, 'matriz_inundacion': % inundado campo × año,
+    'escala': m} o None si falla.
     """
     try:
-        # Filtrar GSW por año
-        year_img = gsw.filter(ee.Filter.eq('year', ano)).first()
-        
-        # Verificar si hay imagen
-        if not year_img:
+        ano_inicio = max(1984, anos_analisis[0])
+        ano_fin = min(ANO_ABIERTO, anos_analisis[1])
+        anos = list(range(ano_inicio, ano_fin + 1))
+        
+        escala = elegir_escala_sentinel2(suma_areas_ha(poligonos_data))
+        agua_ha = crear_bandas_agua_anuales(aoi.geometry(), anos, ee.ImageCollection(DATASET_GSW_ANUAL)) \
+            .multiply(ee.Image.pixelArea()).divide(10000)
+        
+        propiedades = ['numero'] + [f'agua_{ano}' for ano in anos]
+        features = agua_ha.reduceRegions(
+            collection=aoi,
+            reducer=ee.Reducer.sum().forEachBand(agua_ha),
+            scale=escala,
+            tileScale=4
+        ).select(propiedades, None, False).getInfo().get('features', [])
+        
+        areas_inundadas = {}
+        for feature in features:
+            props = feature.get('properties', {})
+            areas_inundadas[props.get('numero')] = [props.get(f'agua_{ano}') or 0 for ano in anos]
+        
+        campos = [
+            (pol.get('numero', i + 1), pol) for i, pol in enumerate(poligonos_data)
+            if pol.get('numero', i + 1) in areas_inundadas
+        ]
+        if not campos:
             return None
         
-        # Crear máscara para áreas con agua (valor 2 = agua)
-        water_mask = year_img.eq(2)
+        # Matriz campo × año en hectáreas y porcentaje del área de cada campo
+        matriz_ha = np.array([areas_inundadas[numero] for numero, _ in campos], dtype=float)
+        areas = np.array([area_geodesica_m2(pol.get('coords')) / 10000 for _, pol in campos])
+        porcentajes = np.divide(
+            matriz_ha * 100, areas[:, None], out=np.zeros_like(matriz_ha), where=areas[:, None] > 0
+        )
+        
+        # Mismas métricas que el análisis del AOI completo: el promedio considera los años con agua
+        anos_con_agua = (porcentajes > 0).sum(axis=1)
+        riesgo_promedio = np.divide(
+            porcentajes.sum(axis=1), anos_con_agua, out=np.zeros(len(campos)), where=anos_con_agua > 0
+        )
+        riesgo_maximo = porcentajes.max(axis=1)
+        eventos_significativos = (porcentajes >= umbral_inundacion).sum(axis=1)
+        probabilidad_evento = eventos_significativos / len(anos) * 100
+        
+        df_campos = pd.DataFrame({
+            'Campo': [numero for numero, _ in campos],
+            'Nombre': [pol.get('nombre', '') for _, pol in campos],
+            'RENSPA': [pol.get('renspa', '') for _, pol in campos],
+            'Área (ha)': areas.round(1),
+            'Riesgo Promedio (%)': riesgo_promedio.round(1),
+            'Riesgo Máximo (%)': riesgo_maximo.round(1),
+            'Probabilidad Evento (%)': probabilidad_evento.round(1),
+            'Eventos Significativos': eventos_significativos,
+            'Categoría': [
+                clasificar_riesgo(riesgo) if con_agua else "Sin riesgo"
+                for riesgo, con_agua in zip(riesgo_promedio, anos_con_agua)
+            ]
+        }).sort_values('Riesgo Promedio (%)', ascending=False)
+        
+        matriz_inundacion = pd.DataFrame(
+            porcentajes.round(1),
+            index=pd.Index([numero for numero, _ in campos], name='Campo'),
+            columns=anos
+        )
+        
+        return {
+            'df_campos': df_campos,
+            'matriz_inundacion': matriz_inundacion,
+            'escala': escala
+        }
         
-        # Calcular área en hectáreas
-        area_inundada = water_mask.multiply(ee.Image.pixelArea()).divide(10000) \
+    except Exception as e:
+        st.error(f"❌ Error en riesgo hídrico por campo: {str(e)}")
+        return None
+
+# Serie mensual: GSW MonthlyHistory hasta su último año y compuestos mensuales S2 después.
+# Los meses se piden en lotes (varios años de GSW o un año de S2 por reducción), en paralelo
+DATASET_GSW_MENSUAL = "JRC/GSW1_4/MonthlyHistory"
+ULTIMO_ANO_GSW_MENSUAL = 2021
+ANOS_POR_LOTE_GSW_MENSUAL = 5
+NOMBRES_MESES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+def lote_gsw_mensual(geometry, ano_inicio, ano_fin):
+    """Agua (valor 2) y área observada (valor > 0) de cada mes GSW del rango, en un solo getInfo"""
+    def resumen_mes(img):
+        areas = ee.Image.cat([img.eq(2).rename('agua'), img.gt(0).rename('observada')]) \
+            .multiply(ee.Image.pixelArea()).divide(10000) \
             .reduceRegion(
                 reducer=ee.Reducer.sum(),
                 geometry=geometry,
                 scale=30,
                 maxPixels=1e9
-            ).getInfo()
-        
-        # Obtener el valor del área (puede estar en diferentes keys)
-        area_ha = 0
-        for key in area_inundada.keys():
-            if area_inundada[key] and area_inundada[key] > 0:
-                area_ha = area_inundada[key]
-                break
+            )
+        return ee.Feature(None, {
+            'ano': img.get('year'),
+            'mes': img.get('month'),
+            'agua': areas.get('agua'),
+            'observada': areas.get('observada'),
+            'imagenes': 1
+        })
+    
+    coleccion = ee.ImageCollection(DATASET_GSW_MENSUAL) \
+        .filter(ee.Filter.rangeContains('year', ano_inicio, ano_fin))
+    
+    return [f['properties'] for f in coleccion.map(resumen_mes).getInfo().get('features', [])]
+
+def lote_sentinel2_mensual(geometry, ano, escala=10):
+    """Compuesto mensual de NDWI máximo (> 0.1 = agua) de cada mes S2 del año, en un solo getInfo"""
+    ultimo_mes = int(FECHA_CORTE_ANO_ABIERTO[5:7]) if ano == ANO_ABIERTO else 12
+    
+    def resumen_mes(mes):
+        mes = ee.Number(mes)
+        inicio = ee.Date.fromYMD(ano, mes, 1)
+        coleccion = coleccion_sentinel2(geometry, inicio, inicio.advance(1, 'month'))
+        num_imagenes = coleccion.size()
+        
+        ndwi_max = coleccion.map(agregar_ndwi_enmascarado).select('NDWI').max()
+        areas = ee.Image.cat([ndwi_max.gt(0.1).rename('agua'), ndwi_max.mask().gt(0).rename('observada')]) \
+            .multiply(ee.Image.pixelArea()).divide(10000) \
+            .reduceRegion(
+                reducer=ee.Reducer.sum(),
+                geometry=geometry,
+                scale=escala,
+                maxPixels=1e9
+            )
         
-        # Calcular porcentaje
-        area_total = geometry.area().divide(10000).getInfo()
-        porcentaje = (area_ha / area_total * 100) if area_total > 0 else 0
+        return ee.Feature(None, {
+            'ano': ano,
+            'mes': mes,
+            'agua': ee.Algorithms.If(num_imagenes.gt(0), areas.get('agua'), None),
+            'observada': ee.Algorithms.If(num_imagenes.gt(0), areas.get('observada'), 0),
+            'imagenes': num_imagenes
+        })
+    
+    meses = ee.List.sequence(1, ultimo_mes)
+    return [f['properties'] for f in ee.FeatureCollection(meses.map(resumen_mes)).getInfo().get('features', [])]
+
+def analizar_inundacion_mensual(aoi, anos_analisis, poligonos_data=None):
+    """
+    Serie mensual de área inundada (GSW MonthlyHistory + Sentinel-2) como DataFrame ordenado
+    (una fila por mes): Año, Mes, Fecha, Área Inundada (ha), Porcentaje Inundación,
+    Cobertura (%), Sensor, Imágenes. Devuelve None si ningún lote respondió.
+    """
+    try:
+        geometry = aoi.geometry() if hasattr(aoi, 'geometry') else aoi
+        area_aoi = area_aoi_ha(geometry, poligonos_data)
+        
+        ano_inicio = max(1984, anos_analisis[0])
+        ano_fin = min(ANO_ABIERTO, anos_analisis[1])
+        escala_s2 = elegir_escala_sentinel2(area_aoi)
+        
+        lotes = []
+        for inicio in range(ano_inicio, min(ano_fin, ULTIMO_ANO_GSW_MENSUAL) + 1, ANOS_POR_LOTE_GSW_MENSUAL):
+            fin = min(inicio + ANOS_POR_LOTE_GSW_MENSUAL - 1, ano_fin, ULTIMO_ANO_GSW_MENSUAL)
+            lotes.append(('GSW Mensual', lambda inicio=inicio, fin=fin: lote_gsw_mensual(geometry, inicio, fin)))
+        for ano in range(max(ano_inicio, ULTIMO_ANO_GSW_MENSUAL + 1), ano_fin + 1):
+            lotes.append(('Sentinel-2 NDWI', lambda ano=ano: lote_sentinel2_mensual(geometry, ano, escala_s2)))
+        
+        resultados = ejecutar_en_paralelo([tarea for _, tarea in lotes])
+        
+        filas = []
+        lotes_fallidos = 0
+        for (sensor, _), meses in zip(lotes, resultados):
+            if isinstance(meses, Exception):
+                lotes_fallidos += 1
+                continue
+            for mes in meses:
+                area_agua = mes.get('agua')
+                filas.append({
+                    'Año': int(mes['ano']),
+                    'Mes': int(mes['mes']),
+                    'Área Inundada (ha)': area_agua or 0,
+                    'Porcentaje Inundación': (area_agua or 0) / area_aoi * 100 if area_aoi > 0 else 0,
+                    'Cobertura (%)': (mes.get('observada') or 0) / area_aoi * 100 if area_aoi > 0 else 0,
+                    'Sensor': sensor if area_agua is not None else f"{sensor} (sin datos)",
+                    'Imágenes': mes.get('imagenes') or 0
+                })
+        
+        if lotes_fallidos:
+            st.warning(f"⚠️ {lotes_fallidos} de {len(lotes)} lotes de la serie mensual no respondieron")
+        if not filas:
+            return None
         
-        # Mostrar resultado
-        if area_ha > 0:
-            # Resultado ya se muestra en función principal
-            pass
-        else:
-            # Resultado ya se muestra en función principal
-            pass
+        df_mensual = pd.DataFrame(filas).sort_values(['Año', 'Mes']).reset_index(drop=True)
+        df_mensual.insert(2, 'Fecha', pd.to_datetime(dict(year=df_mensual['Año'], month=df_mensual['Mes'], day=1)))
+        return df_mensual
         
-        return {
+    except Exception as e:
+        st.error(f"❌ Error en serie mensual: {str(e)}")
+        return None
+
+def analizar_gsw_serie(geometry, anos, gsw, area_total=None):
+    """
+    Analiza todos los años GSW con una única reducción: una banda de agua (valor 2) por año,
+    apiladas en una imagen multibanda. Devuelve {año: resultado} con el mismo formato que
+    analizar_gsw_ano; lanza la excepción de Earth Engine si el pedido falla.
+    """
+    if not anos:
+        return {}
+    
+    bandas = [
+        gsw.filter(ee.Filter.eq('year', ano)).first().eq(2).rename(f'agua_{ano}')
+        for ano in anos
+    ]
+    
+    areas = ee.Image.cat(bandas).multiply(ee.Image.pixelArea()).divide(10000) \
+        .reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=geometry,
+            scale=30,
+            maxPixels=1e9
+        ).getInfo()
+    
+    if area_total is None:
+        area_total = geometry.area().divide(10000).getInfo()
+    
+    resultados = {}
+    for ano in anos:
+        area_ha = areas.get(f'agua_{ano}') or 0
+        resultados[ano] = {
             'area_inundada': area_ha,
-            'porcentaje': porcentaje,
+            'porcentaje': (area_ha / area_total * 100) if area_total > 0 else 0,
             'sensor': 'JRC Global Surface Water',
             'imagenes': 1  # GSW es un producto anual
         }
-        
-    except Exception as e:
-        st.error(f"❌ Error GSW {ano}: {str(e)}")
+    
+    return resultados
+
+def analizar_gsw_ano(geometry, ano, gsw, area_total=None):
+    """
+    Analiza un año específico con JRC Global Surface Water
+    Metodología: GSW valor 2 = agua permanente/estacional
+    area_total (ha): si se conoce, evita pedir el área del AOI a Earth Engine
+    Lanza la excepción de Earth Engine si el pedido falla (el año queda como fallido).
+    """
+    # Filtrar GSW por año
+    year_img = gsw.filter(ee.Filter.eq('year', ano)).first()
+    
+    # Verificar si hay imagen
+    if not year_img:
         return None
+    
+    # Crear máscara para áreas con agua (valor 2 = agua)
+    water_mask = year_img.eq(2)
+    
+    # Calcular área en hectáreas
+    area_inundada = water_mask.multiply(ee.Image.pixelArea()).divide(10000) \
+        .reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=geometry,
+            scale=30,
+            maxPixels=1e9
+        ).getInfo()
+    
+    # Obtener el valor del área (puede estar en diferentes keys)
+    area_ha = 0
+    for key in area_inundada.keys():
+        if area_inundada[key] and area_inundada[key] > 0:
+            area_ha = area_inundada[key]
+            break
+    
+    # Calcular porcentaje
+    if area_total is None:
+        area_total = geometry.area().divide(10000).getInfo()
+    porcentaje = (area_ha / area_total * 100) if area_total > 0 else 0
+    
+    # Mostrar resultado
+    if area_ha > 0:
+        # Resultado ya se muestra en función principal
+        pass
+    else:
+        # Resultado ya se muestra en función principal
+        pass
+    
+    return {
+        'area_inundada': area_ha,
+        'porcentaje': porcentaje,
+        'sensor': 'JRC Global Surface Water',
+        'imagenes': 1  # GSW es un producto anual
+    }
+
+# Último año con datos parciales y su fecha de corte
+ANO_ABIERTO = 2025
+FECHA_CORTE_ANO_ABIERTO = "2025-04-30"
 
-def analizar_sentinel2_ndwi_ano(geometry, ano):
+# Escalas candidatas de Sentinel-2 y presupuesto de píxeles por reducción: se usa la más fina
+# que entra en el presupuesto (10 m hasta ~10.000 ha, 20 m hasta ~40.000 ha, después 40 m)
+ESCALAS_SENTINEL2 = [10, 20, 40]
+S2_PRESUPUESTO_PIXELES = float(os.environ.get('VISU_S2_PRESUPUESTO_PIXELES', 1e7))
+
+def elegir_escala_sentinel2(area_ha, presupuesto=None):
+    """Escala (m) más fina de ESCALAS_SENTINEL2 cuya cantidad de píxeles entra en el presupuesto"""
+    presupuesto = presupuesto or S2_PRESUPUESTO_PIXELES
+    for escala in ESCALAS_SENTINEL2:
+        if area_ha * 10000 / escala ** 2 <= presupuesto:
+            return escala
+    return ESCALAS_SENTINEL2[-1]
+
+def mascara_despejado(image):
     """
-    Analiza un año específico con Sentinel-2 NDWI
-    Metodología: NDWI > 0.1 (umbral científico validado)
+    Píxeles despejados (1) de una escena, elegidos en el servidor según las bandas que trae:
+    SCL sin nubes, sombras ni cirros (y probabilidad s2cloudless < S2_PROBABILIDAD_NUBES_MAX
+    si se unió PROB_NUBES); sin SCL, QA60 (formato antiguo), MSK_CLDPRB o ninguna máscara.
     """
-    try:
-        # Definir fechas
-        fecha_inicio = f"{ano}-01-01"
-        if ano == 2025:
-            fecha_fin = "2025-04-30"  # Solo hasta abril 2025
-        else:
-            fecha_fin = f"{ano}-12-31"
-        
-        # Intentar primero con colección armonizada
-        s2_collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+    band_names = image.bandNames()
+    
+    despejado = ee.Image(ee.Algorithms.If(
+        band_names.contains('SCL'),
+        image.select('SCL').remap(CLASES_SCL_NUBES, [0] * len(CLASES_SCL_NUBES), 1),
+        ee.Algorithms.If(
+            band_names.contains('QA60'),
+            image.select('QA60').bitwiseAnd(1 << 10).eq(0),
+            ee.Algorithms.If(
+                band_names.contains('MSK_CLDPRB'),
+                image.select('MSK_CLDPRB').lt(50),
+                ee.Image(1)
+            )
+        )
+    ))
+    
+    return ee.Image(ee.Algorithms.If(
+        band_names.contains('PROB_NUBES'),
+        despejado.And(image.select('PROB_NUBES').lt(S2_PROBABILIDAD_NUBES_MAX)),
+        despejado
+    ))
+
+def agregar_ndwi_enmascarado(image):
+    """Agrega la banda NDWI (Green - NIR) / (Green + NIR) y enmascara nubes y sombras (mascara_despejado)"""
+    ndwi = image.normalizedDifference(['B3', 'B8']).rename('NDWI')
+    return image.addBands(ndwi).updateMask(mascara_despejado(image))
+
+def unir_s2cloudless(coleccion, geometry, fecha_inicio, fecha_fin):
+    """Agrega a cada escena la banda PROB_NUBES de s2cloudless (misma system:index); las que no tienen quedan igual"""
+    probabilidades = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY') \
+        .filterDate(fecha_inicio, fecha_fin) \
+        .filterBounds(geometry)
+    unidas = ee.Join.saveFirst(matchKey='s2cloudless', outer=True).apply(
+        primary=coleccion,
+        secondary=probabilidades,
+        condition=ee.Filter.equals(leftField='system:index', rightField='system:index')
+    )
+    
+    def agregar_probabilidad(image):
+        image = ee.Image(image)
+        return ee.Image(ee.Algorithms.If(
+            image.propertyNames().contains('s2cloudless'),
+            image.addBands(ee.Image(image.get('s2cloudless')).select('probability').rename('PROB_NUBES')),
+            image
+        ))
+    
+    return ee.ImageCollection(unidas).map(agregar_probabilidad)
+
+def porcentaje_nubes_aoi(image, geometry):
+    """
+    % de píxeles nublados de la escena dentro del AOI (ee.Number, a S2_ESCALA_NUBES_AOI m).
+    Sin píxeles válidos sobre el AOI la escena no aporta: cuenta como totalmente nublada (100).
+    Una escena despejada da 0, que no hay que confundir con la falta de valor.
+    """
+    fraccion = mascara_despejado(image).Not().rename('nubes').reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=geometry,
+        scale=S2_ESCALA_NUBES_AOI,
+        maxPixels=1e9,
+        bestEffort=True
+    ).get('nubes')
+    return ee.Number(ee.Algorithms.If(
+        ee.Algorithms.IsEqual(fraccion, None), 100, ee.Number(fraccion).multiply(100)
+    ))
+
+def coleccion_sentinel2(geometry, fecha_inicio, fecha_fin):
+    """
+    Escenas Sentinel-2 del período listas para el compuesto de NDWI, seleccionadas en el servidor:
+    1. colección armonizada, o S2_SR si la armonizada no tiene imágenes, con nubes del gránulo < 70 %
+    2. (modo 's2cloudless') banda de probabilidad de nubes unida por escena
+    3. fracción de nubes dentro del AOI ('nubes_aoi', %) a S2_ESCALA_NUBES_AOI m: se descartan las
+       escenas por encima de S2_MAX_NUBES_AOI
+    4. con S2_MAX_ESCENAS_MES > 0, solo las escenas más despejadas de cada mes
+    La colección lleva 'imagenes_disponibles': escenas del paso 1, antes de descartar.
+    """
+    def filtrar(nombre):
+        return ee.ImageCollection(nombre) \
             .filterDate(fecha_inicio, fecha_fin) \
             .filterBounds(geometry) \
             .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 70))
-        
-        # Contar imágenes
-        num_imagenes = s2_collection.size().getInfo()
-        
-        # Si no hay suficientes imágenes, intentar con colección principal
-        if num_imagenes == 0:
-            s2_collection = ee.ImageCollection('COPERNICUS/S2_SR') \
-                .filterDate(fecha_inicio, fecha_fin) \
-                .filterBounds(geometry) \
-                .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 70))
-            
-            num_imagenes = s2_collection.size().getInfo()
-        
-        if num_imagenes == 0:
-            st.markdown(f"⚠️ S2 {ano}: Sin imágenes disponibles")
-            return None
-        
-        # Función para calcular NDWI y aplicar máscara de nubes
-        def add_ndwi(image):
-            # Calcular NDWI: (Green - NIR) / (Green + NIR)
-            ndwi = image.normalizedDifference(['B3', 'B8']).rename('NDWI')
-            
-            # Máscara de nubes adaptada
-            band_names = image.bandNames()
-            has_qa60 = band_names.contains('QA60')
-            has_msk_cldprb = band_names.contains('MSK_CLDPRB')
-            
-            if has_qa60:
-                # Formato antiguo: usar QA60
-                cloud_mask = image.select('QA60').bitwiseAnd(1 << 10).eq(0)
-            elif has_msk_cldprb:
-                # Formato nuevo: usar probabilidad de nubes
-                cloud_mask = image.select('MSK_CLDPRB').lt(50)
-            else:
-                # Sin máscara de nubes
-                cloud_mask = ee.Image(1)
-            
-            return image.addBands(ndwi).updateMask(cloud_mask)
-        
-        # Aplicar función a la colección
-        s2_ndwi = s2_collection.map(add_ndwi)
-        
-        # Calcular composición anual (máximo NDWI)
-        ndwi_max = s2_ndwi.select('NDWI').max()
-        
-        # Crear máscara de agua usando umbral científico
-        water_mask = ndwi_max.gt(0.1)
-        
-        # Calcular área en hectáreas
-        area_inundada = water_mask.multiply(ee.Image.pixelArea()).divide(10000) \
+    
+    armonizada = filtrar('COPERNICUS/S2_SR_HARMONIZED')
+    disponibles = ee.ImageCollection(ee.Algorithms.If(armonizada.size().gt(0), armonizada, filtrar('COPERNICUS/S2_SR')))
+    
+    coleccion = disponibles
+    if S2_MASCARA_NUBES == 's2cloudless':
+        coleccion = unir_s2cloudless(coleccion, geometry, fecha_inicio, fecha_fin)
+    
+    def agregar_nubes_aoi(image):
+        return image.set('nubes_aoi', porcentaje_nubes_aoi(image, geometry))
+    
+    coleccion = coleccion.map(agregar_nubes_aoi).filter(ee.Filter.lte('nubes_aoi', S2_MAX_NUBES_AOI))
+    
+    if S2_MAX_ESCENAS_MES > 0:
+        coleccion = coleccion.map(lambda image: image.set('mes', image.date().format('YYYY-MM')))
+        meses = coleccion.aggregate_array('mes').distinct()
+        coleccion = ee.ImageCollection(ee.FeatureCollection(meses.map(
+            lambda mes: coleccion.filter(ee.Filter.eq('mes', mes)).limit(S2_MAX_ESCENAS_MES, 'nubes_aoi')
+        )).flatten())
+    
+    return coleccion.set('imagenes_disponibles', disponibles.size())
+
+def analizar_sentinel2_serie(geometry, anos, area_total=None, escala=10):
+    """
+    Analiza todos los años Sentinel-2 en un único getInfo: se mapea sobre la lista de años,
+    cada uno arma su compuesto de NDWI máximo enmascarado y reduce área de agua e imágenes
+    en una FeatureCollection. Devuelve {año: resultado o None si no hubo imágenes}, con el
+    mismo formato que analizar_sentinel2_ndwi_ano (incluida la 'escala' usada, en metros).
+    """
+    if not anos:
+        return {}
+    
+    def resumen_ano(ano):
+        ano = ee.Number(ano)
+        fecha_inicio = ee.Date.fromYMD(ano, 1, 1)
+        fecha_fin = ee.Date(ee.Algorithms.If(
+            ano.eq(ANO_ABIERTO), FECHA_CORTE_ANO_ABIERTO, ee.Date.fromYMD(ano, 12, 31)
+        ))
+        
+        coleccion = coleccion_sentinel2(geometry, fecha_inicio, fecha_fin)
+        num_imagenes = coleccion.size()
+        
+        # NDWI > 0.1 (umbral científico validado) sobre el compuesto anual de máximo NDWI
+        area_agua = coleccion.map(agregar_ndwi_enmascarado).select('NDWI').max().gt(0.1) \
+            .multiply(ee.Image.pixelArea()).divide(10000) \
             .reduceRegion(
                 reducer=ee.Reducer.sum(),
                 geometry=geometry,
-                scale=10,  # Resolución Sentinel-2
+                scale=escala,
                 maxPixels=1e9
-            ).getInfo()
-        
-        area_ha = area_inundada.get('NDWI', 0)
-        
-        # Calcular porcentaje
+            ).get('NDWI')
+        
+        return ee.Feature(None, {
+            'ano': ano,
+            'imagenes': num_imagenes,
+            'imagenes_disponibles': coleccion.get('imagenes_disponibles'),
+            'area_inundada': ee.Algorithms.If(num_imagenes.gt(0), area_agua, 0)
+        })
+    
+    features = ee.FeatureCollection(ee.List(anos).map(resumen_ano)).getInfo().get('features', [])
+    
+    if area_total is None:
         area_total = geometry.area().divide(10000).getInfo()
-        porcentaje = (area_ha / area_total * 100) if area_total > 0 else 0
-        
-        # Mostrar resultado
-        if area_ha > 0:
-            # Resultado ya se muestra en función principal
-            pass
-        else:
-            # Resultado ya se muestra en función principal
-            pass
+    
+    resultados = {ano: None for ano in anos}
+    for feature in features:
+        props = feature.get('properties', {})
+        if not props.get('imagenes'):
+            continue
         
-        return {
+        area_ha = props.get('area_inundada') or 0
+        resultados[int(props['ano'])] = {
             'area_inundada': area_ha,
-            'porcentaje': porcentaje,
+            'porcentaje': (area_ha / area_total * 100) if area_total > 0 else 0,
             'sensor': 'Sentinel-2 NDWI',
-            'imagenes': num_imagenes
+            'imagenes': props['imagenes'],
+            'imagenes_disponibles': props.get('imagenes_disponibles', props['imagenes']),
+            'escala': escala
         }
-        
-    except Exception as e:
-        st.error(f"❌ Error S2 {ano}: {str(e)}")
+    
+    return resultados
+
+def analizar_sentinel2_ndwi_ano(geometry, ano, area_total=None, escala=10):
+    """
+    Analiza un año específico con Sentinel-2 NDWI
+    Metodología: NDWI > 0.1 (umbral científico validado)
+    area_total (ha): si se conoce, evita pedir el área del AOI a Earth Engine
+    escala (m): resolución de la reducción (ver elegir_escala_sentinel2)
+    Devuelve None si no hay imágenes; lanza la excepción de Earth Engine si el pedido falla
+    (el año queda como fallido, no como año sin agua).
+    """
+    # Definir fechas
+    fecha_inicio = f"{ano}-01-01"
+    if ano == ANO_ABIERTO:
+        fecha_fin = FECHA_CORTE_ANO_ABIERTO  # Solo hasta abril 2025
+    else:
+        fecha_fin = f"{ano}-12-31"
+    
+    # Colección armonizada, o la principal si la armonizada no tiene imágenes
+    s2_collection = coleccion_sentinel2(geometry, fecha_inicio, fecha_fin)
+    conteo = ee.Dictionary({
+        'imagenes': s2_collection.size(),
+        'disponibles': s2_collection.get('imagenes_disponibles')
+    }).getInfo()
+    num_imagenes = conteo['imagenes']
+    
+    if num_imagenes == 0:
+        st.markdown(f"⚠️ S2 {ano}: Sin imágenes disponibles")
         return None
+    
+    # Aplicar función a la colección
+    s2_ndwi = s2_collection.map(agregar_ndwi_enmascarado)
+    
+    # Calcular composición anual (máximo NDWI)
+    ndwi_max = s2_ndwi.select('NDWI').max()
+    
+    # Crear máscara de agua usando umbral científico
+    water_mask = ndwi_max.gt(0.1)
+    
+    # Calcular área en hectáreas
+    area_inundada = water_mask.multiply(ee.Image.pixelArea()).divide(10000) \
+        .reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=geometry,
+            scale=escala,
+            maxPixels=1e9
+        ).getInfo()
+    
+    area_ha = area_inundada.get('NDWI', 0)
+    
+    # Calcular porcentaje
+    if area_total is None:
+        area_total = geometry.area().divide(10000).getInfo()
+    porcentaje = (area_ha / area_total * 100) if area_total > 0 else 0
+    
+    # Mostrar resultado
+    if area_ha > 0:
+        # Resultado ya se muestra en función principal
+        pass
+    else:
+        # Resultado ya se muestra en función principal
+        pass
+    
+    return {
+        'area_inundada': area_ha,
+        'porcentaje': porcentaje,
+        'sensor': 'Sentinel-2 NDWI',
+        'imagenes': num_imagenes,
+        'imagenes_disponibles': conteo['disponibles'],
+        'escala': escala
+    }
 
 def main():
     # Logo VISU con tagline correcto - DISEÑO ELEGANTE QUE YA FUNCIONA
@@ -2244,6 +3643,13 @@ def mostrar_analisis_cultivos_kmz():
                 file_size_mb = file.size / (1024 * 1024)
                 st.write(f"📄 **{file.name}** - {file_size_mb:.2f} MB ({file.size:,} bytes)")
         
+        forzar_actualizacion = st.checkbox(
+            "🔄 Forzar recálculo (ignorar resultados guardados)",
+            value=False,
+            key="forzar_actualizacion_cultivos_kmz",
+            help="Los resultados de áreas ya analizadas se reutilizan desde el caché local. Marcá esta opción para volver a calcularlos en Earth Engine."
+        )
+        
         # BOTÓN DE ANÁLISIS - SOLO PROCESA Y GUARDA EN SESSION STATE
         if st.button("🚀 Analizar Cultivos y Rotación", type="primary", key="btn_analizar_cultivos_kmz"):
             with st.spinner("🔄 Procesando análisis completo..."):
@@ -2273,8 +3679,15 @@ def mostrar_analisis_cultivos_kmz():
                     st.session_state.analisis_completado = False
                     return
                 
+                st.info(f"📐 Área total: {area_aoi_ha(aoi.geometry(), todos_los_poligonos):,.1f} ha")
+                
                 # Ejecutar análisis
-                resultado = analizar_cultivos_web(aoi)
+                resultado = analizar_cultivos_web(
+                    aoi,
+                    clave_geometria=hash_geometria(todos_los_poligonos),
+                    forzar_actualizacion=forzar_actualizacion,
+                    poligonos_data=todos_los_poligonos
+                )
                 
                 if len(resultado) == 4:
                     df_cultivos, area_total, tiles_urls, cultivos_por_campana = resultado
@@ -2298,6 +3711,7 @@ def mostrar_analisis_cultivos_kmz():
                         'tiles_urls': tiles_urls,
                         'cultivos_por_campana': cultivos_por_campana,
                         'aoi': aoi,
+                        'clave_geometria': hash_geometria(todos_los_poligonos),
                         'archivo_info': f"{len(uploaded_files)} archivo(s) - {len(todos_los_poligonos)} polígonos",
                         'nombres_archivos': nombres_archivos,  # Guardar nombres para descargas
                         'fuente': 'KMZ',  # Identificar fuente
@@ -2341,7 +3755,7 @@ def mostrar_analisis_inundacion_kmz():
     
     # EXPLICACIÓN DETALLADA DEL ANÁLISIS
     with st.expander("🔬 **¿Cómo funciona el análisis de riesgo hídrico?**", expanded=False):
-        st.markdown("""
+        st.markdown(f"""
         ### 🔬 **METODOLOGÍA CIENTÍFICA ACTUALIZADA (41 AÑOS DE DATOS)**
         
         **📊 Fuentes de datos por período:**
@@ -2363,9 +3777,9 @@ def mostrar_analisis_inundacion_kmz():
         **📡 Sensor**: Sentinel-2 MultiSpectral Instrument (MSI)  
         **🔬 Índice**: NDWI = (Verde - NIR) / (Verde + NIR)  
         **⚡ Umbral**: NDWI > 0.1 (umbral científico validado)  
-        **☁️ Control nubes**: QA60 + MSK_CLDPRB automático  
+        **☁️ Control nubes**: {DESCRIPCION_MASCARA_NUBES}; se descartan escenas con más de {S2_MAX_NUBES_AOI:g}% de nubes sobre el AOI  
         **📊 Composición**: Máximo NDWI anual (captura eventos de agua)  
-        **📏 Resolución**: 10 metros por píxel  
+        **📏 Resolución**: 10 metros por píxel (20/40 m en áreas muy grandes)  
         
         ### 🔄 **VENTAJAS DE ESTA METODOLOGÍA**
         
@@ -2435,6 +3849,27 @@ def mostrar_analisis_inundacion_kmz():
                 help="Porcentaje mínimo de área inundada para considerar evento significativo"
             )
         
+        modo_rapido = st.checkbox(
+            "⚡ Screening rápido (capas agregadas GSW, sin serie anual)",
+            value=False,
+            key="modo_rapido_inundacion_kmz",
+            help="Calcula categoría de riesgo y probabilidad de evento con las capas de recurrencia y extensión máxima de GSW en una sola consulta. No genera la serie año por año."
+        )
+        
+        refinamiento_progresivo = st.checkbox(
+            "🔍 Refinamiento progresivo (resultado rápido a 40 m mientras se calcula el definitivo)",
+            value=False,
+            key="refinamiento_inundacion_kmz",
+            help="Calcula a la vez un resultado Sentinel-2 a escala gruesa, que se muestra apenas llega, y el definitivo a la escala que permite el área (10 m en campos de hasta ~10.000 ha)."
+        )
+        
+        serie_mensual = st.checkbox(
+            "📆 Serie mensual (estacionalidad de las inundaciones)",
+            value=False,
+            key="serie_mensual_inundacion_kmz",
+            help="Agrega el área inundada mes a mes (GSW mensual hasta 2021 y Sentinel-2 después) para ver en qué meses se inunda"
+        )
+        
         # BOTÓN DE ANÁLISIS DE INUNDACIÓN
         if st.button("🌊 Analizar Riesgo Hídrico", type="primary", key="btn_analizar_inundacion_kmz"):
             with st.spinner("🔄 Analizando riesgo hídrico (esto puede tardar varios minutos)..."):
@@ -2463,7 +3898,16 @@ def mostrar_analisis_inundacion_kmz():
                     return
                 
                 # Ejecutar análisis de inundación
-                resultado_inundacion = analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion)
+                resultado_inundacion = analizar_riesgo_hidrico_web(
+                    aoi, anos_analisis, umbral_inundacion, poligonos_data=todos_los_poligonos, rapido=modo_rapido,
+                    refinamiento_progresivo=refinamiento_progresivo
+                )
+                
+                if resultado_inundacion and serie_mensual:
+                    with st.spinner("📆 Calculando serie mensual..."):
+                        resultado_inundacion['df_mensual'] = analizar_inundacion_mensual(
+                            aoi, anos_analisis, todos_los_poligonos
+                        )
                 
                 if resultado_inundacion:
                     # LIMPIAR CUALQUIER RESULTADO ANTERIOR ANTES DE GUARDAR NUEVO
@@ -2477,6 +3921,8 @@ def mostrar_analisis_inundacion_kmz():
                         'tipo_analisis': 'inundacion',
                         'resultado_inundacion': resultado_inundacion,
                         'aoi': aoi,
+                        'clave_geometria': hash_geometria(todos_los_poligonos),
+                        'extension_aoi': extension_poligonos(todos_los_poligonos),
                         'archivo_info': f"{len(uploaded_files_inund)} archivo(s) - {len(todos_los_poligonos)} polígonos",
                         'nombres_archivos': nombres_archivos,
                         'fuente': 'KMZ',
@@ -2568,6 +4014,13 @@ def mostrar_analisis_cultivos_cuit():
         help="General: Un solo análisis con todos los campos como AOI único. Individual: Análisis separado por cada campo."
     )
     
+    forzar_actualizacion = st.checkbox(
+        "🔄 Forzar recálculo (ignorar resultados guardados)",
+        value=False,
+        key="forzar_actualizacion_cultivos_cuit",
+        help="Los resultados de campos ya analizados se reutilizan desde el caché local. Marcá esta opción para volver a calcularlos en Earth Engine."
+    )
+    
     if st.button("🚀 Analizar Cultivos por CUIT", type="primary", key="btn_analizar_cuit_cultivos"):
         if cuit_input:
             try:
@@ -2580,7 +4033,7 @@ def mostrar_analisis_cultivos_cuit():
                         return
                     
                     # Mostrar información de campos encontrados
-                    st.success(f"✅ Se encontraron {len(poligonos_data)} campos con coordenadas")
+                    st.success(f"✅ Se encontraron {len(poligonos_data)} campos con coordenadas - {describir_area_campos(poligonos_data)}")
                     
                     # Mostrar detalles de los campos
                     with st.expander("📋 Ver detalles de campos encontrados"):
@@ -2599,46 +4052,53 @@ def mostrar_analisis_cultivos_cuit():
                             campo_mas_grande = None
                             max_superficie = 0
                             
+                            # Un único reduceRegions para todos los campos (sin re-ejecutar el pipeline por campo)
+                            aoi_campos = crear_ee_feature_collection_web(poligonos_data)
+                            if aoi_campos:
+                                df_campos, areas_por_campo, cultivos_por_campana_campos = \
+                                    analizar_cultivos_por_campo(
+                                        aoi_campos,
+                                        poligonos_data=poligonos_data,
+                                        forzar_actualizacion=forzar_actualizacion
+                                    )
+                            else:
+                                df_campos, areas_por_campo, cultivos_por_campana_campos = None, {}, {}
+                            
                             for i, campo_data in enumerate(poligonos_data):
-                                st.write(f"🔄 Analizando Campo {i+1}: {campo_data.get('titular', 'Sin titular')}...")
+                                if df_campos is None or df_campos.empty:
+                                    break
                                 
-                                # Crear AOI individual para este campo
-                                aoi_individual = crear_ee_feature_collection_web([campo_data])
+                                numero_campo = campo_data.get('numero', i + 1)
+                                df_cultivos_ind = df_campos[df_campos['campo_numero'] == numero_campo] \
+                                    .drop(columns=['campo_numero', 'renspa']).reset_index(drop=True)
                                 
-                                if aoi_individual:
-                                    # Análisis individual
-                                    resultado = analizar_cultivos_web(aoi_individual)
+                                if not df_cultivos_ind.empty:
+                                    # Agregar información del campo al dataframe
+                                    df_cultivos_ind['campo_nombre'] = campo_data.get('titular', f'Campo_{i+1}')
+                                    df_cultivos_ind['campo_numero'] = i + 1
+                                    df_cultivos_ind['campo_localidad'] = campo_data.get('localidad', 'Sin información')
+                                    df_cultivos_ind['campo_superficie_total'] = campo_data.get('superficie', 0)
+                                    
+                                    resultado_campo = {
+                                        'campo_numero': i + 1,
+                                        'campo_nombre': campo_data.get('titular', f'Campo_{i+1}'),
+                                        'campo_localidad': campo_data.get('localidad', 'Sin información'),
+                                        'campo_superficie': campo_data.get('superficie', 0),
+                                        'df_cultivos': df_cultivos_ind,
+                                        'area_total': areas_por_campo.get(numero_campo, 0),
+                                        'tiles_urls': {},
+                                        'cultivos_por_campana': cultivos_por_campana_campos,
+                                        # AOI individual para el mapa: sus tiles se piden bajo demanda
+                                        'aoi': crear_ee_feature_collection_web([campo_data]),
+                                        'clave_geometria': hash_geometria([campo_data]),
+                                        'coords': campo_data.get('coords', [])
+                                    }
+                                    resultados_individuales.append(resultado_campo)
                                     
-                                    if len(resultado) >= 2:
-                                        df_cultivos_ind, area_total_ind = resultado[:2]
-                                        tiles_urls_ind = resultado[2] if len(resultado) > 2 else {}
-                                        cultivos_por_campana_ind = resultado[3] if len(resultado) > 3 else {}
-                                        
-                                        if df_cultivos_ind is not None and not df_cultivos_ind.empty:
-                                            # Agregar información del campo al dataframe
-                                            df_cultivos_ind['campo_nombre'] = campo_data.get('titular', f'Campo_{i+1}')
-                                            df_cultivos_ind['campo_numero'] = i + 1
-                                            df_cultivos_ind['campo_localidad'] = campo_data.get('localidad', 'Sin información')
-                                            df_cultivos_ind['campo_superficie_total'] = campo_data.get('superficie', 0)
-                                            
-                                            resultado_campo = {
-                                                'campo_numero': i + 1,
-                                                'campo_nombre': campo_data.get('titular', f'Campo_{i+1}'),
-                                                'campo_localidad': campo_data.get('localidad', 'Sin información'),
-                                                'campo_superficie': campo_data.get('superficie', 0),
-                                                'df_cultivos': df_cultivos_ind,
-                                                'area_total': area_total_ind,
-                                                'tiles_urls': tiles_urls_ind,
-                                                'cultivos_por_campana': cultivos_por_campana_ind,
-                                                'aoi': aoi_individual,
-                                                'coords': campo_data.get('coords', [])
-                                            }
-                                            resultados_individuales.append(resultado_campo)
-                                            
-                                            # Encontrar campo más grande
-                                            if campo_data.get('superficie', 0) > max_superficie:
-                                                max_superficie = campo_data.get('superficie', 0)
-                                                campo_mas_grande = resultado_campo
+                                    # Encontrar campo más grande
+                                    if campo_data.get('superficie', 0) > max_superficie:
+                                        max_superficie = campo_data.get('superficie', 0)
+                                        campo_mas_grande = resultado_campo
                             
                             if resultados_individuales:
                                 # GUARDAR RESULTADOS INDIVIDUALES EN SESSION STATE
@@ -2682,13 +4142,18 @@ def mostrar_analisis_cultivos_cuit():
                         # 🌾 ANÁLISIS GENERAL (ORIGINAL)
                         # Crear AOI
                         aoi = crear_ee_feature_collection_web(poligonos_data)
-                if not aoi:
-                    st.error("❌ No se pudo crear el área de interés")
-                    return
-                
+                        if not aoi:
+                            st.error("❌ No se pudo crear el área de interés")
+                            return
+                        
                         # Ejecutar análisis
                         with st.spinner("🔄 Ejecutando análisis general de cultivos..."):
-                            resultado = analizar_cultivos_web(aoi)
+                            resultado = analizar_cultivos_web(
+                                aoi,
+                                clave_geometria=hash_geometria(poligonos_data),
+                                forzar_actualizacion=forzar_actualizacion,
+                                poligonos_data=poligonos_data
+                            )
                             
                             if len(resultado) == 4:
                                 df_cultivos, area_total, tiles_urls, cultivos_por_campana = resultado
@@ -2696,8 +4161,8 @@ def mostrar_analisis_cultivos_cuit():
                                 df_cultivos, area_total = resultado[:2]
                                 tiles_urls = {}
                                 cultivos_por_campana = {}
-                
-                if df_cultivos is not None and not df_cultivos.empty:
+                            
+                            if df_cultivos is not None and not df_cultivos.empty:
                                 # GUARDAR TODO EN SESSION STATE
                                 st.session_state.resultados_analisis = {
                                     'tipo': 'general',
@@ -2707,6 +4172,7 @@ def mostrar_analisis_cultivos_cuit():
                                     'tiles_urls': tiles_urls,
                                     'cultivos_por_campana': cultivos_por_campana,
                                     'aoi': aoi,
+                                    'clave_geometria': hash_geometria(poligonos_data),
                                     'archivo_info': f"CUIT: {cuit_input} - {len(poligonos_data)} campos",
                                     'nombres_archivos': [f"CUIT_{normalizar_cuit(cuit_input).replace('-', '')}"],
                                     'fuente': 'CUIT',  # Identificar fuente
@@ -2800,6 +4266,34 @@ def mostrar_analisis_inundacion_cuit():
             key="umbral_inundacion_cuit"
         )
     
+    modo_rapido = st.checkbox(
+        "⚡ Screening rápido (capas agregadas GSW, sin serie anual)",
+        value=False,
+        key="modo_rapido_inundacion_cuit",
+        help="Calcula categoría de riesgo y probabilidad de evento con las capas de recurrencia y extensión máxima de GSW en una sola consulta. No genera la serie año por año."
+    )
+    
+    refinamiento_progresivo = st.checkbox(
+        "🔍 Refinamiento progresivo (resultado rápido a 40 m mientras se calcula el definitivo)",
+        value=False,
+        key="refinamiento_inundacion_cuit",
+        help="Calcula a la vez un resultado Sentinel-2 a escala gruesa, que se muestra apenas llega, y el definitivo a la escala que permite el área (10 m en campos de hasta ~10.000 ha)."
+    )
+    
+    serie_mensual = st.checkbox(
+        "📆 Serie mensual (estacionalidad de las inundaciones)",
+        value=False,
+        key="serie_mensual_inundacion_cuit",
+        help="Agrega el área inundada mes a mes (GSW mensual hasta 2021 y Sentinel-2 después) para ver en qué meses se inunda"
+    )
+    
+    riesgo_por_campo = st.checkbox(
+        "🏞️ Calcular riesgo por campo",
+        value=True,
+        key="riesgo_por_campo_cuit",
+        help="Además del riesgo del conjunto, calcula el riesgo de cada campo del productor en una sola consulta"
+    )
+    
     # BOTÓN DE ANÁLISIS DE INUNDACIÓN POR CUIT
     if st.button("🌊 Analizar Riesgo Hídrico por CUIT", type="primary", key="btn_analizar_inundacion_cuit"):
         if cuit_input:
@@ -2813,7 +4307,7 @@ def mostrar_analisis_inundacion_cuit():
                         return
                     
                     # Mostrar información de campos encontrados
-                    st.success(f"✅ Se encontraron {len(poligonos_data)} campos con coordenadas")
+                    st.success(f"✅ Se encontraron {len(poligonos_data)} campos con coordenadas - {describir_area_campos(poligonos_data)}")
                     
                     # Crear AOI desde los campos del CUIT
                     aoi = crear_ee_feature_collection_web(poligonos_data)
@@ -2822,7 +4316,22 @@ def mostrar_analisis_inundacion_cuit():
                         return
                     
                     # Ejecutar análisis de inundación
-                    resultado_inundacion = analizar_riesgo_hidrico_web(aoi, anos_analisis, umbral_inundacion)
+                    resultado_inundacion = analizar_riesgo_hidrico_web(
+                        aoi, anos_analisis, umbral_inundacion, poligonos_data=poligonos_data, rapido=modo_rapido,
+                        refinamiento_progresivo=refinamiento_progresivo
+                    )
+                    
+                    if resultado_inundacion and serie_mensual:
+                        with st.spinner("📆 Calculando serie mensual..."):
+                            resultado_inundacion['df_mensual'] = analizar_inundacion_mensual(
+                                aoi, anos_analisis, poligonos_data
+                            )
+                    
+                    if resultado_inundacion and riesgo_por_campo and len(poligonos_data) > 1:
+                        with st.spinner("🏞️ Calculando riesgo por campo..."):
+                            resultado_inundacion['riesgo_por_campo'] = analizar_riesgo_hidrico_por_campo(
+                                aoi, anos_analisis, umbral_inundacion, poligonos_data
+                            )
                     
                     if resultado_inundacion:
                         # LIMPIAR CUALQUIER RESULTADO ANTERIOR ANTES DE GUARDAR NUEVO
@@ -2836,6 +4345,8 @@ def mostrar_analisis_inundacion_cuit():
                             'tipo_analisis': 'inundacion',
                             'resultado_inundacion': resultado_inundacion,
                             'aoi': aoi,
+                            'clave_geometria': hash_geometria(poligonos_data),
+                            'extension_aoi': extension_poligonos(poligonos_data),
                             'archivo_info': f"CUIT: {cuit_input} - {len(poligonos_data)} campos",
                             'nombres_archivos': [f"CUIT_{normalizar_cuit(cuit_input).replace('-', '')}_inundacion"],
                             'fuente': 'CUIT',
@@ -2895,8 +4406,8 @@ def mostrar_resultados_analisis():
         
         # Métricas generales
         st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
             st.metric("Campos Analizados", f"{datos['total_campos']:,}")
         with col2:
             st.metric("Superficie Total", f"{datos['superficie_total']:,.1f} ha")
@@ -2940,6 +4451,7 @@ def mostrar_resultados_analisis():
         tiles_urls = resultado_campo['tiles_urls']
         cultivos_por_campana = resultado_campo['cultivos_por_campana']
         aoi = resultado_campo['aoi']
+        clave_geometria = resultado_campo.get('clave_geometria')
         
         # Mostrar info del campo seleccionado
         st.info(f"📍 **Campo**: {resultado_campo['campo_nombre']} | **Localidad**: {resultado_campo['campo_localidad']} | **Superficie**: {resultado_campo['campo_superficie']:.1f} ha")
@@ -2951,6 +4463,7 @@ def mostrar_resultados_analisis():
         tiles_urls = datos['tiles_urls']
         cultivos_por_campana = datos['cultivos_por_campana']
         aoi = datos['aoi']
+        clave_geometria = datos.get('clave_geometria')
         
         # Mostrar información de la fuente
         if fuente == 'CUIT':
@@ -2964,30 +4477,30 @@ def mostrar_resultados_analisis():
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.metric("Área Analizada", f"{area_total:,.1f} ha")
-                    with col2:
-                        cultivos_detectados = df_cultivos[df_cultivos['Área (ha)'] > 0]['Cultivo'].nunique()
+    with col2:
+        cultivos_detectados = df_cultivos[df_cultivos['Área (ha)'] > 0]['Cultivo'].nunique()
         st.metric("Cultivos Detectados", f"{cultivos_detectados:,}")
-                    with col3:
-                        area_agricola_por_campana = df_cultivos[~df_cultivos['Cultivo'].str.contains('No agrícola', na=False)].groupby('Campaña')['Área (ha)'].sum()
-                        area_agricola = area_agricola_por_campana.mean()
+    with col3:
+        area_agricola_por_campana = df_cultivos[~df_cultivos['Cultivo'].str.contains('No agrícola', na=False)].groupby('Campaña')['Área (ha)'].sum()
+        area_agricola = area_agricola_por_campana.mean()
         st.metric("Área Agrícola", f"{area_agricola:,.1f} ha", help="Promedio de área agrícola por campaña")
-                    with col4:
-                        porcentaje_agricola = (area_agricola / area_total * 100) if area_total > 0 else 0
-                        st.metric("% Agrícola", f"{porcentaje_agricola:.1f}%", help="Porcentaje promedio de área agrícola")
+    with col4:
+        porcentaje_agricola = (area_agricola / area_total * 100) if area_total > 0 else 0
+        st.metric("% Agrícola", f"{porcentaje_agricola:.1f}%", help="Porcentaje promedio de área agrícola")
     st.markdown('</div>', unsafe_allow_html=True)
-                    
+    
     # Generar gráfico de rotación
-                    fig, df_rotacion = generar_grafico_rotacion_web(df_cultivos)
-                    
-                    if fig is not None:
-                        st.subheader("🎨 Gráfico de Rotación de Cultivos")
-                        st.pyplot(fig)
-                        
-                        st.subheader("📋 Tabla de Rotación (%)")
-                        df_display = df_rotacion.copy()
-                        df_display = df_display.rename(columns={'Cultivo_Estandarizado': 'Cultivo'})
-                        st.dataframe(df_display, use_container_width=True)
-                        
+    fig, df_rotacion = generar_grafico_rotacion_web(df_cultivos)
+    
+    if fig is not None:
+        st.subheader("🎨 Gráfico de Rotación de Cultivos")
+        st.pyplot(fig)
+        
+        st.subheader("📋 Tabla de Rotación (%)")
+        df_display = df_rotacion.copy()
+        df_display = df_display.rename(columns={'Cultivo_Estandarizado': 'Cultivo'})
+        st.dataframe(df_display, use_container_width=True)
+    
     # MAPA INTERACTIVO PERSISTENTE
     st.subheader("🗺️ Mapa Interactivo de Cultivos")
     st.write("Explora los píxeles de cultivos reales de Google Earth Engine:")
@@ -3018,6 +4531,17 @@ def mostrar_resultados_analisis():
     
     # Mostrar mapa
     try:
+        # 🎨 Tiles bajo demanda: solo la campaña seleccionada, memorizados por AOI + campaña
+        tiles_urls = dict(tiles_urls or {})
+        if campana_seleccionada not in tiles_urls:
+            try:
+                with st.spinner(f"🗺️ Generando mapa de la campaña {campana_seleccionada}..."):
+                    tiles_urls[campana_seleccionada] = obtener_url_tiles_cultivos(
+                        clave_aoi_mapa(aoi, clave_geometria), campana_seleccionada, aoi
+                    )
+            except Exception:
+                pass
+        
         if tiles_urls and campana_seleccionada in tiles_urls:
             # Crear mapa con tiles reales de Earth Engine
             mapa_tiles = crear_mapa_con_tiles_engine(
@@ -3046,14 +4570,14 @@ def mostrar_resultados_analisis():
             # Fallback al visor anterior
             mapa_cultivos = crear_visor_cultivos_interactivo(aoi, df_cultivos)
             map_data = st_folium(mapa_cultivos, width=None, height=500, key="mapa_fallback")
-                            
-                        except Exception as e:
+            
+    except Exception as e:
         st.error(f"Error generando el mapa: {e}")
         st.info("El análisis se completó correctamente, pero no se pudo mostrar el mapa con tiles.")
     
     # DESCARGAS MEJORADAS CON KMZ PARA CUIT
     st.markdown("---")
-                        st.subheader("💾 Descargar Resultados")
+    st.subheader("💾 Descargar Resultados")
     st.write("Descarga los resultados del análisis en diferentes formatos:")
     
     # Crear nombre base para archivos
@@ -3064,23 +4588,23 @@ def mostrar_resultados_analisis():
         nombre_base = nombre_base[:50]
     
     # CSVs
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename_hectareas = f"{nombre_base}_hectareas_{timestamp}.csv"
         download_link_hectareas = get_download_link(df_cultivos, filename_hectareas, "📊 CSV - Hectáreas")
         st.markdown(download_link_hectareas, unsafe_allow_html=True)
         st.caption("📄 Cultivo, Campaña, Área")
-                        
-                        with col2:
+    
+    with col2:
         filename_porcentajes = f"{nombre_base}_porcentajes_{timestamp}.csv"
         download_link_porcentajes = get_download_link(df_display, filename_porcentajes, "🔄 CSV - Rotación")
         st.markdown(download_link_porcentajes, unsafe_allow_html=True)
         st.caption("📄 Porcentajes por campaña")
     
     # KMZ para análisis por CUIT
-                        with col3:
+    with col3:
         if fuente in ['CUIT', 'CUIT_INDIVIDUAL'] and 'poligonos_data' in datos:
             filename_kmz = f"{nombre_base}_campos_{timestamp}.kmz"
             kmz_buffer = generar_kmz_desde_cuit(datos['poligonos_data'], nombre_base)
@@ -3112,18 +4636,18 @@ def mostrar_resultados_analisis():
                 st.caption("📄 Campo seleccionado")
     
     # RESUMEN FINAL PERSISTENTE
-                        st.subheader("📈 Resumen por Campaña")
-                        pivot_summary = df_cultivos.pivot_table(
-                            index='Cultivo', 
-                            columns='Campaña', 
-                            values='Área (ha)', 
-                            aggfunc='sum', 
-                            fill_value=0
-                        )
+    st.subheader("📈 Resumen por Campaña")
+    pivot_summary = df_cultivos.pivot_table(
+        index='Cultivo', 
+        columns='Campaña', 
+        values='Área (ha)', 
+        aggfunc='sum', 
+        fill_value=0
+    )
     pivot_summary['Promedio'] = pivot_summary.mean(axis=1).round(1)
     pivot_filtered = pivot_summary[pivot_summary['Promedio'] > 0].sort_values('Promedio', ascending=False)
-                        st.dataframe(pivot_filtered, use_container_width=True)
-                        
+    st.dataframe(pivot_filtered, use_container_width=True)
+    
     # Mensaje final
     st.markdown("---")
     st.success("✅ **Todos los resultados están listos y disponibles para descarga**")
@@ -3147,6 +4671,12 @@ def mostrar_resultados_inundacion():
     # Mostrar información del análisis
     st.info(f"📋 **Análisis de Riesgo Hídrico**: {datos.get('archivo_info', 'Archivos KMZ')}")
     
+    if resultado_inundacion.get('parcial'):
+        st.warning(
+            f"⚠️ **Resultado parcial**: sin datos para {', '.join(map(str, resultado_inundacion['años_fallidos']))}. "
+            "Las estadísticas usan solo los años completados; repetí el análisis para completarlos."
+        )
+    
     # MÉTRICAS PRINCIPALES
     st.markdown("### 📊 Métricas de Riesgo")
     col1, col2, col3, col4 = st.columns(4)
@@ -3189,7 +4719,38 @@ def mostrar_resultados_inundacion():
     # ANÁLISIS TEMPORAL
     st.markdown("### 📅 Análisis Temporal")
     
-    if 'df_inundacion' in resultado_inundacion:
+    if resultado_inundacion.get('metodo_rapido'):
+        # El screening rápido no tiene serie anual: se muestra el área según la recurrencia de GSW
+        st.info(
+            f"⚡ **Screening rápido**: sin detalle año por año. Distribución del área según el "
+            f"porcentaje de años con agua en GSW 1984-2020 ({ANOS_GSW_AGREGADO} años), sin importar "
+            f"los años elegidos."
+        )
+        st.metric(
+            "Extensión Máxima Histórica",
+            f"{resultado_inundacion['extension_maxima_historica']:.1f}%",
+            help="Área con agua detectada en algún momento entre 1984 y 2020 (unión de todos los años, no el peor año)"
+        )
+        area_por_recurrencia = resultado_inundacion.get('area_por_recurrencia') or {}
+        area_total = resultado_inundacion['area_total_ha']
+        if area_por_recurrencia and area_total > 0:
+            rangos = list(range(0, 100, 10))
+            porcentaje_area = [
+                sum(area for valor, area in area_por_recurrencia.items() if inicio < valor <= inicio + 10) / area_total * 100
+                for inicio in rangos
+            ]
+            
+            fig, ax = plt.subplots(figsize=(12, 5))
+            ax.bar([f"{inicio + 1}-{inicio + 10}" for inicio in rangos], porcentaje_area, color='steelblue', alpha=0.8)
+            ax.set_xlabel('Años con agua (%)')
+            ax.set_ylabel('Porcentaje del área (%)')
+            ax.set_title('Área según recurrencia de agua (GSW)')
+            ax.grid(True, alpha=0.3)
+            plt.tight_layout()
+            st.pyplot(fig)
+        else:
+            st.success("✅ GSW no registra agua no permanente dentro del área")
+    elif 'df_inundacion' in resultado_inundacion:
         df_inundacion = resultado_inundacion['df_inundacion']
         
         # Gráfico de evolución temporal
@@ -3214,6 +4775,46 @@ def mostrar_resultados_inundacion():
         st.markdown("### 📋 Detalle por Año")
         st.dataframe(df_inundacion, use_container_width=True)
     
+    # SERIE MENSUAL
+    df_mensual = resultado_inundacion.get('df_mensual')
+    if df_mensual is not None and not df_mensual.empty:
+        st.markdown("### 📆 Estacionalidad Mensual")
+        
+        # Mapa de calor año × mes y promedio por mes
+        matriz_mensual = df_mensual.pivot_table(
+            index='Año', columns='Mes', values='Porcentaje Inundación', aggfunc='mean'
+        ).reindex(columns=range(1, 13))
+        
+        fig, (ax_calor, ax_mes) = plt.subplots(1, 2, figsize=(14, 6), gridspec_kw={'width_ratios': [3, 2]})
+        
+        imagen_calor = ax_calor.imshow(matriz_mensual.values, aspect='auto', cmap='Blues', interpolation='nearest')
+        ax_calor.set_xticks(range(12))
+        ax_calor.set_xticklabels(NOMBRES_MESES)
+        ax_calor.set_yticks(range(len(matriz_mensual.index)))
+        ax_calor.set_yticklabels(matriz_mensual.index, fontsize=7)
+        ax_calor.set_title('Área Inundada por Mes (%)')
+        fig.colorbar(imagen_calor, ax=ax_calor)
+        
+        ax_mes.bar(NOMBRES_MESES, matriz_mensual.mean(axis=0).fillna(0).values, color='steelblue', alpha=0.8)
+        ax_mes.set_ylabel('Porcentaje promedio (%)')
+        ax_mes.set_title('Promedio por Mes')
+        ax_mes.grid(True, alpha=0.3)
+        
+        plt.tight_layout()
+        st.pyplot(fig)
+        
+        with st.expander("📋 Detalle por Mes"):
+            st.dataframe(df_mensual, use_container_width=True, hide_index=True)
+    
+    # RIESGO POR CAMPO
+    riesgo_por_campo = resultado_inundacion.get('riesgo_por_campo')
+    if riesgo_por_campo:
+        st.markdown("### 🏞️ Riesgo por Campo")
+        st.dataframe(riesgo_por_campo['df_campos'], use_container_width=True, hide_index=True)
+        
+        with st.expander("📅 Porcentaje inundado por campo y año"):
+            st.dataframe(riesgo_por_campo['matriz_inundacion'], use_container_width=True)
+    
     # EVENTOS SIGNIFICATIVOS
     eventos_significativos = resultado_inundacion.get('eventos_significativos', 0)
     if eventos_significativos > 0:
@@ -3224,7 +4825,12 @@ def mostrar_resultados_inundacion():
         df_inundacion = resultado_inundacion['df_inundacion']
         eventos_df = df_inundacion[df_inundacion['Porcentaje Inundación'] >= umbral]
         
-        if not eventos_df.empty:
+        if resultado_inundacion.get('metodo_rapido'):
+            st.info(
+                f"ℹ️ Estimación del screening rápido: ~{eventos_significativos} de "
+                f"{resultado_inundacion['años_analizados']} años superan el umbral de {umbral}%"
+            )
+        elif not eventos_df.empty:
             for _, evento in eventos_df.iterrows():
                 porcentaje = evento['Porcentaje Inundación']
                 area_ha = evento['Área Inundada (ha)']
@@ -3248,24 +4854,41 @@ def mostrar_resultados_inundacion():
         st.success("✅ **No se detectaron eventos significativos de inundación** en el período analizado")
     
     # MAPA DE RIESGO
-    if 'mapa_riesgo' in resultado_inundacion and resultado_inundacion['mapa_riesgo']:
+    # La capa de frecuencia se genera bajo demanda y su URL queda memorizada por AOI + años:
+    # mostrar el mapa no repite el análisis ni vuelve a pedir tiles en cada recarga
+    mapa_riesgo = None
+    if datos.get('aoi') is not None:
+        anos_analisis = config_analisis.get('anos_analisis', (1984, ANO_ABIERTO))
+        ano_inicio, ano_fin = max(1984, anos_analisis[0]), min(ANO_ABIERTO, anos_analisis[1])
+        try:
+            with st.spinner("🗺️ Generando capa de frecuencia de inundación..."):
+                url_tiles = obtener_url_tiles_frecuencia(
+                    clave_aoi_mapa(datos['aoi'], datos.get('clave_geometria')), ano_inicio, ano_fin, datos['aoi']
+                )
+            mapa_riesgo = crear_mapa_riesgo_hidrico(
+                datos['aoi'], url_tiles, ano_inicio, ano_fin, datos.get('extension_aoi')
+            )
+        except Exception as e:
+            st.warning(f"⚠️ No se pudo generar la capa de frecuencia: {str(e)}")
+    
+    if mapa_riesgo:
         st.markdown("### 🗺️ Mapa de Riesgo Hídrico")
-        st.write("Visualización de eventos de inundación en el área analizada:")
+        st.write(f"Frecuencia de inundación por píxel entre {ano_inicio} y {ano_fin}:")
         
         # Mostrar el mapa MÁS GRANDE
-        map_data = st_folium(resultado_inundacion['mapa_riesgo'], width=None, height=700, key="mapa_riesgo_hidrico")
+        map_data = st_folium(mapa_riesgo, width=None, height=700, key="mapa_riesgo_hidrico")
         
         # Explicación del mapa
         with st.expander("💡 Cómo interpretar el mapa"):
-    st.markdown("""
-            **🔴 Círculos rojos**: Eventos de alta severidad (>40% inundado)  
-            **🟠 Círculos naranjas**: Eventos de severidad media (20-40% inundado)  
-            **🟡 Círculos amarillos**: Eventos de baja severidad (<20% inundado)  
-            **📏 Tamaño del círculo**: Proporcional al porcentaje de área inundada  
-            **🔵 Polígono azul**: Área total analizada
+            st.markdown("""
+            **🟡 Tonos claros**: Píxeles inundados en pocos años del período  
+            **🔵 Tonos oscuros**: Píxeles inundados en la mayoría de los años (zonas de anegamiento recurrente)  
+            **⬜ Sin color**: Sin agua detectada en ningún año  
+            **🔵 Contorno azul**: Área total analizada  
+            **📅 Fuentes**: JRC GSW hasta 2019 y NDWI de Sentinel-2 desde 2020, igual que el análisis
             """)
     else:
-        st.warning("⚠️ **Mapa de riesgo no disponible** - No hay eventos significativos para visualizar")
+        st.warning("⚠️ **Mapa de riesgo no disponible** - No se pudo generar la capa de frecuencia")
     
     # RECOMENDACIONES
     st.markdown("### 💡 Recomendaciones")
@@ -3327,6 +4950,14 @@ def mostrar_resultados_inundacion():
             )
     
     with col2:
+        # El screening rápido no tiene peor año: informa la extensión máxima histórica de GSW
+        if resultado_inundacion.get('metodo_rapido'):
+            periodo = "1984-2020 (capas agregadas GSW)"
+            linea_maximo = f"Extensión Máxima Histórica: {resultado_inundacion['extension_maxima_historica']:.1f}%"
+        else:
+            periodo = config_analisis.get('anos_analisis', (2005, 2025))
+            linea_maximo = f"Riesgo Máximo: {resultado_inundacion['riesgo_maximo']:.1f}%"
+        
         # Crear resumen ejecutivo
         resumen = f"""
 ANÁLISIS DE RIESGO HÍDRICO
@@ -3334,11 +4965,11 @@ ANÁLISIS DE RIESGO HÍDRICO
 
 Área Analizada: {resultado_inundacion['area_total_ha']:,.1f} ha
 Años Analizados: {resultado_inundacion['años_analizados']}
-Período: {config_analisis.get('anos_analisis', (2005, 2025))}
+Período: {periodo}
 
 MÉTRICAS DE RIESGO:
 - Riesgo Promedio: {resultado_inundacion['riesgo_promedio']:.1f}%
-- Riesgo Máximo: {resultado_inundacion['riesgo_maximo']:.1f}%
+- {linea_maximo}
 - Categoría: {resultado_inundacion['categoria_riesgo']}
 - Probabilidad de Evento: {resultado_inundacion['probabilidad_evento']:.1f}%
 
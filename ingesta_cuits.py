@@ -0,0 +1,208 @@
+# ===================================================================
+# INGESTA MASIVA DE CUITs - Campos RENSPA de SENASA para listas de productores
+# Consulta concurrente acotada, reanudable y con estado por CUIT
+# ===================================================================
+#
+# Uso:
+#   python ingesta_cuits.py cuits.csv --salida campos.csv [--concurrencia 4]
+#
+# El CSV de entrada debe tener una columna "cuit" (o se usa la primera columna); también
+# se acepta una lista sin encabezado, un CUIT por línea.
+# --concurrencia fija cuántos CUITs están en curso a la vez; los pedidos HTTP de todos
+# ellos (listados y detalles) comparten el tope global VISU_SENASA_MAX_CONCURRENTES.
+# Cada CUIT terminado se agrega al archivo de estado (JSON por línea, por defecto
+# <salida>.estado.jsonl): si el proceso se corta, la próxima corrida con los mismos
+# argumentos saltea los CUITs ya terminados y reintenta los que fallaron o quedaron parciales. La tabla
+# consolidada de campos se regenera desde ese archivo al final de cada corrida.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from senasa_client import SENASA_MAX_CONCURRENTES, campos_cuit, metricas_senasa, normalizar_cuit, validate_cuit
+
+# Estados que no se vuelven a consultar al reanudar ('parcial' y 'error' se reintentan)
+ESTADOS_TERMINADOS = {'ok', 'sin_campos', 'invalido'}
+
+COLUMNAS_CAMPOS = [
+    'cuit', 'renspa', 'titular', 'localidad', 'superficie', 'fecha_baja', 'activo', 'tiene_poligono', 'coords'
+]
+
+def leer_cuits(ruta, columna=None):
+    """
+    CUITs del CSV en el orden original, sin repetir. Devuelve [(cuit tal cual, cuit normalizado o None)].
+    Si la primera fila ya trae un CUIT válido el archivo no tiene encabezado: se usa la primera
+    columna (o la de índice `columna`) y esa fila cuenta como dato.
+    """
+    df = pd.read_csv(ruta, dtype=str, header=None).fillna('')
+    if any(validate_cuit(valor) for valor in df.iloc[0]):
+        columna = int(columna) if columna is not None else 0
+    else:
+        df = df.iloc[1:].set_axis([str(c).strip() for c in df.iloc[0]], axis=1)
+        if columna is None:
+            columna = next((c for c in df.columns if c.lower() == 'cuit'), df.columns[0])
+
+    cuits = []
+    vistos = set()
+    for valor in df[columna]:
+        valor = valor.strip()
+        normalizado = normalizar_cuit(valor) if validate_cuit(valor) else None
+        clave = normalizado or valor
+        if valor and clave not in vistos:
+            vistos.add(clave)
+            cuits.append((valor, normalizado))
+    return cuits
+
+def leer_estado(ruta_estado):
+    """Último registro de cada CUIT en el archivo de estado (las líneas truncadas por un corte se ignoran)"""
+    estado = {}
+    if not os.path.exists(ruta_estado):
+        return estado
+
+    with open(ruta_estado, encoding='utf-8') as archivo:
+        for linea in archivo:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            estado[registro['cuit']] = registro
+    return estado
+
+def registrar_estado(archivo_estado, registro):
+    """Agrega un registro al archivo de estado y lo baja a disco antes de seguir"""
+    archivo_estado.write(json.dumps(registro, ensure_ascii=False) + '\n')
+    archivo_estado.flush()
+    os.fsync(archivo_estado.fileno())
+
+def ingerir_cuit(cuit, incluir_bajas=False, forzar_actualizacion=False):
+    """Consulta un CUIT normalizado y devuelve su registro de estado con las filas de campos"""
+    inicio = time.perf_counter()
+    try:
+        registros, completo = campos_cuit(cuit, solo_activos=not incluir_bajas, forzar_actualizacion=forzar_actualizacion)
+    except Exception as e:
+        return {'cuit': cuit, 'estado': 'error', 'error': str(e), 'campos': [],
+                'segundos': round(time.perf_counter() - inicio, 2)}
+
+    campos = [
+        {
+            'cuit': cuit,
+            'renspa': renspa,
+            'titular': registro['item'].get('titular', ''),
+            'localidad': registro['item'].get('localidad', ''),
+            'superficie': registro['item'].get('superficie', 0),
+            'fecha_baja': registro['item'].get('fecha_baja'),
+            'activo': registro['item'].get('fecha_baja') is None,
+            'tiene_poligono': bool(registro['coords']),
+            'coords': json.dumps(registro['coords']) if registro['coords'] else ''
+        }
+        for renspa, registro in registros.items()
+    ]
+
+    if not completo:
+        estado = 'parcial'
+    else:
+        estado = 'ok' if campos else 'sin_campos'
+
+    return {
+        'cuit': cuit,
+        'estado': estado,
+        'campos': campos,
+        'segundos': round(time.perf_counter() - inicio, 2)
+    }
+
+def escribir_tabla(estado, ruta_salida):
+    """Tabla consolidada de campos de todos los CUITs terminados, escrita de forma atómica"""
+    filas = [campo for registro in estado.values() for campo in registro.get('campos', [])]
+    temporal = f"{ruta_salida}.tmp"
+    pd.DataFrame(filas, columns=COLUMNAS_CAMPOS).to_csv(temporal, index=False)
+    os.replace(temporal, ruta_salida)
+    return len(filas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta masiva de campos RENSPA de SENASA a partir de un CSV de CUITs")
+    parser.add_argument('entrada', help="CSV con los CUITs (columna 'cuit' o la primera)")
+    parser.add_argument('--salida', default='campos_cuits.csv', help="Tabla consolidada de campos (default: campos_cuits.csv)")
+    parser.add_argument('--estado', help="Archivo de estado para reanudar (default: <salida>.estado.jsonl)")
+    parser.add_argument('--columna', help="Columna del CSV con los CUITs (nombre, o índice si no hay encabezado)")
+    parser.add_argument(
+        '--concurrencia', type=int, default=4,
+        help="CUITs en curso a la vez (default: 4); los pedidos a SENASA no superan VISU_SENASA_MAX_CONCURRENTES en total"
+    )
+    parser.add_argument('--incluir-bajas', action='store_true', help="Incluir campos dados de baja")
+    parser.add_argument('--forzar', action='store_true', help="Ignorar el almacén local y consultar todo a SENASA")
+    args = parser.parse_args()
+
+    ruta_estado = args.estado or f"{args.salida}.estado.jsonl"
+    cuits = leer_cuits(args.entrada, args.columna)
+    estado = leer_estado(ruta_estado)
+
+    pendientes = [
+        (original, normalizado) for original, normalizado in cuits
+        if estado.get(normalizado or original, {}).get('estado') not in ESTADOS_TERMINADOS
+    ]
+    print(f"📋 {len(cuits)} CUITs en {args.entrada} - {len(cuits) - len(pendientes)} ya terminados, "
+          f"{len(pendientes)} pendientes")
+    print(f"🔀 {max(args.concurrencia, 1)} CUITs a la vez, hasta {SENASA_MAX_CONCURRENTES} pedidos simultáneos a SENASA")
+
+    inicio = time.perf_counter()
+    procesados = 0
+
+    with open(ruta_estado, 'a', encoding='utf-8') as archivo_estado:
+        # Los CUITs inválidos se registran sin consultar a SENASA
+        for original, normalizado in pendientes:
+            if normalizado is None:
+                registro = {'cuit': original, 'estado': 'invalido', 'error': "Debe tener 11 dígitos", 'campos': []}
+                registrar_estado(archivo_estado, registro)
+                estado[original] = registro
+                print(f"  ⚠️ {original}: inválido")
+
+        validos = [normalizado for _, normalizado in pendientes if normalizado]
+        executor = ThreadPoolExecutor(max_workers=max(args.concurrencia, 1), thread_name_prefix='visu-ingesta')
+        try:
+            futuros = {
+                executor.submit(ingerir_cuit, cuit, args.incluir_bajas, args.forzar): cuit
+                for cuit in validos
+            }
+            for futuro in as_completed(futuros):
+                registro = futuro.result()
+                registrar_estado(archivo_estado, registro)
+                estado[registro['cuit']] = registro
+                procesados += 1
+
+                minutos = (time.perf_counter() - inicio) / 60
+                icono = {'ok': '✅', 'sin_campos': '⚪', 'parcial': '🟡'}.get(registro['estado'], '❌')
+                detalle = registro.get('error') or f"{len(registro['campos'])} campos"
+                print(f"  [{procesados}/{len(validos)}] {icono} {registro['cuit']}: {detalle} "
+                      f"({registro['segundos']:.1f} s) - {procesados / minutos:.1f} CUITs/min")
+        except KeyboardInterrupt:
+            print("\n⏹️ Interrumpido: se conserva lo terminado, la próxima corrida continúa desde acá")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    total_campos = escribir_tabla(estado, args.salida)
+
+    minutos = (time.perf_counter() - inicio) / 60
+    conteo = pd.Series([registro['estado'] for registro in estado.values()]).value_counts()
+    print("\n📊 Estados: " + ", ".join(f"{nombre} {cantidad}" for nombre, cantidad in conteo.items()))
+    if procesados:
+        print(f"⏱️ {procesados} CUITs en {minutos * 60:.1f} s - {procesados / minutos:.1f} CUITs/min")
+    print(f"💾 {total_campos} campos en {args.salida}")
+
+    metricas = metricas_senasa()
+    if metricas['pedidos']:
+        errores = ", ".join(f"{tipo} {cantidad}" for tipo, cantidad in metricas['errores'].items()) or "ninguno"
+        print(f"🌐 SENASA: {metricas['pedidos']} pedidos, {metricas['exitos']} exitosos, "
+              f"{metricas['reintentos']} reintentos, {metricas['rechazos_circuito']} rechazados por el circuito")
+        print(f"   Latencia media {metricas['latencia_media']:.2f} s - p95 {metricas['latencia_p95']:.2f} s - "
+              f"máx {metricas['latencia_max']:.2f} s - errores: {errores}")
+
+    if any(registro['estado'] in ('error', 'parcial') for registro in estado.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+# ===================================================================
+# CLIENTE SENASA - Consulta de campos (RENSPA) por CUIT
+# Sesión HTTP con pool keep-alive, limitador de tasa token bucket y
+# consultas de detalle concurrentes. Sin dependencias de Streamlit.
+# ===================================================================
+#
+# La URL base se puede apuntar a un servidor local de prueba con
+# VISU_SENASA_URL o con el parámetro base_url de cada función.
+
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+API_BASE_URL = os.environ.get('VISU_SENASA_URL', "https://aps.senasa.gob.ar/restapiprod/servicios/renspa")
+
+# Pedidos por segundo sostenidos y ráfaga máxima hacia SENASA (token bucket compartido)
+SENASA_PEDIDOS_POR_SEGUNDO = float(os.environ.get('VISU_SENASA_PEDIDOS_POR_SEGUNDO', 5))
+SENASA_RAFAGA = int(os.environ.get('VISU_SENASA_RAFAGA', 5))
+
+# Pedidos simultáneos a SENASA en todo el proceso (y conexiones keep-alive del pool)
+SENASA_MAX_CONCURRENTES = int(os.environ.get('VISU_SENASA_MAX_CONCURRENTES', 4))
+
+# Hosts distintos con pool propio en la sesión (SENASA y, en pruebas, el servidor local)
+SENASA_POOL_HOSTS = int(os.environ.get('VISU_SENASA_POOL_HOSTS', 4))
+
+# Items por página de consultaPorCuit; el offset avanza con lo que devuelve el servidor,
+# así funciona aunque SENASA recorte la página a su propio máximo
+SENASA_TAMANO_PAGINA = int(os.environ.get('VISU_SENASA_TAMANO_PAGINA', 100))
+
+TIMEOUT_PAGINA = 15
+TIMEOUT_DETALLE = 10
+
+# Reintentos de errores transitorios (conexión, timeout, 429 y 5xx) con backoff exponencial
+# y jitter; Retry-After, si viene, manda (acotado a SENASA_BACKOFF_MAX)
+SENASA_REINTENTOS = int(os.environ.get('VISU_SENASA_REINTENTOS', 4))
+SENASA_BACKOFF_BASE = 0.5
+SENASA_BACKOFF_MAX = 30
+
+# Circuito: tras SENASA_CIRCUITO_FALLOS fallos seguidos se rechazan los pedidos sin salir a
+# la red durante SENASA_CIRCUITO_PAUSA segundos; después se deja pasar uno de prueba
+SENASA_CIRCUITO_FALLOS = int(os.environ.get('VISU_SENASA_CIRCUITO_FALLOS', 5))
+SENASA_CIRCUITO_PAUSA = float(os.environ.get('VISU_SENASA_CIRCUITO_PAUSA', 30))
+
+# Almacén local de RENSPA (mismo directorio que el caché de resultados) y horas que un
+# CUIT consultado se sirve sin volver a SENASA
+STORE_DIR = os.path.expanduser(os.environ.get('VISU_CACHE_DIR', os.path.join('~', '.cache', 'visu')))
+SENASA_TTL_HORAS = float(os.environ.get('VISU_SENASA_TTL_HORAS', 24))
+
+def validate_cuit(cuit):
+    """Validar formato de CUIT argentino - ACEPTA MÚLTIPLES FORMATOS"""
+    if not cuit:
+        return False
+
+    # Limpiar el CUIT: quitar espacios, guiones y caracteres especiales
+    cuit_limpio = cuit.replace('-', '').replace(' ', '').replace('.', '').strip()
+
+    # Exactamente 11 dígitos
+    return len(cuit_limpio) == 11 and cuit_limpio.isdigit()
+
+def normalizar_cuit(cuit):
+    """Normaliza un CUIT a formato XX-XXXXXXXX-X desde cualquier formato"""
+    # Limpiar el CUIT: quitar espacios, guiones y caracteres especiales
+    cuit_limpio = cuit.replace("-", "").replace(" ", "").replace(".", "").strip()
+
+    if len(cuit_limpio) != 11:
+        raise ValueError(f"CUIT inválido: {cuit}. Debe tener 11 dígitos.")
+
+    return f"{cuit_limpio[:2]}-{cuit_limpio[2:10]}-{cuit_limpio[10]}"
+
+def crear_limitador(tasa, rafaga):
+    """
+    Limitador token bucket: devuelve una función que bloquea hasta que haya un token.
+    Los tokens se reponen a `tasa` por segundo hasta un máximo de `rafaga`.
+    Es seguro entre hilos: todos los pedidos comparten el mismo balde.
+    """
+    estado = {'tokens': float(rafaga), 'ultimo': time.monotonic()}
+    lock = threading.Lock()
+
+    def esperar_turno():
+        while True:
+            with lock:
+                ahora = time.monotonic()
+                estado['tokens'] = min(rafaga, estado['tokens'] + (ahora - estado['ultimo']) * tasa)
+                estado['ultimo'] = ahora
+
+                if estado['tokens'] >= 1:
+                    estado['tokens'] -= 1
+                    return
+                espera = (1 - estado['tokens']) / tasa
+            time.sleep(espera)
+
+    return esperar_turno
+
+esperar_turno = crear_limitador(SENASA_PEDIDOS_POR_SEGUNDO, SENASA_RAFAGA)
+
+# Pedidos en vuelo hacia SENASA en todo el proceso (listados y detalles, de cualquier hilo):
+# coincide con las conexiones del pool, así ninguna se descarta por falta de lugar
+_cupos_senasa = threading.BoundedSemaphore(max(SENASA_MAX_CONCURRENTES, 1))
+
+# Hilos de las consultas de detalle, compartidos por todas las llamadas (ver consultar_detalles)
+_executor_detalles = ThreadPoolExecutor(max_workers=max(SENASA_MAX_CONCURRENTES, 1), thread_name_prefix='visu-senasa')
+
+_sesion = None
+_sesion_lock = threading.Lock()
+
+def obtener_sesion():
+    """Sesión HTTP compartida con pool de conexiones keep-alive (se crea una sola vez)"""
+    global _sesion
+    with _sesion_lock:
+        if _sesion is None:
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=max(SENASA_POOL_HOSTS, 1), pool_maxsize=max(SENASA_MAX_CONCURRENTES, 1))
+            sesion.mount('https://', adaptador)
+            sesion.mount('http://', adaptador)
+            _sesion = sesion
+        return _sesion
+
+# Contadores de pedidos compartidos por todos los hilos (ver metricas_senasa)
+_metricas = {'pedidos': 0, 'exitos': 0, 'reintentos': 0, 'rechazos_circuito': 0, 'errores': Counter()}
+_latencias = deque(maxlen=1000)
+_circuito = {'fallos_seguidos': 0, 'abierto_hasta': 0.0, 'probando': False}
+_metricas_lock = threading.Lock()
+
+def registrar_pedido(latencia, error=None, falla_senasa=True):
+    """
+    Suma un pedido a los contadores y actualiza el circuito (error = tipo, o None si salió bien).
+    Con falla_senasa=False el error se cuenta pero no toca el circuito: SENASA respondió y el
+    problema es el pedido (4xx), así que ni suma a la racha de fallos ni la reinicia.
+    """
+    with _metricas_lock:
+        _metricas['pedidos'] += 1
+        _latencias.append(latencia)
+        _circuito['probando'] = False
+        if error is not None and not falla_senasa:
+            _metricas['errores'][error] += 1
+        elif error is None:
+            _metricas['exitos'] += 1
+            _circuito['fallos_seguidos'] = 0
+            _circuito['abierto_hasta'] = 0.0
+        else:
+            _metricas['errores'][error] += 1
+            _circuito['fallos_seguidos'] += 1
+            if _circuito['fallos_seguidos'] >= SENASA_CIRCUITO_FALLOS:
+                _circuito['abierto_hasta'] = time.monotonic() + SENASA_CIRCUITO_PAUSA
+
+def verificar_circuito():
+    """
+    Lanza ConnectionError sin salir a la red si el circuito está abierto. Vencida la pausa
+    (semiabierto) deja pasar un único pedido de prueba: los demás se rechazan hasta que
+    ese pedido se registre y cierre el circuito o lo vuelva a abrir.
+    """
+    with _metricas_lock:
+        if not _circuito['abierto_hasta']:
+            return
+        restante = _circuito['abierto_hasta'] - time.monotonic()
+        if restante <= 0 and not _circuito['probando']:
+            _circuito['probando'] = True
+            return
+        _metricas['rechazos_circuito'] += 1
+    if restante > 0:
+        raise ConnectionError(f"SENASA no responde: pedidos suspendidos por {restante:.0f} s")
+    raise ConnectionError("SENASA no responde: pedido de prueba en curso")
+
+def metricas_senasa():
+    """Copia de los contadores: pedidos, éxitos, reintentos, errores por tipo, rechazos y latencias (s)"""
+    with _metricas_lock:
+        latencias = sorted(_latencias)
+        metricas = dict(_metricas, errores=dict(_metricas['errores']))
+        metricas['circuito_abierto'] = _circuito['abierto_hasta'] > time.monotonic()
+
+    if latencias:
+        metricas['latencia_media'] = sum(latencias) / len(latencias)
+        metricas['latencia_p95'] = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+        metricas['latencia_max'] = latencias[-1]
+    return metricas
+
+def espera_reintento(intento, response=None):
+    """Segundos antes del próximo intento: Retry-After (segundos o fecha HTTP) o backoff exponencial con jitter"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            espera = float(retry_after)
+        except ValueError:
+            try:
+                espera = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                espera = None
+        if espera is not None:
+            return min(max(espera, 0), SENASA_BACKOFF_MAX)
+
+    # Full jitter: uniforme entre 0 y el tope exponencial del intento
+    return random.uniform(0, min(SENASA_BACKOFF_MAX, SENASA_BACKOFF_BASE * 2 ** intento))
+
+def pedir_json(url, params=None, timeout=TIMEOUT_DETALLE):
+    """
+    GET limitado por el token bucket sobre la sesión compartida. Los errores transitorios
+    (conexión, timeout, 429, 5xx) se reintentan hasta SENASA_REINTENTOS veces; los demás 4xx
+    no. Devuelve el JSON o lanza la última excepción (ConnectionError si el circuito está abierto).
+    """
+    for intento in range(SENASA_REINTENTOS + 1):
+        verificar_circuito()
+        esperar_turno()
+        # Solo cuenta como reintento el que efectivamente sale a la red
+        if intento:
+            with _metricas_lock:
+                _metricas['reintentos'] += 1
+
+        inicio = time.monotonic()
+        response = None
+        try:
+            with _cupos_senasa:
+                response = obtener_sesion().get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error, tipo = e, type(e).__name__
+        except Exception:
+            # Error del pedido en sí (URL inválida, etc.): no se reintenta ni cuenta como fallo
+            # de SENASA, pero libera el lugar de la prueba para no dejar el circuito trabado
+            with _metricas_lock:
+                _circuito['probando'] = False
+            raise
+        else:
+            if response.status_code == 429 or response.status_code >= 500:
+                error, tipo = requests.HTTPError(f"{response.status_code} en {url}", response=response), f"HTTP {response.status_code}"
+            else:
+                try:
+                    response.raise_for_status()
+                    datos = response.json()
+                except ValueError:
+                    # Respuesta cortada o HTML de error con 200: transitorio
+                    error, tipo = ValueError(f"Respuesta no JSON de {url}"), 'JSON inválido'
+                except requests.HTTPError as e:
+                    # 4xx: SENASA responde, el pedido es el problema; no se reintenta ni abre el circuito
+                    registrar_pedido(time.monotonic() - inicio, 'HTTP 4xx', falla_senasa=False)
+                    raise e
+                else:
+                    registrar_pedido(time.monotonic() - inicio)
+                    return datos
+
+        registrar_pedido(time.monotonic() - inicio, tipo)
+        if intento == SENASA_REINTENTOS:
+            raise error
+
+        time.sleep(espera_reintento(intento, response))
+
+def obtener_datos_por_cuit(cuit, base_url=None):
+    """
+    Obtiene todos los campos (items de RENSPA) asociados a un CUIT normalizado, recorriendo
+    las páginas. Devuelve (campos, completo): si una página falla tras los reintentos se
+    devuelven las páginas ya leídas con completo=False.
+    """
+    url = f"{base_url or API_BASE_URL}/consultaPorCuit"
+
+    todos_campos = []
+    offset = 0
+    has_more = True
+
+    while has_more:
+        try:
+            resultado = pedir_json(
+                url, params={'cuit': cuit, 'offset': offset, 'limit': SENASA_TAMANO_PAGINA}, timeout=TIMEOUT_PAGINA
+            )
+        except Exception:
+            return todos_campos, False
+
+        items = resultado.get('items') or []
+        todos_campos.extend(items)
+        offset += len(items)
+        has_more = bool(items) and resultado.get('hasMore', False)
+
+    return todos_campos, True
+
+def consultar_campo_detalle(renspa, base_url=None):
+    """Consulta los detalles de un campo específico para obtener el polígono (lanza la excepción si falla)"""
+    return pedir_json(f"{base_url or API_BASE_URL}/consultaPorNumero", params={'numero': renspa})
+
+def poligono_de_detalle(resultado_detalle):
+    """String de polígono del primer item de una consulta de detalle, o None"""
+    if resultado_detalle and resultado_detalle.get('items'):
+        return resultado_detalle['items'][0].get('poligono') or None
+    return None
+
+def consultar_detalles(renspas, base_url=None):
+    """
+    Consulta en paralelo el detalle de varios RENSPA, respetando el limitador de tasa. Los
+    hilos son los de un pool compartido por todas las llamadas: varias llamadas simultáneas
+    (por ejemplo, los CUITs en curso de la ingesta) no suman más de SENASA_MAX_CONCURRENTES.
+    Devuelve ({renspa: string de polígono o None}, [RENSPA cuya consulta falló]).
+    """
+    renspas = list(dict.fromkeys(renspas))
+    if not renspas:
+        return {}, []
+
+    def consultar(renspa):
+        try:
+            return poligono_de_detalle(consultar_campo_detalle(renspa, base_url)), False
+        except Exception:
+            return None, True
+
+    resultados = dict(zip(renspas, _executor_detalles.map(consultar, renspas)))
+
+    detalles = {renspa: poligono for renspa, (poligono, fallo) in resultados.items() if not fallo}
+    return detalles, [renspa for renspa, (_, fallo) in resultados.items() if fallo]
+
+# Vértice de SENASA "(lat,lon)" y su esqueleto sin números, para validar el string de una pasada
+PATRON_VERTICE_SENASA = re.compile(r'\(([-\d\.]+),([-\d\.]+)\)')
+SIN_NUMEROS = str.maketrans('', '', '0123456789.-')
+SEPARADORES_A_ESPACIOS = str.maketrans('(),', '   ')
+
+# np.fromstring con sep avisa (NumPy < 2.3) o lanza ValueError (NumPy >= 2.3) ante un número mal
+# formado; el aviso se silencia porque el tamaño del resultado ya delata la lectura incompleta
+warnings.filterwarnings(
+    'ignore', message='string or file could not be read to its end', category=DeprecationWarning, module=__name__
+)
+
+def numeros_senasa(texto, n_vertices):
+    """
+    Los 2·n_vertices números de un texto de vértices SENASA como array (n_vertices, 2) de
+    [lon, lat] sin pasar por str.split ni por una lista de strings, o None si alguno está
+    mal formado
+    """
+    try:
+        valores = np.fromstring(texto.translate(SEPARADORES_A_ESPACIOS), sep=' ')
+    except ValueError:
+        return None
+    if valores.size != 2 * n_vertices:
+        return None
+    return valores.reshape(n_vertices, 2)[:, ::-1]
+
+def cerrar_anillo(coords):
+    """Array (N, 2) cerrado (último vértice = primero), o None si tiene menos de 3 vértices"""
+    if len(coords) < 3:
+        return None
+    if coords[0, 0] != coords[-1, 0] or coords[0, 1] != coords[-1, 1]:
+        coords = np.concatenate([coords, coords[:1]])
+    return coords
+
+def coordenadas_senasa_vertices(poligono_str):
+    """Camino lento: vértice por vértice con la regex, salteando los que no son números válidos"""
+    coords = []
+    for lat_str, lon_str in PATRON_VERTICE_SENASA.findall(poligono_str):
+        try:
+            coords.append([float(lon_str), float(lat_str)])
+        except ValueError:
+            continue
+    return np.array(coords, dtype=float).reshape(-1, 2)
+
+def coordenadas_senasa_array(poligono_str):
+    """
+    Convierte un polígono de SENASA "(lat,lon)(lat,lon)…" en un array (N, 2) de [lon, lat]
+    cerrado, o None si tiene menos de 3 vértices válidos. Si el string es exactamente una
+    secuencia de vértices se convierte de una vez con NumPy; si no, se recorre vértice por
+    vértice salteando los inválidos (mismas reglas que la versión original).
+    """
+    if not poligono_str or not isinstance(poligono_str, str):
+        return None
+
+    n_vertices = poligono_str.count('(')
+    coords = None
+    if poligono_str.translate(SIN_NUMEROS) == '(,)' * n_vertices:
+        coords = numeros_senasa(poligono_str, n_vertices)
+    if coords is None:
+        coords = coordenadas_senasa_vertices(poligono_str)
+
+    return cerrar_anillo(coords)
+
+def coordenadas_senasa_lote(poligonos):
+    """
+    Versión por lote de coordenadas_senasa_array: los strings con formato estándar se
+    concatenan y se convierten en una sola llamada a NumPy, y el resultado se corta por
+    la cantidad de vértices de cada uno. Devuelve una lista alineada con `poligonos`.
+    """
+    resultados = [None] * len(poligonos)
+    estandar = []
+    for i, poligono_str in enumerate(poligonos):
+        if not poligono_str or not isinstance(poligono_str, str):
+            continue
+        n_vertices = poligono_str.count('(')
+        if poligono_str.translate(SIN_NUMEROS) == '(,)' * n_vertices:
+            estandar.append((i, n_vertices))
+        else:
+            resultados[i] = cerrar_anillo(coordenadas_senasa_vertices(poligono_str))
+
+    if estandar:
+        valores = numeros_senasa(' '.join(poligonos[i] for i, _ in estandar), sum(n for _, n in estandar))
+        if valores is None:
+            # Algún número mal formado ("1.2.3"): cada string por su cuenta
+            for i, _ in estandar:
+                resultados[i] = coordenadas_senasa_array(poligonos[i])
+        else:
+            cortes = np.cumsum([n for _, n in estandar])[:-1]
+            for (i, _), coords in zip(estandar, np.split(valores, cortes)):
+                resultados[i] = cerrar_anillo(coords)
+
+    return resultados
+
+def extraer_coordenadas_senasa(poligono_str):
+    """Extrae coordenadas [[lon, lat], ...] (anillo cerrado) de un string de polígono de SENASA"""
+    coords = coordenadas_senasa_array(poligono_str)
+    return coords.tolist() if coords is not None else None
+
+# =====================================================================
+# ALMACÉN LOCAL DE RENSPA
+# =====================================================================
+
+def conectar_store():
+    """Abre (y crea si hace falta) la base SQLite de CUITs y RENSPA consultados"""
+    os.makedirs(STORE_DIR, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(STORE_DIR, 'senasa.sqlite'), timeout=30)
+    conexion.executescript("""
+        CREATE TABLE IF NOT EXISTS cuits (
+            cuit TEXT PRIMARY KEY,
+            consultado REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS renspas (
+            cuit TEXT NOT NULL,
+            renspa TEXT NOT NULL,
+            orden INTEGER NOT NULL,
+            item TEXT NOT NULL,
+            fecha_baja TEXT,
+            coords TEXT,
+            consultado REAL NOT NULL,
+            PRIMARY KEY (cuit, renspa)
+        );
+        CREATE INDEX IF NOT EXISTS renspas_cuit ON renspas (cuit, orden);
+    """)
+    return conexion
+
+def leer_cuit_store(cuit):
+    """
+    Registros guardados de un CUIT: (hora de la última consulta o None, {renspa: registro}),
+    con registro = {'item': item del listado, 'coords': polígono o None, 'consultado': hora}
+    """
+    try:
+        with closing(conectar_store()) as conexion:
+            fila = conexion.execute("SELECT consultado FROM cuits WHERE cuit = ?", (cuit,)).fetchone()
+            registros = {
+                renspa: {'item': json.loads(item), 'coords': json.loads(coords) if coords else None, 'consultado': consultado}
+                for renspa, item, coords, consultado in conexion.execute(
+                    "SELECT renspa, item, coords, consultado FROM renspas WHERE cuit = ? ORDER BY orden", (cuit,)
+                )
+            }
+            return (fila[0] if fila else None), registros
+    except (sqlite3.Error, OSError, ValueError):
+        # El almacén nunca debe impedir la consulta
+        return None, {}
+
+def guardar_cuit_store(cuit, registros, completo=True, consultado=None):
+    """
+    Reemplaza los RENSPA de un CUIT por los del listado actual (en orden). Solo un resultado
+    completo marca la hora de consulta (consultado, o ahora si no se indica): uno parcial se
+    guarda pero vence de inmediato.
+    """
+    ahora = time.time()
+    try:
+        with closing(conectar_store()) as conexion, conexion:
+            conexion.execute("DELETE FROM renspas WHERE cuit = ?", (cuit,))
+            conexion.executemany(
+                "INSERT OR REPLACE INTO renspas (cuit, renspa, orden, item, fecha_baja, coords, consultado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (cuit, renspa, orden, json.dumps(registro['item']), registro['item'].get('fecha_baja'),
+                     json.dumps(registro['coords']) if registro['coords'] else None, registro.get('consultado', ahora))
+                    for orden, (renspa, registro) in enumerate(registros.items())
+                ]
+            )
+            conexion.execute(
+                "INSERT OR REPLACE INTO cuits (cuit, consultado) VALUES (?, ?)",
+                (cuit, (consultado or ahora) if completo else 0)
+            )
+    except (sqlite3.Error, OSError, TypeError, ValueError):
+        pass
+
+def campos_cuit(cuit, solo_activos=True, base_url=None, forzar_actualizacion=False, ttl_horas=None):
+    """
+    Campos de un CUIT normalizado como ({renspa: {'item', 'coords', 'consultado'}}, completo),
+    en el orden del listado de SENASA. Dentro del TTL se sirven del almacén local sin tocar
+    la red, salvo el detalle de los campos a usar que todavía no tienen polígono (por ejemplo
+    las bajas de un CUIT guardado con solo_activos). Al vencer se vuelve a pedir el listado
+    y el detalle solo de los RENSPA nuevos, de los que cambiaron de fecha_baja o de los que
+    todavía no tienen polígono.
+    completo es False si alguna página del listado o alguna consulta de detalle falló tras
+    los reintentos: lo leído se devuelve igual (completado con lo guardado) y el CUIT se
+    vuelve a consultar la próxima vez.
+    """
+    ttl_horas = SENASA_TTL_HORAS if ttl_horas is None else ttl_horas
+    consultado, guardados = leer_cuit_store(cuit)
+
+    vigente = consultado is not None and time.time() - consultado < ttl_horas * 3600
+    desde_store = vigente and not forzar_actualizacion
+    if desde_store:
+        registros, completo = guardados, True
+    else:
+        campos, completo = obtener_datos_por_cuit(cuit, base_url)
+
+        registros = {}
+        coords_listado = coordenadas_senasa_lote([campo.get('poligono') for campo in campos])
+        for campo, coords in zip(campos, coords_listado):
+            anterior = guardados.get(campo['renspa'])
+            sin_cambios = anterior and anterior['item'].get('fecha_baja') == campo.get('fecha_baja')
+            # Un polígono en el listado siempre gana; si no, se conserva el guardado
+            coords = coords.tolist() if coords is not None else None
+            if not coords and sin_cambios:
+                coords = anterior['coords']
+            registros[campo['renspa']] = {
+                'item': campo,
+                'coords': coords,
+                'consultado': anterior['consultado'] if sin_cambios and coords == anterior['coords'] else time.time()
+            }
+
+        # Listado cortado: los RENSPA guardados que no llegaron a leerse se conservan
+        if not completo:
+            for renspa, registro in guardados.items():
+                registros.setdefault(renspa, registro)
+
+    # Solo se consulta el detalle de los campos (a usar) sin polígono utilizable
+    sin_poligono = [
+        renspa for renspa, registro in registros.items()
+        if not registro['coords'] and not (solo_activos and registro['item'].get('fecha_baja') is not None)
+    ]
+    detalles, fallidos = consultar_detalles(sin_poligono, base_url)
+    for renspa, poligono in detalles.items():
+        registros[renspa]['coords'] = extraer_coordenadas_senasa(poligono)
+        registros[renspa]['consultado'] = time.time()
+    completo = completo and not fallidos
+
+    # Desde el almacén solo se reescribe si se pidió algún detalle, sin extender el TTL del listado
+    if registros and (not desde_store or sin_poligono):
+        guardar_cuit_store(cuit, registros, completo, consultado if desde_store else None)
+
+    if solo_activos:
+        registros = {renspa: r for renspa, r in registros.items() if r['item'].get('fecha_baja') is None}
+    return registros, completo
+
+def procesar_campos_cuit(cuit, solo_activos=True, base_url=None, forzar_actualizacion=False):
+    """
+    Campos de un CUIT normalizado con sus polígonos, listos para el análisis. Se leen del
+    almacén local mientras estén vigentes (ver campos_cuit); los campos sin polígono en el
+    listado se completan con consultas de detalle concurrentes.
+    Devuelve (poligonos_data, completo); completo=False indica que faltan campos o polígonos
+    porque SENASA no respondió.
+    """
+    registros, completo = campos_cuit(cuit, solo_activos, base_url, forzar_actualizacion)
+
+    poligonos_data = []
+    for i, (renspa, registro) in enumerate(registros.items()):
+        campo, coords = registro['item'], registro['coords']
+
+        if coords:
+            poligonos_data.append({
+                'nombre': f"Campo_{i+1}_{campo.get('titular', 'Sin_titular')}",
+                'coords': coords,
+                'numero': i + 1,
+                'archivo_origen': f'CUIT_{cuit}',
+                'kml_origen': f'Campo_{renspa}',
+                'titular': campo.get('titular', ''),
+                'localidad': campo.get('localidad', ''),
+                'superficie': campo.get('superficie', 0),
+                'renspa': renspa
+            })
+
+    return poligonos_data, completo
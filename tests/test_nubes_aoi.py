@@ -0,0 +1,41 @@
+# Fracción de nubes sobre el AOI (porcentaje_nubes_aoi). Corre contra Earth Engine:
+# requiere GOOGLE_APPLICATION_CREDENTIALS, si no se saltea.
+
+import os
+import sys
+
+import pytest
+
+ee = pytest.importorskip('ee')
+pytest.importorskip('streamlit')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codigo_original  # noqa: E402
+
+AOI = [[-60.0, -34.0], [-59.99, -34.0], [-59.99, -33.99], [-60.0, -33.99], [-60.0, -34.0]]
+
+# SCL 4 = vegetación, 9 = nube de alta probabilidad
+SCL_VEGETACION = 4
+SCL_NUBE = 9
+
+@pytest.fixture(scope='module')
+def geometry():
+    credenciales = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+    if not credenciales:
+        pytest.skip("Sin credenciales de Earth Engine")
+    ee.Initialize(ee.ServiceAccountCredentials(email=None, key_file=credenciales))
+    return ee.Geometry.Polygon([AOI])
+
+def escena_scl(valor):
+    return ee.Image.constant(valor).rename('SCL').toInt()
+
+def test_aoi_despejado_es_cero(geometry):
+    assert codigo_original.porcentaje_nubes_aoi(escena_scl(SCL_VEGETACION), geometry).getInfo() == 0
+
+def test_aoi_nublado_es_cien(geometry):
+    assert codigo_original.porcentaje_nubes_aoi(escena_scl(SCL_NUBE), geometry).getInfo() == 100
+
+def test_aoi_sin_pixeles_validos_cuenta_como_nublado(geometry):
+    escena = escena_scl(SCL_VEGETACION).updateMask(0)
+    assert codigo_original.porcentaje_nubes_aoi(escena, geometry).getInfo() == 100